@@ -1,18 +1,67 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session, Response
+import time
+
+# taken before the other imports, the startup metric includes loading them
+STARTED_AT = time.perf_counter()
+
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session, Response, g, has_request_context, stream_with_context
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 from tenacity import retry, retry_if_exception_type, wait_exponential, stop_after_attempt
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.engine import Engine
+from sqlalchemy import event, insert
+from sqlalchemy.dialects import postgresql, sqlite
+import sqlalchemy as sa
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from dotenv import load_dotenv
-from datetime import datetime
-from flasgger import Swagger
+from markupsafe import Markup
+from datetime import datetime, timedelta, date as dt_date
+from tracing import Tracer, load_exporter, TRACEPARENT_HEADER
+from resilience import LatencyTracker, Hedger, SingleFlight, CircuitSQLStorage
+from sessions import ServerSideSessionInterface, MemorySessionStore, SQLSessionStore
+from catalog import ExerciseCatalogCache
+from outbox import OutboxRelay
+from sharding import (ShardRouter, ShardMoving, UserDirectory, parse_shard_urls, shard_binds,
+                      sharded_session, copy_user_rows, delete_user_rows)
+from assets import AssetManifest
+from startup import LazySwagger, LazySQLAlchemy, time_to_healthy, free_port
+from probes import HealthChecks, GracefulDrain, warm_pool, check_database
+from prefetch import PrefetchCache, Prefetcher
+from charts import bar_chart, line_chart
+from fragments import FragmentCache
+from ratelimit import RateLimit, parse_rate_limits, MemoryBucketStore, SQLBucketStore, InFlightLimiter
+from werkzeug.serving import make_server
+from importer import iter_csv, iter_json, group_workouts, normalize_record, ImportRowError
 import pybreaker
+import threading
+import functools
+import tracemalloc
+import tempfile
+import shutil
+import click
 import requests
 import calendar
+import hashlib
+import hmac
 import bcrypt
-import time
+import json
+import sys
+import re
 import os
 
+def parse_buckets(value, default):
+    # "0.05,0.1,0.5" -> (0.05, 0.1, 0.5)
+    if not value:
+        return default
+    return tuple(sorted(float(b) for b in value.split(",") if b.strip()))
+
+
+# most requests are single-digit ms DB lookups, proxied stats calls can take
+# several seconds when tenacity retries kick in
+HTTP_LATENCY_BUCKETS = parse_buckets(
+    os.getenv("HTTP_LATENCY_BUCKETS"),
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 7.5, 10.0)
+)
+
 REQUEST_COUNT = Counter(
     "http_requests_total",
     "Total HTTP requests",
@@ -22,7 +71,8 @@ REQUEST_COUNT = Counter(
 REQUEST_LATENCY = Histogram(
     "http_request_duration_seconds",
     "HTTP request latency (seconds)",
-    ["service", "method", "endpoint"]
+    ["service", "method", "endpoint"],
+    buckets=HTTP_LATENCY_BUCKETS
 )
 
 IN_PROGRESS = Gauge(
@@ -31,13 +81,141 @@ IN_PROGRESS = Gauge(
     ["service"]
 )
 
+DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per HTTP request",
+    ["service", "method", "endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+
+DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in the database per HTTP request (seconds)",
+    ["service", "method", "endpoint"],
+    buckets=HTTP_LATENCY_BUCKETS
+)
+
+SLOW_QUERIES = Counter(
+    "db_slow_queries_total",
+    "SQL statements slower than SLOW_QUERY_THRESHOLD_MS",
+    ["service", "fingerprint"]
+)
+
+EXERCISE_CACHE_EVENTS = Counter(
+    "exercise_cache_events_total",
+    "Exercise catalog cache lookups and evictions",
+    ["service", "event"]
+)
+
+OUTBOX_PENDING = Gauge(
+    "outbox_pending_events",
+    "Outbox events not yet delivered to stats",
+    ["service"]
+)
+
+OUTBOX_LAG = Gauge(
+    "outbox_lag_seconds",
+    "Age of the oldest undelivered outbox event (seconds)",
+    ["service"]
+)
+
+OUTBOX_RELAYED = Counter(
+    "outbox_events_relayed_total",
+    "Outbox events delivered to stats",
+    ["service"]
+)
+
+OUTBOX_RELAY_FAILURES = Counter(
+    "outbox_relay_failures_total",
+    "Failed outbox relay cycles",
+    ["service"]
+)
+
+IMPORTED_WORKOUTS = Counter(
+    "imported_workouts_total",
+    "Workouts written by bulk imports",
+    ["service"]
+)
+
+IMPORT_REJECTED_ROWS = Counter(
+    "import_rejected_rows_total",
+    "Import rows skipped because they failed validation",
+    ["service"]
+)
+
+STATS_COALESCED = Counter(
+    "stats_coalesced_requests_total",
+    "Stats GETs answered by an identical call already in flight instead of a request of their own",
+    ["service", "path"]
+)
+
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total",
+    "Requests refused with 429 (reason: rate = token bucket empty, in_flight = per-user concurrency cap)",
+    ["service", "endpoint", "reason"]
+)
+
+PREFETCH_EVENTS = Counter(
+    "prefetch_events_total",
+    "Post-login prefetches (scheduled, skipped_*, done, failed) and prefetched value use (hit, miss)",
+    ["service", "event"]
+)
+
+CHART_CACHE_EVENTS = Counter(
+    "chart_cache_events_total",
+    "Stats page chart cache lookups (hit / miss) per chart",
+    ["service", "chart", "event"]
+)
+
+CALENDAR_CACHE_EVENTS = Counter(
+    "calendar_cache_events_total",
+    "Calendar month grid cache lookups (hit / miss)",
+    ["service", "event"]
+)
+
+APP_STARTUP = Gauge(
+    "app_startup_seconds",
+    "Seconds from process start to the end of module import (phase=import) / the first response (phase=first_response)",
+    ["service", "phase"]
+)
+
+SYNC_PUSHED = Counter(
+    "sync_pushed_workouts_total",
+    "Workouts pushed by sync clients (inserted, duplicate or rejected)",
+    ["service", "outcome"]
+)
+
 SERVICE_NAME = os.getenv("SERVICE_NAME", "core")
+PORT = int(os.getenv("PORT", "25590"))
+# FLASK_DEBUG=0 in the cluster: no reloader (which starts the app twice), no debugger
+DEBUG = os.getenv("FLASK_DEBUG", "1").lower() in ("1", "true", "yes")
+
+# TRACE_EXPORTER: none (default) | memory | file | module:ExporterClass
+tracer = Tracer(SERVICE_NAME, load_exporter(
+    os.getenv("TRACE_EXPORTER"), os.getenv("TRACE_FILE")))
+# spans carry every user's queries and ids: /traces needs
+# "Authorization: Bearer $TRACES_TOKEN" and is off without it
+TRACES_TOKEN = os.getenv("TRACES_TOKEN", "")
 
 
 STATS_SERVICE_URL = os.getenv("STATS_SERVICE_URL", "http://stats:5000")
 
-# 5 fails -> opens for 30s
-stats_breaker = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=30)
+# per-attempt timeout = p99 of recent stats latencies * factor, clamped to
+# [min, max]; all attempts of one call share the STATS_DEADLINE budget
+STATS_TIMEOUT_MIN = float(os.getenv("STATS_TIMEOUT_MIN", "0.25"))
+STATS_TIMEOUT_MAX = float(os.getenv("STATS_TIMEOUT_MAX", "2.5"))
+STATS_TIMEOUT_P99_FACTOR = float(os.getenv("STATS_TIMEOUT_P99_FACTOR", "2"))
+STATS_DEADLINE = float(os.getenv("STATS_DEADLINE", "4"))
+
+# hedging: second GET when the first is slower than the observed p95
+STATS_HEDGING = os.getenv("STATS_HEDGING", "false").lower() in ("1", "true", "yes")
+STATS_HEDGE_MAX_IN_FLIGHT = int(os.getenv("STATS_HEDGE_MAX_IN_FLIGHT", "4"))
+
+stats_latency = LatencyTracker()
+stats_hedger = Hedger(max_in_flight=STATS_HEDGE_MAX_IN_FLIGHT)
+# identical concurrent GETs (same path and params) share one upstream call
+stats_single_flight = SingleFlight(
+    on_coalesced=lambda key: STATS_COALESCED.labels(SERVICE_NAME, key[0]).inc())
 
 app = Flask(__name__)
 
@@ -49,22 +227,135 @@ swagger_template = {
         "version": "1.0.0"
     }
 }
-Swagger(app, template=swagger_template)
+# flasgger is only imported when /apidocs is first opened
+LazySwagger(app, template=swagger_template)
+
+# templates link static files through asset_url(): /assets/<name>.<hash>.<ext>,
+# cached by browsers for a year (immutable) and served gzipped from the .gz
+# files written by `flask build-assets`. With FLASK_DEBUG edits get a new
+# hash right away.
+assets = AssetManifest(app.static_folder, reload=DEBUG)
+assets.init_app(app)
+
+
+class TracedJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        with tracer.span("json.serialize"):
+            return super().response(*args, **kwargs)
+
+
+app.json = TracedJSONProvider(app)
 
 
 load_dotenv("key.env")
 app.secret_key = os.getenv('SECRET_KEY')
 
-db_url = os.getenv("DATABASE_URL", "sqlite:///workouts.db")
-if db_url.startswith("postgres://"):
-    db_url = db_url.replace("postgres://", "postgresql://", 1)
+def with_driver(url):
+    # explicit driver: SQLAlchemy 2.1 defaults postgresql:// to psycopg 3, requirements ship psycopg2
+    if url.startswith(("postgres://", "postgresql://")):
+        return "postgresql+psycopg2://" + url.split("://", 1)[1]
+    return url
+
+
+db_url = with_driver(os.getenv("DATABASE_URL", "sqlite:///workouts.db"))
 
 app.config["SQLALCHEMY_DATABASE_URI"] = db_url
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+
+def _db_engine():
+    with app.app_context():
+        return db.engine
+
+
+# SHARD_URLS="a=postgresql://...,b=postgresql://..." spreads the per-user
+# tables (SHARDED_TABLES) over several databases by user id; sessions, rate
+# limits, the breaker and user_directory stay on DATABASE_URL, which may also
+# be one of the shards. Both services need the same SHARD_* settings.
+# SHARD_ROUTING: hash (consistent-hash ring, SHARD_VNODES points per shard) |
+# directory (user_directory.shard, cached SHARD_DIRECTORY_TTL seconds, so
+# `flask move-user` can move users online). SHARD_ID_RANGE > 0 gives every
+# shard its own id range (Postgres, set by `flask init-shards`) so moved rows
+# keep their ids; new shards go at the end of SHARD_URLS. Unset: one database.
+SHARD_URLS = {name: with_driver(url)
+              for name, url in parse_shard_urls(os.getenv("SHARD_URLS")).items()}
+SHARD_DIRECTORY_TTL = float(os.getenv("SHARD_DIRECTORY_TTL", "5"))
+SHARDED_TABLES = ("user", "exercise", "workout", "outbox_event")
+
+app.config["SQLALCHEMY_BINDS"], SHARD_BIND_KEYS = shard_binds(SHARD_URLS, db_url)
+user_directory = UserDirectory(_db_engine)
+shard_router = ShardRouter(
+    SHARD_URLS, scheme=os.getenv("SHARD_ROUTING", "hash"), directory=user_directory,
+    cache_ttl=SHARD_DIRECTORY_TTL, vnodes=int(os.getenv("SHARD_VNODES", "64")),
+    id_range=int(os.getenv("SHARD_ID_RANGE", "0")))
+
+# the engine is created on first use, not at import
+db = LazySQLAlchemy(app, session_options={
+    "class_": sharded_session(shard_router, SHARDED_TABLES, SHARD_BIND_KEYS)})
+
+# Flask-Migrate loads alembic; only the `flask db` commands need it
+if os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+    from flask_migrate import Migrate
+    migrate = Migrate(app, db)
+
+
+def _shard_engine(name=None):
+    # the named (default: currently selected) shard's engine
+    name = name or shard_router.current()
+    with app.app_context():
+        return db.engines[SHARD_BIND_KEYS[name]] if name else db.engine
+
+
+# BREAKER_STORAGE=db keeps the breaker in the shared database so all workers
+# and replicas open / half-open together (default: per-process memory)
+if os.getenv("BREAKER_STORAGE", "memory") == "db":
+    breaker_storage = CircuitSQLStorage(
+        _db_engine, name="stats",
+        cache_ttl=float(os.getenv("BREAKER_CACHE_TTL", "1")))
+else:
+    breaker_storage = pybreaker.CircuitMemoryStorage(pybreaker.STATE_CLOSED)
+
+# 5 fails -> opens for 30s
+stats_breaker = pybreaker.CircuitBreaker(
+    fail_max=5, reset_timeout=30, state_storage=breaker_storage, name="stats")
+
+# SESSION_STORE: cookie (Flask default signed cookie) | memory | db
+SESSION_STORE = os.getenv("SESSION_STORE", "cookie")
+SESSION_LIFETIME = int(os.getenv("SESSION_LIFETIME", str(7 * 24 * 3600)))
+
+if SESSION_STORE == "db":
+    app.session_interface = ServerSideSessionInterface(
+        SQLSessionStore(_db_engine), lifetime=SESSION_LIFETIME)
+elif SESSION_STORE == "memory":
+    app.session_interface = ServerSideSessionInterface(
+        MemorySessionStore(max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "10000"))),
+        lifetime=SESSION_LIFETIME)
+
+# RATE_LIMIT_BACKEND: memory (default, per process) | db (rate_limit_bucket,
+# shared by all replicas) | off. Token bucket per user (or IP) and endpoint,
+# limits are RateLimit(tokens per second, burst, in-flight cap per user);
+# RATE_LIMITS="endpoint=rate:burst:in_flight,..." overrides them.
+# In-flight caps are counted per process.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMITS = parse_rate_limits(os.getenv("RATE_LIMITS"), {
+    # stats proxies: the stats page refetches these on every select focus
+    "getAllWorkoutsForUser": RateLimit(1, 10, in_flight=2),
+    "getAllExercises": RateLimit(2, 20, in_flight=4),
+    "stats_summary": RateLimit(2, 10, in_flight=2),
+    "personal_records": RateLimit(2, 10, in_flight=2),
+    "api_time": RateLimit(1, 10),
+    "import_workouts": RateLimit(0.1, 3, in_flight=1),
+    "sync": RateLimit(2, 20)
+})
+
+if RATE_LIMIT_BACKEND == "db":
+    rate_limit_store = SQLBucketStore(_db_engine)
+elif RATE_LIMIT_BACKEND == "memory":
+    rate_limit_store = MemoryBucketStore()
+else:
+    rate_limit_store = None
+in_flight_limiter = InFlightLimiter()
 
 
 class Workout(db.Model):
@@ -74,6 +365,10 @@ class Workout(db.Model):
     reps = db.Column(db.PickleType, nullable=False)
     extra_weight = db.Column(db.PickleType, nullable=True)
     is_bodyweight = db.Column(db.Boolean, nullable=False)
+    # set by offline/sync clients, identifies retries of the same workout
+    client_id = db.Column(db.String(64), nullable=True)
+    # user's sync_version when the row was written (see /sync)
+    version = db.Column(db.Integer, nullable=False)
     exercise_id = db.Column(
         db.Integer,
         db.ForeignKey('exercise.id', name='fk_workout_exercise_id'),
@@ -88,6 +383,16 @@ class Workout(db.Model):
     exercise = db.relationship('Exercise', backref='workout')
     user = db.relationship('User', backref='workout')
 
+    # hot access paths: by user, (user, date) and (user, exercise); on Postgres
+    # (user, date) also carries what the calendar's month version reads
+    __table_args__ = (
+        db.Index('ix_workout_user_id_date', 'user_id', 'date', postgresql_include=['version', 'id']),
+        db.Index('ix_workout_user_id_exercise_id', 'user_id', 'exercise_id'),
+        db.Index('ix_workout_user_id_version', 'user_id', 'version'),
+        # date is the partition key on Postgres, unique indexes must include it
+        db.UniqueConstraint('user_id', 'client_id', 'date', name='uix_workout_user_client'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -97,13 +402,15 @@ class Workout(db.Model):
             'extra_weight': self.extra_weight,
             'is_bodyweight': self.is_bodyweight,
             'exercise_id': self.exercise_id,
-            'user_id': self.user_id
+            'user_id': self.user_id,
+            'client_id': self.client_id
         }
 
 
 class Exercise(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
     user_id = db.Column(
         db.Integer,
         db.ForeignKey('user.id', name='fk_exercise_user_id'),
@@ -113,6 +420,8 @@ class Exercise(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('name', 'user_id', name='uix_name_user'),
+        # covers the catalog load on Postgres (index-only scan)
+        db.Index('ix_exercise_user_id_name', 'user_id', 'name', postgresql_include=['id']),
     )
 
     def to_dict(self):
@@ -127,12 +436,307 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     passwordHash = db.Column(db.String(255), nullable=False)
+    # bumped by every transaction that adds workouts/exercises for the user
+    sync_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+class CircuitBreakerState(db.Model):
+    __tablename__ = "circuit_breaker"
+    name = db.Column(db.String(50), primary_key=True)
+    state = db.Column(db.String(16), nullable=False)
+    fail_counter = db.Column(db.Integer, nullable=False, default=0)
+    success_counter = db.Column(db.Integer, nullable=False, default=0)
+    opened_at = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.Float, nullable=True)
+    updated_by = db.Column(db.String(255), nullable=True)
+
+
+class RateLimitBucket(db.Model):
+    __tablename__ = "rate_limit_bucket"
+    # "<user:id | ip:addr>:<endpoint>"
+    bucket_key = db.Column(db.String(128), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
+
+
+class UserSession(db.Model):
+    __tablename__ = "user_session"
+    sid = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.Float, nullable=False, index=True)
+
+
+class OutboxEvent(db.Model):
+    __tablename__ = "outbox_event"
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+    published_at = db.Column(db.Float, nullable=True)
+
+    # the relay only ever scans undelivered events
+    __table_args__ = (
+        db.Index('ix_outbox_event_pending', 'id',
+                 postgresql_where=db.text('published_at IS NULL'),
+                 sqlite_where=db.text('published_at IS NULL')),
+    )
+
+
+class UserDirectoryEntry(db.Model):
+    # on DATABASE_URL: which shard holds each user (SHARD_URLS), see sharding.py
+    __tablename__ = "user_directory"
+    user_id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(50), unique=True, nullable=False)
+    shard = db.Column(db.String(50), nullable=True)
+    # set while `flask move-user` copies the user's rows; requests get 503
+    moving = db.Column(db.Boolean, nullable=False, default=False)
 
 
 class UpstreamError(Exception):
     pass
 
 
+def _load_exercises(userid):
+    # only the to_dict() columns, all in ix_exercise_user_id_name
+    return [{"id": id, "name": name, "user_id": user_id} for id, name, user_id in
+            db.session.query(Exercise.id, Exercise.name, Exercise.user_id).filter_by(user_id=userid)]
+
+
+exercise_catalog = ExerciseCatalogCache(
+    _load_exercises,
+    max_users=int(os.getenv("EXERCISE_CACHE_MAX_USERS", "1000")),
+    ttl=float(os.getenv("EXERCISE_CACHE_TTL", "300")),
+    on_event=lambda event: EXERCISE_CACHE_EVENTS.labels(SERVICE_NAME, event).inc()
+)
+
+
+# probes: /health/live (process serves), /health/startup (warm-up done),
+# /health/ready (warmed up, DB reachable, not draining); the readiness checks
+# run at most every READINESS_CACHE_TTL seconds. On SIGTERM new requests get
+# 503 while in-flight ones get up to DRAIN_TIMEOUT seconds to finish.
+READINESS_CACHE_TTL = float(os.getenv("READINESS_CACHE_TTL", "2"))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "25"))
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "2"))
+PROBE_PATHS = ("/health/live", "/health/ready", "/health/startup", "/metrics")
+
+drain = GracefulDrain(app.wsgi_app, timeout=DRAIN_TIMEOUT, exempt=PROBE_PATHS)
+app.wsgi_app = drain
+health_checks = HealthChecks(cache_ttl=READINESS_CACHE_TTL, drain=drain)
+health_checks.add_check("database", lambda: check_database(_db_engine()))
+# shards other than DATABASE_URL; a user on a shard that is down can't do anything
+for _shard in shard_router.names:
+    if SHARD_BIND_KEYS[_shard] is not None:
+        health_checks.add_check(f"shard_{_shard}",
+                                functools.partial(lambda name: check_database(_shard_engine(name)), _shard))
+
+
+def _check_stats_breaker():
+    state = stats_breaker.current_state
+    if state == pybreaker.STATE_OPEN:
+        raise RuntimeError("stats breaker is open, stats pages serve fallbacks")
+    return {"state": state}
+
+
+# not critical: core answers with fallbacks while stats is down, and taking
+# every core pod out of the Service would turn a stats outage into a full one
+health_checks.add_check("stats_breaker", _check_stats_breaker, critical=False)
+
+
+def warm_db_pool():
+    warm_pool(_db_engine(), DB_POOL_WARM)
+    for name in shard_router.names:
+        if SHARD_BIND_KEYS[name] is not None:
+            warm_pool(_shard_engine(name), DB_POOL_WARM)
+
+
+def warm_templates():
+    # compile the page templates now rather than on each page's first request
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+def warm_assets():
+    # hash the static files once before the first page links them
+    for name in assets.files():
+        assets.url(name)
+
+
+def warm_breaker_state():
+    # with BREAKER_STORAGE=db this reads the shared state into the local cache
+    return stats_breaker.current_state
+
+
+def start_warm_up():
+    health_checks.warm_up(warm_db_pool, warm_templates, warm_assets, warm_breaker_state)
+
+
+# after login: load the user's exercise catalog, this month's calendar days
+# and stats summary on PREFETCH_WORKERS background threads (0 = off) while
+# the browser follows the redirect. Skipped while more than
+# PREFETCH_MAX_IN_FLIGHT requests are being served.
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+PREFETCH_MAX_IN_FLIGHT = int(os.getenv("PREFETCH_MAX_IN_FLIGHT", "16"))
+
+prefetch_cache = PrefetchCache(
+    max_entries=int(os.getenv("PREFETCH_MAX_ENTRIES", "5000")),
+    ttl=float(os.getenv("PREFETCH_TTL", "60"))
+)
+prefetcher = Prefetcher(
+    max_workers=max(PREFETCH_WORKERS, 1),
+    max_pending=int(os.getenv("PREFETCH_MAX_PENDING", "50")),
+    busy=lambda: drain.in_flight > PREFETCH_MAX_IN_FLIGHT,
+    context=app.app_context,
+    on_event=lambda event: PREFETCH_EVENTS.labels(SERVICE_NAME, event).inc()
+)
+
+
+# the tasks run on the prefetcher's threads, outside the request's shard
+@shard_router.on_user_shard
+def prefetch_exercises(userid):
+    exercise_catalog.all(userid)
+
+
+@shard_router.on_user_shard
+def prefetch_calendar_grid(userid):
+    today = dt_date.today()
+    # the grid's links are built with url_for, which needs a request; the
+    # app is served at /, so the paths match a real request's
+    with app.test_request_context():
+        calendarGrid(userid, today.year, today.month)
+
+
+@shard_router.on_user_shard
+def prefetch_stats_summary(userid):
+    # with the breaker open this would only produce the fallback
+    if stats_breaker.current_state == pybreaker.STATE_OPEN:
+        return
+    version = getSyncVersion(userid)
+    payload, code = stats_get_with_breaker("/stats/summary", params={"user_id": userid})
+    if code == 200:
+        prefetch_cache.put(userid, "stats_summary", payload, version)
+
+
+@shard_router.on_user_shard
+def prefetch_stats_charts(userid):
+    renderStatsCharts(userid, None)
+
+
+def prefetchUserData(userid):
+    if PREFETCH_WORKERS > 0:
+        prefetcher.schedule(
+            userid, (prefetch_exercises, prefetch_calendar_grid, prefetch_stats_summary,
+                     prefetch_stats_charts))
+
+
+def takePrefetched(userid, key):
+    # only values read at the user's current sync_version (one primary-key lookup)
+    hit, value = prefetch_cache.take(userid, key, getSyncVersion(userid))
+    PREFETCH_EVENTS.labels(SERVICE_NAME, "hit" if hit else "miss").inc()
+    return hit, value
+
+
+# /stats charts are rendered to SVG here and cached per (user, chart, params,
+# sync_version): a write bumps the version, so a cached chart is never stale
+# and unchanged data is never aggregated twice. CHART_CACHE_MAX_ENTRIES
+# bounds the LRU.
+MONTH_NAMES = ["Januar", "Februar", "Marec", "April", "Maj", "Junij", "Julij",
+               "Avgust", "September", "Oktober", "November", "December"]
+
+chart_cache = FragmentCache(
+    max_entries=int(os.getenv("CHART_CACHE_MAX_ENTRIES", "2000")),
+    on_event=lambda chart, event: CHART_CACHE_EVENTS.labels(SERVICE_NAME, chart, event).inc()
+)
+
+
+def getSyncVersion(userid):
+    return db.session.query(User.sync_version).filter_by(id=userid).scalar()
+
+
+def getWorkoutCountsByMonth(userid, today):
+    """[(month name, workouts)] for the 12 months up to and including today's."""
+    months = [((today.year * 12 + today.month - 1 - i) // 12,
+               (today.year * 12 + today.month - 1 - i) % 12 + 1) for i in range(11, -1, -1)]
+    year = db.extract("year", Workout.date)
+    month = db.extract("month", Workout.date)
+    rows = db.session.query(year, month, db.func.count(Workout.id)).filter(
+        Workout.user_id == userid,
+        Workout.date.between(dt_date(*months[0], 1), today)
+    ).group_by(year, month).all()
+    counts = {(int(y), int(m)): n for y, m, n in rows}
+    return [(MONTH_NAMES[m - 1], counts.get((y, m), 0)) for y, m in months]
+
+
+def getMaxWeightSeries(userid, exercise_id):
+    # [(date, heaviest set)] per workout; extra_weight is pickled, so max() here
+    rows = db.session.query(Workout.date, Workout.extra_weight).filter_by(
+        user_id=userid, exercise_id=exercise_id
+    ).order_by(Workout.date, Workout.id).all()
+    return [(day, max(weights or [0])) for day, weights in rows]
+
+
+def getLatestExerciseId(userid):
+    return db.session.query(Workout.exercise_id).filter_by(user_id=userid).order_by(
+        Workout.date.desc(), Workout.id.desc()).limit(1).scalar()
+
+
+def renderStatsCharts(userid, exercise_name):
+    """
+    (exercises, selected exercise, bar chart, line chart) for the stats page;
+    without exercise_name the line chart shows the last logged exercise.
+    """
+    version = getSyncVersion(userid)
+    today = dt_date.today()
+    exercises = sorted(getExercises(userid), key=lambda e: e["name"].casefold())
+    if exercise_name:
+        selected = exercise_catalog.by_name(userid, exercise_name)
+    else:
+        latest = getLatestExerciseId(userid)
+        selected = next((e for e in exercises if e["id"] == latest), None)
+
+    months_chart = chart_cache.get(
+        "workouts_by_month", (userid, today.year, today.month, version),
+        lambda: bar_chart(*zip(*getWorkoutCountsByMonth(userid, today)),
+                          label="Število vaj po mesecih"))
+    if selected is None:
+        max_weight_chart = line_chart([], label="Največja teža skozi čas",
+                                      empty_text="Izberi vajo")
+    else:
+        max_weight_chart = chart_cache.get(
+            "max_weight", (userid, selected["id"], version),
+            lambda: line_chart(getMaxWeightSeries(userid, selected["id"]),
+                               label="Največja teža skozi čas",
+                               empty_text="Ni vnosov za to vajo"))
+    return exercises, selected, months_chart, max_weight_chart
+
+
+def nextSyncVersion(userid):
+    """
+    Bumps and returns the user's sync_version. The UPDATE keeps the user row
+    locked until commit, so one user's writes commit in version order and a
+    sync cursor never skips a version that commits late.
+    """
+    users = User.__table__
+    return db.session.execute(
+        users.update().where(users.c.id == userid)
+        .values(sync_version=users.c.sync_version + 1)
+        .returning(users.c.sync_version)
+    ).scalar()
+
+
+@event.listens_for(db.session, "before_flush")
+def stamp_sync_version(session, flush_context, instances):
+    # ORM-added workouts/exercises; bulk inserts pass the version themselves
+    pending = [obj for obj in session.new
+               if isinstance(obj, (Workout, Exercise)) and obj.version is None]
+    versions = {}
+    for obj in pending:
+        if obj.user_id not in versions:
+            versions[obj.user_id] = nextSyncVersion(obj.user_id)
+        obj.version = versions[obj.user_id]
+
+
 # # TODO remove
 # @app.route('/drop_all_tables')
 # def drop_all_tables():
@@ -191,6 +795,92 @@ def seedDB():
 
 # Helpers
 
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "0"))
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_PARAMS = re.compile(r"%\(\w+\)s|%s|\?|(?<!:):\w+")
+_SQL_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SQL_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint_sql(statement):
+    # literals / bind params -> ?, IN (?, ?, ...) -> (?+), collapse whitespace
+    sql = _SQL_LITERALS.sub("?", statement)
+    sql = _SQL_PARAMS.sub("?", sql)
+    sql = _SQL_IN_LISTS.sub("(?+)", sql)
+    return _SQL_WHITESPACE.sub(" ", sql).strip()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def db_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start_time"] = time.perf_counter()
+    if tracer.current_span() is not None:
+        conn.info["query_span"] = tracer.start_span("db.query")
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def db_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("query_start_time", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    span = conn.info.pop("query_span", None)
+    if span is not None:
+        span.set_attribute("db.statement", fingerprint_sql(statement))
+        span.end()
+    if has_request_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_time = g.get("db_time", 0.0) + elapsed
+    if SLOW_QUERY_THRESHOLD_MS and elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        fingerprint = fingerprint_sql(statement)
+        digest = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+        SLOW_QUERIES.labels(SERVICE_NAME, digest).inc()
+        app.logger.warning("slow query %.1fms [%s] %s",
+                           elapsed * 1000, digest, fingerprint)
+
+
+def endpoint_label():
+    # label by the matched URL rule, not the raw path, so /workouts/<date>
+    # stays a single series; anything unrouted (404s) shares one bucket
+    rule = request.url_rule
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+@app.before_request
+def trace_before():
+    if not tracer.enabled:
+        return
+    span = tracer.start_span(
+        f"{request.method} {endpoint_label()}",
+        {"http.method": request.method, "http.target": request.full_path},
+        traceparent=request.headers.get(TRACEPARENT_HEADER)
+    )
+    g.trace_previous = tracer.activate(span)
+    g.trace_span = span
+
+
+@app.after_request
+def trace_after(response):
+    span = g.get("trace_span")
+    if span is not None:
+        span.set_attribute("http.status_code", response.status_code)
+    return response
+
+
+@app.teardown_request
+def trace_teardown(exc):
+    span = g.pop("trace_span", None)
+    if span is None:
+        return
+    if exc is not None:
+        span.record_exception(exc)
+    tracer.restore(g.pop("trace_previous", None))
+    span.end()
+
+
+first_response_recorded = False
+
+
 @app.before_request
 def metrics_before():
     IN_PROGRESS.labels(SERVICE_NAME).inc()
@@ -201,31 +891,156 @@ def metrics_before():
 def metrics_after(response):
     try:
         elapsed = time.time() - getattr(request, "_start_time", time.time())
-        endpoint = request.path
+        endpoint = endpoint_label()
         REQUEST_LATENCY.labels(
             SERVICE_NAME, request.method, endpoint).observe(elapsed)
         REQUEST_COUNT.labels(SERVICE_NAME, request.method,
                              endpoint, str(response.status_code)).inc()
+        DB_QUERIES.labels(SERVICE_NAME, request.method,
+                          endpoint).observe(g.get("db_queries", 0))
+        DB_DURATION.labels(SERVICE_NAME, request.method,
+                           endpoint).observe(g.get("db_time", 0.0))
     finally:
         IN_PROGRESS.labels(SERVICE_NAME).dec()
+    global first_response_recorded
+    if not first_response_recorded:
+        first_response_recorded = True
+        APP_STARTUP.labels(SERVICE_NAME, "first_response").set(time.perf_counter() - STARTED_AT)
     return response
 
 
+def rate_limit_key():
+    uid = session.get("uid")
+    return f"user:{uid}" if uid is not None else f"ip:{request.remote_addr}"
+
+
+def too_many_requests(retry_after, reason):
+    RATE_LIMITED.labels(SERVICE_NAME, endpoint_label(), reason).inc()
+    response = jsonify({"error": "Too many requests", "reason": reason, "retry_after": retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+# registered after metrics_before, so refused requests are still measured
+@app.before_request
+def rate_limit_before():
+    limit = RATE_LIMITS.get(request.endpoint)
+    if limit is None or rate_limit_store is None:
+        return None
+    key = f"{rate_limit_key()}:{request.endpoint}"
+    try:
+        allowed, retry_after = rate_limit_store.take(key, limit)
+    except SQLAlchemyError:
+        # fail open: the limiter's table being unavailable shouldn't take the routes down
+        app.logger.exception("rate limit store failed")
+        allowed = True
+    if not allowed:
+        return too_many_requests(retry_after, "rate")
+    if limit.in_flight is not None:
+        if not in_flight_limiter.acquire(key, limit.in_flight):
+            return too_many_requests(1, "in_flight")
+        g.rate_limit_in_flight = key
+    return None
+
+
+@app.after_request
+def rate_limit_after(response):
+    # a streamed body (e.g. /importWorkouts) is produced after the request's
+    # teardown: keep the in-flight slot until the server closes the response
+    key = g.get("rate_limit_in_flight")
+    if key is not None and response.is_streamed:
+        g.pop("rate_limit_in_flight")
+        response.call_on_close(lambda: in_flight_limiter.release(key))
+    return response
+
+
+@app.teardown_request
+def rate_limit_teardown(exc):
+    key = g.pop("rate_limit_in_flight", None)
+    if key is not None:
+        in_flight_limiter.release(key)
+
+
+# per-user tables are read and written on the logged-in user's shard
+@app.before_request
+def shard_before():
+    uid = session.get("uid")
+    shard = shard_router.shard_for(uid) if shard_router.enabled and uid is not None else None
+    # login / register select the user's shard later in the request, restored here too
+    g.shard_previous = shard_router.activate(shard)
+
+
+@app.teardown_request
+def shard_teardown(exc):
+    if "shard_previous" in g:
+        shard_router.restore(g.pop("shard_previous"))
+
+
+@app.errorhandler(ShardMoving)
+def shard_moving(e):
+    # `flask move-user` is copying the user's rows; done within seconds
+    response = jsonify({"error": "Account is being moved, retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(max(1, int(SHARD_DIRECTORY_TTL)))
+    return response
+
+
+def rotate_session_id():
+    if hasattr(session, "regenerate"):
+        session.regenerate()
+
+
+# calendar month grids, rendered once per (user, year, month, month version):
+# the month version only moves when workouts dated in that month are added,
+# so writes to this month leave the cached history untouched.
+# CALENDAR_CACHE_MAX_ENTRIES bounds the LRU.
+calendar_cache = FragmentCache(
+    max_entries=int(os.getenv("CALENDAR_CACHE_MAX_ENTRIES", "5000")),
+    on_event=lambda kind, event: CALENDAR_CACHE_EVENTS.labels(SERVICE_NAME, event).inc()
+)
+
+
+def getMonthVersion(userid, year, month):
+    # (workouts, newest sync version) dated in the month; one range scan on (user_id, date)
+    first_day = dt_date(year, month, 1)
+    last_day = dt_date(year, month, calendar.monthrange(year, month)[1])
+    return tuple(db.session.query(db.func.count(Workout.id), db.func.max(Workout.version)).filter(
+        Workout.user_id == userid,
+        Workout.date.between(first_day, last_day)
+    ).one())
+
+
+def calendarGrid(userid, year, month):
+    return calendar_cache.get(
+        "calendar", (userid, year, month, getMonthVersion(userid, year, month)),
+        lambda: renderCalendarGrid(userid, year, month))
+
+
+def renderCalendarGrid(userid, year, month):
+    # read fresh: the grid is cached under the month's current version, and
+    # input fetched before that version (e.g. prefetched) could be older
+    days = getDaysOfWorkoutInMonth(month, year, userid)
+    return Markup(render_template('calendarGrid.html', current_year=year, current_month=month,
+                                  month_days=calendar.monthcalendar(year, month),
+                                  workout_days=set(days)))
+
+
 def getWorkoutsByDate(date, userid):
     return Workout.query.filter_by(date=date, user_id=userid).all()
 
 
 def getDaysOfWorkoutInMonth(month, year, userid):
-    first_day_of_month = datetime(year, month, 1)
+    # date (not datetime) bounds so Postgres can prune workout partitions
+    first_day_of_month = dt_date(year, month, 1)
     days_in_month = calendar.monthrange(year, month)[1]
-    workouts = Workout.query.filter(
-        Workout.date.between(first_day_of_month, datetime(
-            year, month, days_in_month)),
-        Workout.user_id == userid
-    ).all()
-    workout_days = {workout.date.day for workout in workouts}
-    print(sorted(workout_days))
-    return sorted(workout_days)
+    # only the date column -> index-only scan on ix_workout_user_id_date
+    dates = db.session.query(Workout.date).filter(
+        Workout.user_id == userid,
+        Workout.date.between(first_day_of_month, dt_date(
+            year, month, days_in_month))
+    ).distinct().all()
+    return sorted({d.day for (d,) in dates})
 
 
 def workoutconstraintIdtoName(workout):
@@ -238,9 +1053,9 @@ def workoutconstraintIdtoName(workout):
 
 
 def getExerciseIdByName(name, userid):
-    exercise = Exercise.query.filter_by(name=name, user_id=userid).first()
+    exercise = exercise_catalog.by_name(userid, name)
     if exercise:
-        return exercise.id
+        return exercise["id"]
     return None
 
 
@@ -249,10 +1064,9 @@ def getWorkoutsByExercise(exercise, userid):
 
 
 def getWorkoutsByExerciseName(exercisename, userid):
-    exercise = Exercise.query.filter_by(
-        name=exercisename, user_id=userid).first()
+    exercise = exercise_catalog.by_name(userid, exercisename)
     if exercise:
-        return Workout.query.filter_by(exercise_id=exercise.id, user_id=userid).all()
+        return Workout.query.filter_by(exercise_id=exercise["id"], user_id=userid).all()
     return []
 
 
@@ -261,59 +1075,112 @@ def getAllWorkouts(userid):
 
 
 def getExercises(userid):
-    exercises = Exercise.query.filter_by(user_id=userid).all()
-    return [exercise.to_dict() for exercise in exercises]
+    return exercise_catalog.all(userid)
+
+
+def emit_event(event_type, user_id, payload):
+    # part of the caller's transaction; the outbox relay publishes it after commit
+    db.session.add(OutboxEvent(event_type=event_type, user_id=user_id,
+                               payload=json.dumps(payload), created_at=time.time()))
+
+
+def emit_exercise_created(exercise):
+    emit_event("exercise.created", exercise.user_id,
+               {"exercise_id": exercise.id, "name": exercise.name})
+
+
+def emit_workout_created(workout):
+    day = workout.date.date() if isinstance(workout.date, datetime) else workout.date
+    exercise = getExerciseById(workout.exercise_id, workout.user_id) or {}
+    emit_event("workout.created", workout.user_id, {
+        "workout_id": workout.id,
+        "date": day.isoformat(),
+        "sets": workout.sets,
+        "reps": list(workout.reps or []),
+        "extra_weight": list(workout.extra_weight or []),
+        "is_bodyweight": workout.is_bodyweight,
+        "exercise_id": workout.exercise_id,
+        "exercise_name": exercise.get("name")
+    })
 
 
 def addExercise(exerciseName, userid):
-    existingExercise = Exercise.query.filter_by(
-        name=exerciseName, user_id=userid).first()
-    if not existingExercise:
-        newExercise = Exercise(name=exerciseName, user_id=userid)
-        db.session.add(newExercise)
-        db.session.commit()
-    return Exercise.query.filter_by(name=exerciseName, user_id=userid).first()
+    existingExercise = exercise_catalog.by_name(userid, exerciseName)
+    if existingExercise:
+        return existingExercise
+    newExercise = Exercise(name=exerciseName, user_id=userid)
+    db.session.add(newExercise)
+    db.session.flush()
+    emit_exercise_created(newExercise)
+    db.session.commit()
+    exercise_catalog.put(newExercise.to_dict())
+    return newExercise.to_dict()
 
 
 def getExerciseById(exerciseId, userid):
-    return Exercise.query.filter_by(id=exerciseId, user_id=userid).first()
+    return exercise_catalog.by_id(userid, exerciseId)
 
 
 def addWorkout(workout):
-    existingWorkout = Workout.query.filter_by(
-        date=workout.date,
-        sets=workout.sets,
-        reps=workout.reps,
-        extra_weight=workout.extra_weight,
-        is_bodyweight=workout.is_bodyweight,
-        exercise_id=workout.exercise_id,
-        user_id=workout.user_id,
-    ).first()
-    if not existingWorkout:
+    # a retried request (or sync push) carries the same client_id
+    if workout.client_id:
+        existingWorkout = Workout.query.filter_by(
+            user_id=workout.user_id, client_id=workout.client_id, date=workout.date).first()
+        if existingWorkout:
+            return existingWorkout
+    try:
         db.session.add(workout)
-        db.session.commit()
-    return Workout.query.filter_by(
-        date=workout.date,
-        sets=workout.sets,
-        reps=workout.reps,
-        extra_weight=workout.extra_weight,
-        is_bodyweight=workout.is_bodyweight,
-        exercise_id=workout.exercise_id,
-        user_id=workout.user_id,
-    ).first()
+        db.session.flush()
+    except IntegrityError:
+        # lost the race against a concurrent retry
+        db.session.rollback()
+        return Workout.query.filter_by(
+            user_id=workout.user_id, client_id=workout.client_id, date=workout.date).first()
+    emit_workout_created(workout)
+    db.session.commit()
+    return workout
+
+
+def selectUserShard(user_id):
+    # the rest of this request / command runs against the user's shard
+    if shard_router.enabled:
+        shard_router.activate(shard_router.shard_for(user_id))
 
 
 def addUser(username, passwordHash):
+    if shard_router.enabled:
+        # ids come from user_directory, so they stay unique across shards
+        entry = user_directory.find(username) or \
+            user_directory.register(username, shard_router.place) or \
+            user_directory.find(username)
+        selectUserShard(entry[0])
+        if db.session.get(User, entry[0]) is None:
+            newUser = User(id=entry[0], username=username, passwordHash=passwordHash)
+            db.session.add(newUser)
+            db.session.flush()
+            emit_event("user.registered", newUser.id,
+                       {"user_id": newUser.id, "username": newUser.username})
+            db.session.commit()
+        return db.session.get(User, entry[0])
+
     existingUser = User.query.filter_by(username=username).first()
     if not existingUser:
         newUser = User(username=username, passwordHash=passwordHash)
         db.session.add(newUser)
+        db.session.flush()
+        emit_event("user.registered", newUser.id,
+                   {"user_id": newUser.id, "username": newUser.username})
         db.session.commit()
 
     return User.query.filter_by(username=username).first()
 
 
 def getUser(username):
+    if shard_router.enabled:
+        entry = user_directory.find(username)
+        if entry is None:
+            return None
+        selectUserShard(entry[0])
     return User.query.filter_by(username=username).first()
 
 
@@ -327,50 +1194,458 @@ def seedExercises(userid):
         Exercise(name='skull crushers', user_id=userid)
     ]
 
-    with db.session.no_autoflush:
-        # Filter out existing exercises from the list before adding
-        exercises_to_add = [ex for ex in exercises if not Exercise.query.filter_by(
-            name=ex.name, user_id=ex.user_id).first()]
+    # Filter out existing exercises from the list before adding
+    exercises_to_add = [ex for ex in exercises
+                        if not exercise_catalog.by_name(userid, ex.name)]
+
+    # Add the remaining exercises
+    db.session.add_all(exercises_to_add)
+    db.session.flush()
+    for ex in exercises_to_add:
+        emit_exercise_created(ex)
+    db.session.commit()
+    for ex in exercises_to_add:
+        exercise_catalog.put(ex.to_dict())
+
+
+# workouts may be dated from WORKOUT_MIN_DATE up to WORKOUT_MAX_DAYS_AHEAD
+# days after today (the yearly workout partitions exist 2 years ahead)
+WORKOUT_MIN_DATE = dt_date.fromisoformat(os.getenv("WORKOUT_MIN_DATE", "1970-01-01"))
+WORKOUT_MAX_DAYS_AHEAD = int(os.getenv("WORKOUT_MAX_DAYS_AHEAD", "366"))
+
+
+def workoutDateRange():
+    return WORKOUT_MIN_DATE, dt_date.today() + timedelta(days=WORKOUT_MAX_DAYS_AHEAD)
+
 
-        # Add the remaining exercises
-        db.session.add_all(exercises_to_add)
+# bulk import: workouts per transaction, error details kept per import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "20"))
 
+
+def resolveExercises(userid, names, version):
+    """
+    name -> exercise id for all names, creating the missing ones with a
+    single INSERT .. ON CONFLICT DO NOTHING on uix_name_user, so concurrent
+    imports (or a stale catalog) can't create duplicates. Returns
+    (ids, created exercise dicts); the caller commits.
+    """
+    ids = {}
+    missing = []
+    for name in names:
+        exercise = exercise_catalog.by_name(userid, name)
+        if exercise:
+            ids[name] = exercise["id"]
+        else:
+            missing.append(name)
+    if not missing:
+        return ids, []
+
+    created = db.session.execute(
+        _dialect_insert(Exercise)
+        .values([{"name": name, "user_id": userid, "version": version} for name in missing])
+        .on_conflict_do_nothing(index_elements=["name", "user_id"])
+        .returning(Exercise.id, Exercise.name)
+    ).all()
+    created = [{"id": row.id, "name": row.name, "user_id": userid} for row in created]
+    for exercise in created:
+        ids[exercise["name"]] = exercise["id"]
+        emit_event("exercise.created", userid,
+                   {"exercise_id": exercise["id"], "name": exercise["name"]})
+
+    # created concurrently by someone else: the insert skipped them
+    conflicted = [name for name in missing if name not in ids]
+    if conflicted:
+        ids.update(db.session.execute(
+            db.select(Exercise.name, Exercise.id).where(
+                Exercise.user_id == userid, Exercise.name.in_(conflicted))
+        ).all())
+    return ids, created
+
+
+def _dialect_insert(model):
+    # INSERT with on_conflict_do_nothing()
+    if _shard_engine().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def _workout_row(userid, workout, exercise_id, version):
+    # parsed workout (see importer.normalize_record) -> workout table row
+    return {
+        "date": workout["date"],
+        "sets": len(workout["reps"]),
+        "reps": workout["reps"],
+        "extra_weight": workout["weights"],
+        "is_bodyweight": workout["is_bodyweight"],
+        "exercise_id": exercise_id,
+        "user_id": userid,
+        "client_id": workout.get("client_id"),
+        "version": version
+    }
+
+
+def emit_workouts_created(userid, written):
+    # bulk emit_workout_created for [(workout id, parsed workout, exercise id)]
+    if not written:
+        return
+    now = time.time()
+    db.session.execute(insert(OutboxEvent), [{
+        "event_type": "workout.created",
+        "user_id": userid,
+        "payload": json.dumps({
+            "workout_id": workout_id,
+            "date": w["date"].isoformat(),
+            "sets": len(w["reps"]),
+            "reps": w["reps"],
+            "extra_weight": w["weights"],
+            "is_bodyweight": w["is_bodyweight"],
+            "exercise_id": exercise_id,
+            "exercise_name": w["exercise"]
+        }),
+        "created_at": now
+    } for workout_id, w, exercise_id in written])
+
+
+def addWorkoutBatch(userid, workouts):
+    """
+    Inserts parsed workouts (see importer.group_workouts) plus their
+    workout.created outbox events in one transaction. Returns
+    (workouts written, exercises created).
+    """
+    version = nextSyncVersion(userid)
+    exercise_ids, created = resolveExercises(
+        userid, list(dict.fromkeys(w["exercise"] for w in workouts)), version)
+    rows = [_workout_row(userid, w, exercise_ids[w["exercise"]], version) for w in workouts]
+    workout_ids = db.session.scalars(
+        insert(Workout).returning(Workout.id, sort_by_parameter_order=True), rows).all()
+    emit_workouts_created(userid, [
+        (workout_id, w, exercise_ids[w["exercise"]]) for workout_id, w in zip(workout_ids, workouts)])
     db.session.commit()
+    for exercise in created:
+        exercise_catalog.put(exercise)
+    return len(workout_ids), len(created)
+
+
+def importWorkouts(userid, stream, fmt, batch_size=None):
+    """
+    Streams a CSV or JSON upload into the user's workouts, batch_size
+    workouts per transaction. Yields a progress dict after every batch and
+    a final one with done=True; batches committed before a failure stay.
+    Only one batch is held in memory, whatever the file size.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    progress = {"records": 0, "workouts": 0, "exercises_created": 0,
+                "rejected": 0, "errors": [], "done": False}
+
+    def records():
+        for line, record in (iter_csv(stream) if fmt == "csv" else iter_json(stream)):
+            progress["records"] += 1
+            yield line, record
+
+    def reject(line, error):
+        progress["rejected"] += 1
+        IMPORT_REJECTED_ROWS.labels(SERVICE_NAME).inc()
+        if len(progress["errors"]) < IMPORT_MAX_ERRORS:
+            progress["errors"].append({"line": line, "error": str(error)})
+
+    def flush(batch):
+        written, created = addWorkoutBatch(userid, batch)
+        progress["workouts"] += written
+        progress["exercises_created"] += created
+        IMPORTED_WORKOUTS.labels(SERVICE_NAME).inc(written)
+
+    batch = []
+    try:
+        for line, workout in group_workouts(records(), workoutDateRange()):
+            if isinstance(workout, ImportRowError):
+                reject(line, workout)
+                continue
+            batch.append(workout)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+                yield dict(progress)
+        if batch:
+            flush(batch)
+    except ImportRowError as e:
+        # the file itself is unreadable past this point (malformed JSON)
+        reject(progress["records"], e)
+        progress["failed"] = str(e)
+    except (SQLAlchemyError, UnicodeDecodeError) as e:
+        db.session.rollback()
+        progress["failed"] = f"{type(e).__name__}: {e}"
+    progress["done"] = True
+    yield progress
+
+
+# offline sync: workouts accepted per push, changes returned per page
+SYNC_MAX_PUSH = int(os.getenv("SYNC_MAX_PUSH", "200"))
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+
+
+def parseSyncCursor(value):
+    """
+    "12" -> (12, None): every change up to sync version 12 was received.
+    "12.340" -> (12, 340): version 12 only up to workout id 340, the last
+    page ended inside a version. Raises ValueError.
+    """
+    version, _, last_id = str(value).partition(".")
+    cursor = (int(version), int(last_id) if last_id else None)
+    if cursor[0] < 0:
+        raise ValueError(f"invalid cursor {value!r}")
+    return cursor
+
+
+def pushWorkouts(userid, items):
+    """
+    Stores workouts recorded offline. client_id makes a push idempotent:
+    items stored by an earlier push (whose response got lost) come back as
+    accepted with duplicate=true instead of being inserted again.
+    Returns (accepted, rejected).
+    """
+    accepted, rejected, valid = [], [], []
+    date_range = workoutDateRange()
+    for item in items:
+        client_id = item.get("client_id") if isinstance(item, dict) else None
+        if not isinstance(client_id, str) or not 0 < len(client_id) <= 64:
+            rejected.append({"client_id": client_id,
+                             "error": "client_id must be a string of 1-64 characters"})
+            continue
+        record = dict(item)
+        if item.get("exercise_id") is not None:
+            exercise = getExerciseById(item["exercise_id"], userid) \
+                if isinstance(item["exercise_id"], int) else None
+            if exercise is None:
+                rejected.append({"client_id": client_id, "error": "unknown exercise_id"})
+                continue
+            record["exercise"] = exercise["name"]
+        try:
+            day, name, reps, weights, bodyweight = normalize_record(record, date_range)
+        except ImportRowError as e:
+            rejected.append({"client_id": client_id, "error": str(e)})
+            continue
+        valid.append({"client_id": client_id, "date": day, "exercise": name, "reps": reps,
+                      "weights": weights, "is_bodyweight": bodyweight})
+    SYNC_PUSHED.labels(SERVICE_NAME, "rejected").inc(len(rejected))
+    if not valid:
+        return accepted, rejected
+
+    # an item repeated within the push is stored once, like a retried push
+    unique = {}
+    for w in valid:
+        unique.setdefault((w["client_id"], w["date"]), w)
+
+    version = nextSyncVersion(userid)
+    exercise_ids, created = resolveExercises(
+        userid, list(dict.fromkeys(w["exercise"] for w in unique.values())), version)
+    inserted = {
+        (row.client_id, row.date): row.id for row in db.session.execute(
+            _dialect_insert(Workout)
+            .values([_workout_row(userid, w, exercise_ids[w["exercise"]], version)
+                     for w in unique.values()])
+            .on_conflict_do_nothing(index_elements=["user_id", "client_id", "date"])
+            .returning(Workout.id, Workout.client_id, Workout.date))
+    }
+    duplicates = [w["client_id"] for w in valid if (w["client_id"], w["date"]) not in inserted]
+    existing = {}
+    if duplicates:
+        existing = {
+            (row.client_id, row.date): row.id for row in db.session.execute(
+                db.select(Workout.id, Workout.client_id, Workout.date).where(
+                    Workout.user_id == userid, Workout.client_id.in_(duplicates)))
+        }
+
+    written = []
+    for w in valid:
+        key = (w["client_id"], w["date"])
+        new = key in inserted and unique[key] is w
+        if new:
+            written.append((inserted[key], w, exercise_ids[w["exercise"]]))
+        accepted.append({"client_id": w["client_id"], "id": inserted.get(key, existing.get(key)),
+                         "duplicate": not new})
+    emit_workouts_created(userid, written)
+    db.session.commit()
+    for exercise in created:
+        exercise_catalog.put(exercise)
+    SYNC_PUSHED.labels(SERVICE_NAME, "inserted").inc(len(written))
+    SYNC_PUSHED.labels(SERVICE_NAME, "duplicate").inc(len(valid) - len(written))
+    return accepted, rejected
+
+
+def getSyncChanges(userid, cursor):
+    """
+    Workouts and exercises written after cursor (see parseSyncCursor), at
+    most SYNC_PAGE_SIZE workouts, in (version, id) order. Reads only rows
+    past the cursor through ix_workout_user_id_version. cursor=None returns
+    just the current cursor, for clients that only push.
+    """
+    head = db.session.execute(
+        db.select(User.sync_version).where(User.id == userid)).scalar() or 0
+    if cursor is None:
+        return {"cursor": str(head), "more": False, "workouts": [], "exercises": []}
+
+    version, last_id = cursor
+    after = Workout.version > version
+    if last_id is not None:
+        after = db.or_(after, db.and_(Workout.version == version, Workout.id > last_id))
+    # versions above head may belong to transactions that are still open
+    workouts = Workout.query.filter(
+        Workout.user_id == userid, after, Workout.version <= head
+    ).order_by(Workout.version, Workout.id).limit(SYNC_PAGE_SIZE + 1).all()
+    more = len(workouts) > SYNC_PAGE_SIZE
+    workouts = workouts[:SYNC_PAGE_SIZE]
+
+    exercises = Exercise.query.filter(
+        Exercise.user_id == userid,
+        Exercise.version > (version if last_id is None else version - 1),
+        Exercise.version <= head
+    ).all()
+    return {
+        "cursor": f"{workouts[-1].version}.{workouts[-1].id}" if more else str(head),
+        "more": more,
+        "workouts": [w.to_dict() for w in workouts],
+        "exercises": [e.to_dict() for e in exercises]
+    }
+
+
+def stats_timeout():
+    p99 = stats_latency.percentile(99)
+    if p99 is None:
+        return STATS_TIMEOUT_MAX
+    return min(STATS_TIMEOUT_MAX, max(STATS_TIMEOUT_MIN, p99 * STATS_TIMEOUT_P99_FACTOR))
+
+
+def stats_hedge_after():
+    return stats_latency.percentile(95) if STATS_HEDGING else None
+
+
+def _stop_at_deadline(retry_state):
+    # don't start another attempt that could not finish before the deadline
+    deadline = retry_state.kwargs.get("deadline")
+    if deadline is None:
+        return False
+    sleep = getattr(retry_state, "upcoming_sleep", 0) or 0
+    return time.monotonic() + sleep + STATS_TIMEOUT_MIN >= deadline
 
 
 @retry(
-    stop=stop_after_attempt(3),
+    stop=stop_after_attempt(3) | _stop_at_deadline,
     wait=wait_exponential(multiplier=0.2, min=0.2, max=2),
     retry=retry_if_exception_type((requests.RequestException, UpstreamError)),
     reraise=True
 )
-def _do_stats_get(path, params=None) -> requests.Response:
+def _do_stats_get(path, params=None, deadline=None) -> requests.Response:
     url = f"{STATS_SERVICE_URL}{path}"
-    r = requests.get(url, params=params, timeout=2.5)
-    # 5xx == failure (triggers retry / breaker)
-    if r.status_code >= 500:
-        raise UpstreamError(f"Upstream returned {r.status_code}")
-    return r
+    timeout = stats_timeout()
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            raise UpstreamError("Deadline exceeded")
+    hedge_after = stats_hedge_after()
+
+    # one span per tenacity attempt
+    with tracer.span("stats.get", {"http.url": url, "timeout": timeout}) as span:
+        headers = tracer.inject({})
+
+        def get():
+            return requests.get(url, params=params, timeout=timeout, headers=headers)
+
+        start = time.perf_counter()
+        if hedge_after is not None and hedge_after < timeout:
+            span.set_attribute("hedge_after", hedge_after)
+            r = stats_hedger.call(get, hedge_after)
+        else:
+            r = get()
+        span.set_attribute("http.status_code", r.status_code)
+        if r.status_code < 500:
+            stats_latency.observe(time.perf_counter() - start)
+        # 5xx == failure (triggers retry / breaker)
+        if r.status_code >= 500:
+            raise UpstreamError(f"Upstream returned {r.status_code}")
+        return r
 
 
 def stats_get_with_breaker(path, params=None, fallback=None):
     # wrapper that applies circuit breaker / retry
-    try:
-        # breaker wraps the retried call
-        r = stats_breaker.call(_do_stats_get, path, params)
-        # forward JSON if possible
+    with tracer.span("stats.call", {"stats.path": path, "breaker.state": str(stats_breaker.current_state)}) as span:
         try:
-            return r.json(), r.status_code
-        except Exception:
-            return {"status": "ERROR", "error": "Upstream returned non-JSON"}, 502
+            # breaker wraps the retried call; identical concurrent calls (same
+            # path and params) wait for the first one instead of sending their own
+            r, coalesced = stats_single_flight.do(
+                (path, tuple(sorted((params or {}).items()))),
+                lambda: stats_breaker.call(_do_stats_get, path, params,
+                                           deadline=time.monotonic() + STATS_DEADLINE))
+            span.set_attribute("coalesced", coalesced)
+            # forward JSON if possible
+            try:
+                return r.json(), r.status_code
+            except Exception:
+                return {"status": "ERROR", "error": "Upstream returned non-JSON"}, 502
+
+        except pybreaker.CircuitBreakerError as e:
+            # breaker OPEN
+            span.record_exception(e)
+            return (fallback or {"status": "DEGRADED", "error": "stats-service unavailable (circuit open)"}), 503
+
+        except Exception as e:
+            # maxed retries or hard failure
+            span.record_exception(e)
+            return (fallback or {"status": "DEGRADED", "error": f"stats-service unavailable ({type(e).__name__})"}), 503
+
+
+# outbox relay: domain events -> POST {STATS_SERVICE_URL}/stats/events
+OUTBOX_RELAY_INTERVAL = float(os.getenv("OUTBOX_RELAY_INTERVAL", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_TIMEOUT = float(os.getenv("OUTBOX_TIMEOUT", "5"))
+
+
+def deliver_events(events):
+    with tracer.span("outbox.deliver", {"events": len(events)}):
+        r = requests.post(f"{STATS_SERVICE_URL}/stats/events", json={"events": events},
+                          headers=tracer.inject({}), timeout=OUTBOX_TIMEOUT)
+        if r.status_code >= 300:
+            raise UpstreamError(f"Upstream returned {r.status_code}")
+
+
+# one outbox per shard (a single one without SHARD_URLS)
+outbox_relays = {
+    name: OutboxRelay(functools.partial(_shard_engine, name), deliver_events,
+                      batch_size=OUTBOX_BATCH_SIZE, source=name or "")
+    for name in shard_router.names or [None]
+}
 
-    except pybreaker.CircuitBreakerError:
-        # breaker OPEN
-        return (fallback or {"status": "DEGRADED", "error": "stats-service unavailable (circuit open)"}), 503
 
-    except Exception as e:
-        # maxed retries or hard failure
-        return (fallback or {"status": "DEGRADED", "error": f"stats-service unavailable ({type(e).__name__})"}), 503
+def run_outbox_relay():
+    total, oldest = 0, None
+    for name, relay in outbox_relays.items():
+        try:
+            OUTBOX_RELAYED.labels(SERVICE_NAME).inc(relay.drain())
+        except Exception as e:
+            OUTBOX_RELAY_FAILURES.labels(SERVICE_NAME).inc()
+            app.logger.warning("outbox relay failed (shard %s): %s", name, e)
+        pending, first = relay.backlog()
+        total += pending
+        if first is not None and (oldest is None or first < oldest):
+            oldest = first
+    OUTBOX_PENDING.labels(SERVICE_NAME).set(total)
+    OUTBOX_LAG.labels(SERVICE_NAME).set(time.time() - oldest if oldest else 0)
+    return total
+
+
+def start_outbox_relay():
+    if OUTBOX_RELAY_INTERVAL <= 0:
+        return
+
+    def loop():
+        while True:
+            try:
+                run_outbox_relay()
+            except Exception:
+                app.logger.exception("outbox relay loop failed")
+            time.sleep(OUTBOX_RELAY_INTERVAL)
+
+    threading.Thread(target=loop, name="outbox-relay", daemon=True).start()
 
 # Routes
 
@@ -383,7 +1658,7 @@ def metrics():
 @app.get("/resilience")
 def resilience_status():
     """
-    Resilience status for stats-service proxy (circuit breaker state).
+    Resilience status for stats-service proxy (circuit breaker, timeouts, hedging).
     ---
     tags:
       - Resilience
@@ -395,15 +1670,100 @@ def resilience_status():
           properties:
             breaker_state: {type: string, example: "closed"}
             fail_counter: {type: integer, example: 0}
+            fail_max: {type: integer, example: 5}
+            opened_at: {type: string, example: "2026-01-10T01:35:40+00:00"}
+            breaker_storage:
+              type: object
+              properties:
+                backend: {type: string, example: "sql"}
+                replica: {type: string, example: "core-7c9d8b-x2x9q"}
+                updated_by: {type: string, example: "core-7c9d8b-abcde"}
             stats_service_url: {type: string, example: "http://stats:5000"}
+            latency:
+              type: object
+              properties:
+                samples: {type: integer, example: 120}
+                p50: {type: number, example: 0.012}
+                p95: {type: number, example: 0.045}
+                p99: {type: number, example: 0.09}
+            timeout_seconds: {type: number, example: 0.25}
+            deadline_seconds: {type: number, example: 4.0}
+            hedging:
+              type: object
+              properties:
+                enabled: {type: boolean, example: true}
+                hedge_after_seconds: {type: number, example: 0.045}
+                sent: {type: integer, example: 3}
+                won: {type: integer, example: 2}
+                skipped: {type: integer, example: 0}
+            coalescing:
+              type: object
+              properties:
+                calls: {type: integer, example: 120}
+                coalesced: {type: integer, example: 14}
+                in_flight: {type: integer, example: 1}
     """
+    opened_at = breaker_storage.opened_at
+    storage = breaker_storage.snapshot() if hasattr(
+        breaker_storage, "snapshot") else {"backend": breaker_storage.name}
     return jsonify({
         "breaker_state": str(stats_breaker.current_state),
         "fail_counter": stats_breaker.fail_counter,
-        "stats_service_url": STATS_SERVICE_URL
+        "fail_max": stats_breaker.fail_max,
+        "opened_at": opened_at.isoformat() if opened_at else None,
+        "breaker_storage": storage,
+        "stats_service_url": STATS_SERVICE_URL,
+        "latency": stats_latency.snapshot(),
+        "timeout_seconds": stats_timeout(),
+        "deadline_seconds": STATS_DEADLINE,
+        "hedging": {
+            "enabled": STATS_HEDGING,
+            "hedge_after_seconds": stats_hedge_after(),
+            **stats_hedger.snapshot()
+        },
+        "coalescing": stats_single_flight.snapshot()
     }), 200
 
 
+@app.get("/traces")
+def traces():
+    """
+    Recently finished tracing spans (only with TRACE_EXPORTER=memory and
+    TRACES_TOKEN set).
+    ---
+    tags:
+      - Tracing
+    parameters:
+      - name: Authorization
+        in: header
+        type: string
+        required: true
+        description: "Bearer <TRACES_TOKEN>"
+      - name: trace_id
+        in: query
+        type: string
+        required: false
+    responses:
+      200:
+        description: List of spans, oldest first
+      401:
+        description: Missing or wrong token
+      404:
+        description: In-memory exporter or TRACES_TOKEN not enabled
+    """
+    if not TRACES_TOKEN:
+        return jsonify({"error": "TRACES_TOKEN is not set"}), 404
+    # bytes: compare_digest rejects non-ASCII str
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode("utf-8"),
+                               f"Bearer {TRACES_TOKEN}".encode("utf-8")):
+        return jsonify({"error": "unauthorized"}), 401
+    spans = getattr(tracer.exporter, "spans", None)
+    if spans is None:
+        return jsonify({"error": "in-memory trace exporter is not enabled"}), 404
+    trace_id = request.args.get("trace_id")
+    return jsonify([s for s in list(spans) if not trace_id or s["trace_id"] == trace_id])
+
+
 @app.get("/api/time")
 def api_time():
     """
@@ -464,6 +1824,10 @@ def stats_summary():
     if "uid" not in session:
         return redirect(url_for("loginScreen"))
 
+    hit, payload = takePrefetched(session["uid"], "stats_summary")
+    if hit:
+        return jsonify(payload), 200
+
     payload, code = stats_get_with_breaker(
         "/stats/summary",
         params={"user_id": session["uid"]},
@@ -481,6 +1845,42 @@ def stats_summary():
     return jsonify(payload), code
 
 
+@app.route("/personalRecords", methods=["GET"])
+def personal_records():
+    """
+    Personal records per exercise for logged-in user (proxy to stats-service).
+    ---
+    tags:
+      - Proxy
+    responses:
+      200:
+        description: Best weight, reps at weight, estimated 1RM and session tonnage per exercise
+      302:
+        description: Redirect to login if not authenticated
+      503:
+        description: Degraded mode (stats-service unavailable or circuit open)
+        schema:
+          type: object
+          properties:
+            status: {type: string, example: "DEGRADED"}
+            error: {type: string, example: "Stats service is unavailable"}
+            source: {type: string, example: "fallback"}
+    """
+    if "uid" not in session:
+        return redirect(url_for("loginScreen"))
+
+    payload, code = stats_get_with_breaker(
+        "/stats/records",
+        params={"user_id": session["uid"]},
+        fallback={
+            "status": "DEGRADED",
+            "error": "Stats service is unavailable",
+            "source": "fallback"
+        }
+    )
+    return jsonify(payload), code
+
+
 @app.route("/health")
 def health():
     """
@@ -499,6 +1899,68 @@ def health():
     return jsonify({"status": "UP"}), 200
 
 
+@app.route("/health/live")
+def health_live():
+    """
+    Liveness probe: the process answers requests. Checks nothing else, so a
+    database or stats outage does not get pods restarted.
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: Process is alive
+        schema:
+          type: object
+          properties:
+            status: {type: string, example: UP}
+    """
+    return jsonify({"status": "UP"}), 200
+
+
+@app.route("/health/startup")
+def health_startup():
+    """
+    Startup probe: warm-up (DB pool, templates, breaker state) has finished.
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: Warm-up finished
+      503:
+        description: Still warming up
+    """
+    if health_checks.started.is_set():
+        return jsonify({"status": "UP"}), 200
+    return jsonify({"status": "STARTING"}), 503
+
+
+@app.route("/health/ready")
+def health_ready():
+    """
+    Readiness probe: warmed up, database reachable and not draining. An open
+    stats breaker only reports DEGRADED (still 200). Check results are cached
+    for READINESS_CACHE_TTL seconds.
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: Ready for traffic (UP or DEGRADED)
+        schema:
+          type: object
+          properties:
+            status: {type: string, example: UP}
+            checks: {type: object}
+            age_seconds: {type: number, example: 0.42}
+      503:
+        description: STARTING, DOWN or DRAINING
+    """
+    ready, body = health_checks.readiness()
+    return jsonify(body), 200 if ready else 503
+
+
 @app.route('/calendar', methods=['GET'])
 def calendar_redirect():
     if 'uid' not in session:
@@ -521,21 +1983,8 @@ def calendar_page(year, month):
         return redirect(url_for('calendar_page', year=year-1, month=12))
     if (month > 12):
         return redirect(url_for('calendar_page', year=year+1, month=1))
-    current_year = int(year)
-    current_month = int(month)
-
-    first_day_of_month = datetime(current_year, current_month, 1)
-    days_in_month = calendar.monthrange(current_year, current_month)[1]
-    month_days = calendar.monthcalendar(current_year, current_month)
-    workouts = Workout.query.filter(Workout.date.between(
-        first_day_of_month, datetime(current_year, current_month, days_in_month))).all()
-
-    # TODO
-    workouts_by_date = {}
-    for workout in workouts:
-        workouts_by_date.setdefault(workout.date, []).append(workout)
-
-    return render_template('calendar.html', current_year=current_year, current_month=current_month, month_days=month_days, workouts_by_date=workouts_by_date)
+    grid = calendarGrid(session['uid'], year, month)
+    return render_template('calendar.html', current_year=year, current_month=month, grid=grid)
 
 
 @app.route('/addExercise', methods=['POST'])
@@ -572,7 +2021,10 @@ def add_exercise():
     if exerciseName:
         exercise = Exercise(name=exerciseName, user_id=session['uid'])
         db.session.add(exercise)
+        db.session.flush()
+        emit_exercise_created(exercise)
         db.session.commit()
+        exercise_catalog.put(exercise.to_dict())
         return jsonify({'success': True})
     return jsonify({'success': False})
 
@@ -626,8 +2078,7 @@ def getAllExercises():
 
 @app.route('/getExercisesInMonth/<int:year>/<int:month>', methods=['GET'])
 def getExercisesInMonth(year, month):
-    days = getDaysOfWorkoutInMonth(month, year, session['uid'])
-    return jsonify(days)
+    return jsonify(getDaysOfWorkoutInMonth(month, year, session['uid']))
 
 
 @app.route('/addWorkout', methods=['POST'])
@@ -657,6 +2108,11 @@ def add_workout():
               items: {type: number}
               example: [60, 60, 60]
             isbodyweight: {type: boolean, example: false}
+            client_id:
+              type: string
+              example: "7f9c2ba4-e88f-4d6b-9c1a-0c6f3f1d2a11"
+              description: Client-generated id; resending it doesn't add the workout twice
+            date: {type: string, format: date, example: "2026-10-19", description: "Defaults to today"}
     responses:
       200:
         description: Workout added
@@ -682,8 +2138,19 @@ def add_workout():
     weights = data.get('weights', [])
     is_bodyweight = data.get('isbodyweight', False)
 
+    client_id = data.get('client_id')
+
     if not workout or sets is None or not reps or not weights:
         return "Invalid input", 400
+    if client_id is not None and (not isinstance(client_id, str) or len(client_id) > 64):
+        return "Invalid input", 400
+    try:
+        day = dt_date.fromisoformat(data['date']) if data.get('date') else dt_date.today()
+    except (TypeError, ValueError):
+        return "Invalid input", 400
+    first_day, last_day = workoutDateRange()
+    if not first_day <= day <= last_day:
+        return "Invalid input", 400
 
     print(
         f"Workout: {workout}, Sets: {sets}, Reps: {reps}, Weights: {weights}, Is Bodyweight: {is_bodyweight}")
@@ -691,7 +2158,8 @@ def add_workout():
     #  exercise id, userid
 
     newWorkout = Workout(
-        date=datetime.now(),
+        date=day,
+        client_id=client_id,
         sets=sets,
         reps=reps,
         extra_weight=weights,
@@ -704,6 +2172,182 @@ def add_workout():
     return jsonify({"message": "Workout added successfully"}), 200
 
 
+@app.route('/importWorkouts', methods=['POST'])
+def import_workouts():
+    """
+    Bulk import workout history from a CSV or JSON file.
+    CSV needs a header with date, exercise, reps and weight (or weights)
+    columns, bodyweight is optional; JSON is an array of objects with the
+    same keys, or one object per line. reps/weights are one set per row
+    ("5", "100") or a list ("5;5;5" in CSV, [5, 5, 5] in JSON); consecutive
+    rows with the same date and exercise become one workout. Unknown
+    exercises are created. The file is streamed, either as the raw request
+    body or as the "file" field of a multipart upload.
+    ---
+    tags:
+      - Core
+    consumes:
+      - text/csv
+      - application/json
+      - multipart/form-data
+    parameters:
+      - in: query
+        name: format
+        type: string
+        enum: [csv, json]
+        required: false
+        description: Defaults to the file extension / content type, else csv
+      - in: formData
+        name: file
+        type: file
+        required: false
+    responses:
+      200:
+        description: >
+          Progress as JSON lines, one per committed batch; the last one has
+          done=true (and "failed" if the import stopped early)
+        schema:
+          type: object
+          properties:
+            records: {type: integer, example: 1500}
+            workouts: {type: integer, example: 500}
+            exercises_created: {type: integer, example: 3}
+            rejected: {type: integer, example: 1}
+            errors:
+              type: array
+              items:
+                type: object
+                properties:
+                  line: {type: integer, example: 17}
+                  error: {type: string, example: "invalid date '17/03/2024'"}
+            done: {type: boolean, example: false}
+      400:
+        description: Unsupported format
+      302:
+        description: Redirect to login if not authenticated
+    """
+    if 'uid' not in session:
+        return redirect(url_for('loginScreen'))
+
+    upload = request.files.get("file") if request.mimetype == "multipart/form-data" else None
+    hint = (upload.filename or "").lower() if upload is not None else request.mimetype
+    fmt = request.args.get("format") or \
+        ("json" if hint.endswith(("json", ".jsonl", ".ndjson")) else "csv")
+    if fmt not in ("csv", "json"):
+        return jsonify({"error": "format must be csv or json"}), 400
+
+    if upload is not None:
+        # Flask closes request.files when the view returns, before the
+        # response below is streamed: keep a copy of the upload on disk
+        stream = tempfile.TemporaryFile()
+        shutil.copyfileobj(upload.stream, stream)
+        stream.seek(0)
+    else:
+        stream = request.stream
+
+    userid = session['uid']
+
+    def progress():
+        # runs after the request's teardown restored the shard selection
+        try:
+            with shard_router.for_user(userid):
+                for p in importWorkouts(userid, stream, fmt):
+                    yield json.dumps(p) + "\n"
+        finally:
+            if upload is not None:
+                stream.close()
+
+    return Response(stream_with_context(progress()), mimetype="application/x-ndjson")
+
+
+@app.route('/sync', methods=['POST'])
+def sync():
+    """
+    Offline sync: push workouts recorded on the device, pull changes since the last sync.
+    Pushed workouts are deduplicated by client_id, so a push can be retried
+    safely. Changes are returned in pages; while "more" is true, call again
+    with the returned cursor. Omit cursor to only push.
+    ---
+    tags:
+      - Core
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            cursor: {type: string, example: "42", description: 'From the previous response; "0" for a full sync'}
+            workouts:
+              type: array
+              items:
+                type: object
+                properties:
+                  client_id: {type: string, example: "7f9c2ba4-e88f-4d6b-9c1a-0c6f3f1d2a11"}
+                  date: {type: string, format: date, example: "2026-10-19"}
+                  exercise_id: {type: integer, example: 2}
+                  exercise: {type: string, example: "squat", description: "Instead of exercise_id; created if missing"}
+                  reps:
+                    type: array
+                    items: {type: integer}
+                    example: [5, 5, 5]
+                  weights:
+                    type: array
+                    items: {type: number}
+                    example: [100, 100, 100]
+                  is_bodyweight: {type: boolean, example: false}
+    responses:
+      200:
+        description: Push result and server changes since cursor
+        schema:
+          type: object
+          properties:
+            cursor: {type: string, example: "45"}
+            more: {type: boolean, example: false}
+            accepted:
+              type: array
+              items:
+                type: object
+                properties:
+                  client_id: {type: string}
+                  id: {type: integer, example: 1201}
+                  duplicate: {type: boolean, example: false}
+            rejected:
+              type: array
+              items:
+                type: object
+                properties:
+                  client_id: {type: string}
+                  error: {type: string, example: "invalid date '19.10.2026'"}
+            workouts:
+              type: array
+              items: {type: object}
+            exercises:
+              type: array
+              items: {type: object}
+      400:
+        description: Invalid cursor or too many workouts in one push
+      302:
+        description: Redirect to login if not authenticated
+    """
+    if 'uid' not in session:
+        return redirect(url_for('loginScreen'))
+    data = request.get_json(silent=True) or {}
+    items = data.get('workouts') or []
+    if not isinstance(items, list) or len(items) > SYNC_MAX_PUSH:
+        return jsonify({"error": f"workouts must be a list of at most {SYNC_MAX_PUSH}"}), 400
+    try:
+        cursor = parseSyncCursor(data['cursor']) if data.get('cursor') is not None else None
+    except ValueError:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    accepted, rejected = pushWorkouts(session['uid'], items)
+    changes = getSyncChanges(session['uid'], cursor)
+    return jsonify({"accepted": accepted, "rejected": rejected, **changes})
+
+
 @app.route('/workout', methods=['GET', 'POST'])
 def workout():
     if 'uid' not in session:
@@ -751,8 +2395,11 @@ def login():
         user = getUser(username)
         if user:
             if bcrypt.checkpw(password.encode('utf-8'), user.passwordHash.encode('utf-8')):
+                rotate_session_id()
                 session['uid'] = user.id
                 session['username'] = user.username
+                # async, the redirect doesn't wait for it
+                prefetchUserData(user.id)
                 flash("Login successful!", "success")
                 return redirect(url_for('workout'))
             else:
@@ -777,9 +2424,8 @@ def login():
 
 @app.route('/logout')
 def logout():
-    session.pop('uid', None)
-    session.pop('username', None)
-    session.pop('_flashes', None)
+    session.clear()
+    rotate_session_id()
     flash("You have been logged out.", "success")
     return redirect(url_for('loginScreen'))
 
@@ -794,7 +2440,10 @@ def logout():
 def show_stats():
     if 'uid' not in session:
         return redirect(url_for('loginScreen'))
-    return render_template('stats.html')
+    exercises, selected, months_chart, max_weight_chart = renderStatsCharts(
+        session['uid'], request.args.get('exercise'))
+    return render_template('stats.html', exercises=exercises, selected=selected,
+                           months_chart=months_chart, max_weight_chart=max_weight_chart)
 
 
 # @app.route('/getAllWorkoutsForUser', methods=['GET'])
@@ -838,8 +2487,419 @@ def getAllWorkoutsForUser():
     return jsonify([]), 200
 
 
+@app.cli.command("revoke-sessions")
+@click.argument("username")
+def revoke_sessions(username):
+    """Log a user out everywhere (server-side SESSION_STORE only)."""
+    user = getUser(username)
+    if user is None or not hasattr(app.session_interface, "store"):
+        click.echo("Nothing to revoke.")
+        return
+    app.session_interface.store.delete_user(user.id)
+    click.echo(f"Revoked all sessions of {username}.")
+
+
+def _hot_queries(userid, exercise_id, day):
+    # query shapes behind getWorkoutsByDate, getDaysOfWorkoutInMonth,
+    # getWorkoutsByExercise, getExercises and stats summary/workouts
+    return {
+        "getWorkoutsByDate": Workout.query.filter_by(date=day, user_id=userid),
+        "getDaysOfWorkoutInMonth": db.session.query(Workout.date).filter(
+            Workout.user_id == userid,
+            Workout.date.between(day.replace(day=1), day)).distinct(),
+        "getWorkoutsByExercise": Workout.query.filter_by(exercise_id=exercise_id, user_id=userid),
+        "getExercises": db.session.query(Exercise.id, Exercise.name, Exercise.user_id).filter_by(
+            user_id=userid),
+        "stats summary_for_user": Workout.query.filter_by(user_id=userid),
+        "stats workouts_for_user": Workout.query.filter_by(user_id=userid).order_by(Workout.date.asc()),
+    }
+
+
+def _explain(query):
+    # plain SQL carries no table for the session to route: run it on the shard
+    shard = {"bind": _shard_engine()}
+    dialect = shard["bind"].dialect
+    sql = str(query.statement.compile(
+        dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "postgresql":
+        plan = [row[0] for row in db.session.execute(db.text("EXPLAIN " + sql), bind_arguments=shard)]
+        uses_index = any("Index" in line for line in plan) and \
+            not any("Seq Scan" in line for line in plan)
+    else:
+        plan = [row[-1] for row in db.session.execute(db.text("EXPLAIN QUERY PLAN " + sql),
+                                                      bind_arguments=shard)]
+        uses_index = all("USING" in line for line in plan
+                         if line.startswith(("SCAN", "SEARCH")))
+    return uses_index, plan
+
+
+@app.cli.command("relay-outbox")
+def relay_outbox():
+    """Deliver pending outbox events to stats once and print the backlog."""
+    pending = run_outbox_relay()
+    click.echo(f"pending: {pending}")
+
+
+@app.cli.command("build-assets")
+def build_assets():
+    """Write gzipped copies of the static files (run at image build)."""
+    for name, size, packed in assets.compress():
+        click.echo(f"{name}: {size} -> {packed} bytes")
+
+
+def _write_import_benchmark_csv(path, workouts, sets=3):
+    # one row per set, the shape most tracker apps export
+    names = [f"exercise {n}" for n in range(20)]
+    start = dt_date.today() - timedelta(days=workouts // len(names) + 1)
+    with open(path, "w") as f:
+        f.write("date,exercise,reps,weight\n")
+        for n in range(workouts):
+            day = start + timedelta(days=n // len(names))
+            for s in range(sets):
+                f.write(f"{day.isoformat()},{names[n % len(names)]},{5 + s},{40 + n % 60}\n")
+
+
+def _delete_user_data(userid):
+    db.session.execute(db.delete(OutboxEvent).where(OutboxEvent.user_id == userid))
+    db.session.execute(db.delete(Workout).where(Workout.user_id == userid))
+    db.session.execute(db.delete(Exercise).where(Exercise.user_id == userid))
+    db.session.execute(db.delete(User).where(User.id == userid))
+    db.session.commit()
+    exercise_catalog.invalidate(userid)
+
+
+@app.cli.command("benchmark-import")
+@click.option("--workouts", "sizes", multiple=True, type=int, default=(2000, 20000),
+              help="Workouts per synthetic file (repeatable).")
+@click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True)
+def benchmark_import(sizes, batch_size):
+    """Time bulk CSV imports of growing files and their peak Python memory."""
+    passwordHash = bcrypt.hashpw(os.urandom(16), bcrypt.gensalt()).decode('utf-8')
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f"import-{size}.csv")
+            _write_import_benchmark_csv(path, size)
+            megabytes = os.path.getsize(path) / 1e6
+
+            # timed without tracemalloc (it slows allocation down a lot),
+            # then the same file again for the memory peak
+            results = []
+            for trace in (False, True):
+                user = addUser(f"import-benchmark-{size}-{int(time.time())}", passwordHash)
+                if trace:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                try:
+                    with open(path, "rb") as f:
+                        for progress in importWorkouts(user.id, f, "csv", batch_size):
+                            pass
+                    elapsed = time.perf_counter() - started
+                    peak = tracemalloc.get_traced_memory()[1] if trace else None
+                finally:
+                    if trace:
+                        tracemalloc.stop()
+                    _delete_user_data(user.id)
+                if progress.get("failed") or progress["workouts"] != size:
+                    raise click.ClickException(f"import failed: {progress}")
+                results.append((elapsed, peak))
+
+            elapsed, peak = results[0][0], results[1][1]
+            click.echo(
+                f"{size:>8} workouts ({progress['records']} rows, {megabytes:.1f} MB): "
+                f"{elapsed:.2f}s, {size / elapsed:,.0f} workouts/s, "
+                f"{progress['records'] / elapsed:,.0f} rows/s, peak {peak / 1e6:.1f} MB")
+
+
+@app.cli.command("explain-hot-queries")
+def explain_hot_queries():
+    """EXPLAIN the hot workout/exercise queries; fails unless each one uses an index."""
+    sample = db.session.query(
+        Workout.user_id, Workout.exercise_id, Workout.date).first()
+    if sample is None:
+        raise click.ClickException("No workouts to explain against.")
+
+    failed = []
+    for name, query in _hot_queries(*sample).items():
+        uses_index, plan = _explain(query)
+        click.echo(f"{'OK  ' if uses_index else 'FAIL'} {name}")
+        for line in plan:
+            click.echo(f"       {line}")
+        if not uses_index:
+            failed.append(name)
+    if failed:
+        raise click.ClickException(f"No index scan for: {', '.join(failed)}")
+
+
+@app.cli.command("create-workout-partitions")
+@click.option("--years-ahead", default=2, help="Create yearly partitions up to this many years ahead.")
+def create_workout_partitions(years_ahead):
+    """Create upcoming yearly partitions of the workout table (Postgres only)."""
+    for name in shard_router.names or [None]:
+        prefix = f"[{name}] " if name else ""
+        engine = _shard_engine(name)
+        if engine.dialect.name != "postgresql":
+            click.echo(f"{prefix}workout is not partitioned on this database, nothing to do.")
+            continue
+        with engine.connect() as conn:
+            kind = conn.execute(db.text(
+                "SELECT relkind FROM pg_class WHERE relname = 'workout'")).scalar()
+        if kind != "p":
+            click.echo(f"{prefix}workout is not partitioned, run 'flask db upgrade' first.")
+            continue
+
+        this_year = datetime.now().year
+        for year in range(this_year, this_year + years_ahead + 1):
+            # one transaction per year: a failing year doesn't undo the others
+            with engine.begin() as conn:
+                moved = createWorkoutPartition(conn, year)
+            click.echo(f"{prefix}workout_y{year} ready"
+                       + (f", {moved} workouts moved from workout_default" if moved else ""))
+
+        with engine.connect() as conn:
+            stray = conn.execute(db.text("SELECT COUNT(*) FROM workout_default")).scalar()
+        if stray:
+            click.echo(f"{prefix}warning: {stray} workouts are in workout_default "
+                       "(dates outside the yearly partitions)")
+
+
+def createWorkoutPartition(conn, year):
+    """
+    Creates workout_y<year> unless it exists. Rows of that year already in
+    workout_default would make CREATE ... PARTITION OF fail: the default
+    partition is then detached, the rows moved and the partition
+    re-attached, all in the caller's transaction (which locks workout
+    meanwhile). Returns the number of rows moved.
+    """
+    if conn.execute(db.text(f"SELECT to_regclass('workout_y{year}')")).scalar() is not None:
+        return 0
+    bounds = {"low": dt_date(year, 1, 1), "high": dt_date(year + 1, 1, 1)}
+    in_year = "date >= :low AND date < :high"
+    stray = conn.execute(db.text(f"SELECT COUNT(*) FROM workout_default WHERE {in_year}"), bounds).scalar()
+    create = (f"CREATE TABLE workout_y{year} PARTITION OF workout "
+              f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')")
+    if not stray:
+        conn.execute(db.text(create))
+        return 0
+    conn.execute(db.text("ALTER TABLE workout DETACH PARTITION workout_default"))
+    conn.execute(db.text(create))
+    conn.execute(db.text(f"INSERT INTO workout_y{year} SELECT * FROM workout_default WHERE {in_year}"), bounds)
+    conn.execute(db.text(f"DELETE FROM workout_default WHERE {in_year}"), bounds)
+    conn.execute(db.text("ALTER TABLE workout ATTACH PARTITION workout_default DEFAULT"))
+    return stray
+
+
+@app.cli.command("init-shards")
+def init_shards():
+    """Give each shard its id range and list existing users in user_directory."""
+    if not shard_router.enabled:
+        raise click.ClickException("SHARD_URLS is not set.")
+    for name in shard_router.names:
+        engine = _shard_engine(name)
+        missing = [t for t in SHARDED_TABLES if not sa.inspect(engine).has_table(t)]
+        if missing:
+            raise click.ClickException(
+                f"shard {name} has no {', '.join(missing)} table: "
+                "run 'flask db upgrade' with DATABASE_URL set to its url first.")
+        bounds = shard_router.id_bounds(name)
+        if bounds is not None and engine.dialect.name == "postgresql":
+            # ids already inside the range are kept, the sequence continues after them
+            with engine.begin() as conn:
+                for table in ("exercise", "workout"):
+                    conn.execute(db.text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), GREATEST(:low, "
+                        f"(SELECT MAX(id) FROM {table} WHERE id > :low AND id <= :high)) + 1, false)"
+                    ), {"low": bounds[0], "high": bounds[1]})
+            click.echo(f"{name}: ids ({bounds[0]}, {bounds[1]}]")
+        elif bounds is not None:
+            click.echo(f"{name}: no id ranges on {engine.dialect.name}, moved rows keep ids only "
+                       "where they don't collide")
+
+        with engine.connect() as conn:
+            users = conn.execute(db.text('SELECT id, username FROM "user"')).all()
+        listed = sum(user_directory.add(user_id, username, name) for user_id, username in users)
+        click.echo(f"{name}: {listed} users added to user_directory")
+
+    if db.engine.dialect.name == "postgresql":
+        # new user ids must follow the ones listed above
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('user_directory', 'user_id'), "
+            "(SELECT COALESCE(MAX(user_id), 0) + 1 FROM user_directory), false)"))
+        db.session.commit()
+
+
+# a user's rows, parents first
+USER_TABLES = [(User.__table__, "id"), (Exercise.__table__, "user_id"), (Workout.__table__, "user_id")]
+
+
+class LeftoverShardRows(click.ClickException):
+    """The user was moved, but their rows on the old shard are still there."""
+
+
+def moveUser(user_id, target):
+    """
+    Copies the user's rows to the target shard, points user_directory at it
+    and deletes them from the old shard. With SHARD_ROUTING=directory the
+    user gets 503s for about SHARD_DIRECTORY_TTL seconds (until every router
+    stopped using the cached old shard) plus the copy; any failure leaves the
+    user on the old shard. With hash routing services must be stopped.
+    Returns {table: rows copied}, None if the user already is on target.
+    """
+    location = user_directory.locate(user_id)
+    if location is None:
+        raise click.ClickException(f"user {user_id} isn't in user_directory, run 'flask init-shards'")
+    source = location[0] or shard_router.place(user_id)
+    if source == target:
+        return None
+
+    user_directory.set_shard(user_id, source, moving=True)
+    shard_router.forget(user_id)
+    try:
+        if shard_router.scheme == "directory":
+            time.sleep(SHARD_DIRECTORY_TTL)
+        with _shard_engine(source).connect() as conn:
+            if conn.execute(sa.select(User.id).where(User.id == user_id)).first() is None:
+                raise click.ClickException(f"user {user_id} isn't on {source}, user_directory is out of date")
+        # stats dedupes by (shard, event id): everything from the old shard goes first
+        relay = outbox_relays[source]
+        relay.drain()
+        if relay.backlog(user_id)[0]:
+            raise click.ClickException(f"user {user_id} has undelivered events on {source}, is stats up?")
+
+        def announce(conn):
+            if conn.dialect.name == "postgresql" and shard_router.id_bounds(target) is None:
+                # without id ranges the copied ids may be ahead of the target's sequences
+                for table in ("exercise", "workout"):
+                    conn.execute(db.text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), GREATEST("
+                        f"(SELECT COALESCE(MAX(id), 0) FROM {table}), COALESCE(pg_sequence_last_value("
+                        f"pg_get_serial_sequence('{table}', 'id')::regclass), 0), 1))"))
+            # published from the new shard once the rows are there; stats rebuilds the records
+            conn.execute(OutboxEvent.__table__.insert().values(
+                event_type="user.moved", user_id=user_id, created_at=time.time(),
+                payload=json.dumps({"user_id": user_id, "from": source, "to": target})))
+
+        copied = copy_user_rows(_shard_engine(source), _shard_engine(target), USER_TABLES,
+                                user_id, in_transaction=announce)
+    except BaseException:
+        user_directory.set_shard(user_id, source)
+        raise
+    user_directory.set_shard(user_id, target)
+    shard_router.forget(user_id)
+    exercise_catalog.invalidate(user_id)
+    try:
+        deleteMovedRows(user_id, source)
+    except Exception as e:
+        app.logger.exception("user %s moved to %s, deleting the rows on %s failed", user_id, target, source)
+        raise LeftoverShardRows(
+            f"user {user_id} is on {target} now, but deleting their old rows on {source} failed ({e}); "
+            "run 'flask clean-shards' to retry")
+    return copied
+
+
+def deleteMovedRows(user_id, shard):
+    # the old copy of a moved user; the outbox goes too, its events were delivered before the move
+    delete_user_rows(_shard_engine(shard), USER_TABLES + [(OutboxEvent.__table__, "user_id")], user_id)
+
+
+@app.cli.command("move-user")
+@click.argument("user_id", type=int)
+@click.argument("shard")
+def move_user(user_id, shard):
+    """Move one user's exercises and workouts to another shard."""
+    if shard not in shard_router.names:
+        raise click.ClickException(f"unknown shard {shard!r}, SHARD_URLS has {', '.join(shard_router.names)}")
+    if shard_router.scheme == "hash" and shard != shard_router.place(user_id):
+        raise click.ClickException(
+            f"with SHARD_ROUTING=hash user {user_id} belongs on {shard_router.place(user_id)}")
+    try:
+        copied = moveUser(user_id, shard)
+    except IntegrityError as e:
+        raise click.ClickException(f"ids collide on {shard}, nothing moved ({e.orig})")
+    if copied is None:
+        click.echo(f"user {user_id} already is on {shard}.")
+        return
+    click.echo(f"user {user_id} -> {shard}: " + ", ".join(f"{n} {t}" for t, n in copied.items()))
+
+
+@app.cli.command("rebalance-shards")
+@click.option("--dry-run", is_flag=True, help="Only list the moves.")
+def rebalance_shards(dry_run):
+    """Move every user whose rows aren't on their hash-ring shard (after adding shards)."""
+    moves = [(user_id, shard, shard_router.place(user_id)) for user_id, shard in user_directory.users()
+             if shard != shard_router.place(user_id)]
+    for user_id, source, target in moves:
+        click.echo(f"user {user_id}: {source} -> {target}")
+        if not dry_run:
+            try:
+                moveUser(user_id, target)
+            except IntegrityError as e:
+                click.echo(f"  ids collide on {target}, user {user_id} stays on {source} ({e.orig})")
+            except LeftoverShardRows as e:
+                click.echo(f"  {e.message}")
+    click.echo(f"{len(moves)} users {'to move' if dry_run else 'moved'}")
+
+
+@app.cli.command("clean-shards")
+@click.option("--dry-run", is_flag=True, help="Only list the leftover rows.")
+def clean_shards(dry_run):
+    """Delete rows of moved users that are still on their old shard."""
+    if not shard_router.enabled:
+        raise click.ClickException("SHARD_URLS is not set.")
+    leftovers = 0
+    for name in shard_router.names:
+        with _shard_engine(name).connect() as conn:
+            user_ids = conn.execute(sa.select(User.id)).scalars().all()
+        for user_id in user_ids:
+            location = user_directory.locate(user_id)
+            # unlisted (init-shards not run) and moving users are left alone
+            if location is None or location[1]:
+                continue
+            home = location[0] or shard_router.place(user_id)
+            if home == name:
+                continue
+            with _shard_engine(home).connect() as conn:
+                if conn.execute(sa.select(User.id).where(User.id == user_id)).first() is None:
+                    click.echo(f"user {user_id}: listed on {home} but only found on {name}, kept")
+                    continue
+            leftovers += 1
+            click.echo(f"user {user_id}: leftover rows on {name} (moved to {home})")
+            if not dry_run:
+                deleteMovedRows(user_id, name)
+    click.echo(f"{leftovers} leftover users {'found' if dry_run else 'deleted'}")
+
+
+@app.cli.command("benchmark-startup")
+@click.option("--runs", default=5, show_default=True)
+@click.option("--debug/--no-debug", default=False, show_default=True,
+              help="With the debug reloader, which imports the app twice.")
+def benchmark_startup(runs, debug):
+    """Time from `python app.py` to the first healthy /health response."""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), FLASK_DEBUG="1" if debug else "0",
+               OUTBOX_RELAY_INTERVAL="0")
+    env.pop("FLASK_RUN_FROM_CLI", None)
+    timings = sorted(
+        time_to_healthy([sys.executable, "app.py"], f"http://127.0.0.1:{port}/health",
+                        env=env, cwd=app.root_path)
+        for _ in range(runs))
+    click.echo(f"time to healthy over {runs} runs: min {timings[0]:.3f}s, "
+               f"median {timings[len(timings) // 2]:.3f}s, max {timings[-1]:.3f}s")
+
+
+APP_STARTUP.labels(SERVICE_NAME, "import").set(time.perf_counter() - STARTED_AT)
+
 if __name__ == '__main__':
     # with app.app_context():
     #     db.create_all()
     # seedDB()
-    app.run(host='0.0.0.0', port=25590, debug=True)
+    # with the debug reloader only the serving child process runs the relay
+    if not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_outbox_relay()
+        start_warm_up()
+    if DEBUG:
+        app.run(host='0.0.0.0', port=PORT, debug=True)
+    else:
+        # SIGTERM drains in-flight requests before serve_forever() returns
+        server = make_server('0.0.0.0', PORT, app, threaded=True)
+        drain.install(server)
+        server.serve_forever()
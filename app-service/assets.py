@@ -0,0 +1,120 @@
+from flask import Blueprint, request, send_file, abort
+import mimetypes
+import threading
+import hashlib
+import gzip
+import os
+
+
+# a year: fingerprinted URLs change whenever their content does
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".html")
+
+
+def _digest(path, length):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:length]
+
+
+def _fingerprinted(name, digest):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{digest}{ext}"
+
+
+class AssetManifest:
+    """
+    Content-hashed URLs for the files in folder: url("js/base.js") is
+    /assets/js/base.<hash>.js, served with a far-future immutable
+    Cache-Control, and as its precompressed .gz twin (see compress()) to
+    clients accepting gzip. With reload, a file edited while running gets
+    a new hash on its next url() instead of at the next start.
+    """
+
+    def __init__(self, folder, url_prefix="/assets", hash_length=10, reload=False):
+        self.folder = folder
+        self.url_prefix = url_prefix
+        self.hash_length = hash_length
+        self.reload = reload
+        self._entries = {}   # name -> (mtime, fingerprinted name)
+        self._names = {}     # fingerprinted name -> name
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        blueprint = Blueprint("assets", __name__)
+        blueprint.add_url_rule(f"{self.url_prefix}/<path:filename>", "asset", self.serve)
+        app.register_blueprint(blueprint)
+        app.jinja_env.globals["asset_url"] = self.url
+
+    def _entry(self, name):
+        path = os.path.join(self.folder, name)
+        mtime = os.stat(path).st_mtime
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and (not self.reload or entry[0] == mtime):
+                return entry[1]
+        hashed = _fingerprinted(name, _digest(path, self.hash_length))
+        with self._lock:
+            self._entries[name] = (mtime, hashed)
+            self._names[hashed] = name
+        return hashed
+
+    def url(self, name):
+        return f"{self.url_prefix}/{self._entry(name)}"
+
+    def files(self):
+        for root, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                if not filename.endswith(".gz"):
+                    yield os.path.relpath(os.path.join(root, filename), self.folder)
+
+    def resolve(self, hashed):
+        # fingerprinted name -> file name, None for an unknown or outdated hash
+        with self._lock:
+            name = self._names.get(hashed)
+        if name is None:
+            # not looked up through url() yet in this process (another replica rendered the page)
+            for candidate in self.files():
+                if self._entry(candidate) == hashed:
+                    return candidate
+            return None
+        if self.reload and self._entry(name) != hashed:
+            return None
+        return name
+
+    def serve(self, filename):
+        name = self.resolve(filename)
+        if name is None:
+            abort(404)
+        path = os.path.join(self.folder, name)
+        mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        compressed = path + ".gz"
+        use_gzip = ("gzip" in request.accept_encodings and os.path.exists(compressed)
+                    and os.stat(compressed).st_mtime >= os.stat(path).st_mtime)
+        response = send_file(compressed if use_gzip else path, mimetype=mimetype,
+                             max_age=IMMUTABLE_MAX_AGE, conditional=True)
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def compress(self, min_size=256):
+        """
+        Writes name.gz next to each text asset of at least min_size bytes, when
+        that is smaller. Returns [(name, size, compressed size)].
+        """
+        written = []
+        for name in sorted(self.files()):
+            path = os.path.join(self.folder, name)
+            if not name.endswith(COMPRESSIBLE) or os.path.getsize(path) < min_size:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            # mtime=0: the same input always gives the same bytes
+            packed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(packed) < len(data):
+                with open(path + ".gz", "wb") as f:
+                    f.write(packed)
+                written.append((name, len(data), len(packed)))
+        return written
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class ExerciseCatalogCache:
+    """
+    In-process cache of each user's exercise catalog, indexed by id and by
+    name. Users are LRU-evicted past max_users; entries older than ttl are
+    reloaded so writes made by other replicas show up eventually.
+    """
+
+    def __init__(self, loader, max_users=1000, ttl=300, on_event=None):
+        self.loader = loader
+        self.max_users = max_users
+        self.ttl = ttl
+        self._on_event = on_event or (lambda event: None)
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _catalog(self, user_id):
+        with self._lock:
+            catalog = self._users.get(user_id)
+            if catalog is not None and time.monotonic() - catalog["loaded_at"] < self.ttl:
+                self._users.move_to_end(user_id)
+                self._on_event("hit")
+                return catalog
+        self._on_event("miss")
+        catalog = self._index(self.loader(user_id))
+        with self._lock:
+            self._store(user_id, catalog)
+        return catalog
+
+    def _index(self, exercises):
+        return {
+            "by_id": {e["id"]: e for e in exercises},
+            "by_name": {e["name"]: e for e in exercises},
+            "loaded_at": time.monotonic()
+        }
+
+    def _store(self, user_id, catalog):
+        self._users[user_id] = catalog
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+            self._on_event("eviction")
+
+    def all(self, user_id):
+        return list(self._catalog(user_id)["by_id"].values())
+
+    def by_id(self, user_id, exercise_id):
+        return self._catalog(user_id)["by_id"].get(exercise_id)
+
+    def by_name(self, user_id, name):
+        return self._catalog(user_id)["by_name"].get(name)
+
+    def put(self, exercise):
+        # write-through; users that aren't cached yet are loaded lazily later
+        with self._lock:
+            catalog = self._users.get(exercise["user_id"])
+            if catalog is None:
+                return
+            catalog["by_id"][exercise["id"]] = exercise
+            catalog["by_name"][exercise["name"]] = exercise
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
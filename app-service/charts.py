@@ -0,0 +1,158 @@
+from markupsafe import Markup, escape
+import math
+
+
+# same geometry as the charts the stats page used to draw with D3
+WIDTH = 1500
+HEIGHT = 200
+MARGIN_TOP = 20
+MARGIN_RIGHT = 20
+MARGIN_BOTTOM = 60
+MARGIN_LEFT = 40
+
+
+def _fmt(value):
+    # 2 decimals at most, no trailing zeros: 80 -> "80", 82.5 -> "82.5"
+    return f"{round(value, 2):g}"
+
+
+def tick_step(max_value, count):
+    # d3's tickIncrement: 1, 2 or 5 times a power of ten
+    step = max_value / count
+    power = 10 ** math.floor(math.log10(step))
+    error = step / power
+    if error >= math.sqrt(50):
+        return 10 * power
+    if error >= math.sqrt(10):
+        return 5 * power
+    if error >= math.sqrt(2):
+        return 2 * power
+    return power
+
+
+def ticks(max_value, count=5, integer=False):
+    """(ticks from 0, domain top): the top is max_value rounded up to a tick."""
+    if max_value <= 0:
+        return [0], 1
+    step = tick_step(max_value, count)
+    if integer:
+        step = max(step, 1)
+    top = math.ceil(max_value / step) * step
+    n = int(round(top / step))
+    return [round(i * step, 10) for i in range(n + 1)], top
+
+
+def _svg(body, label):
+    return Markup(
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+        f'viewBox="0 0 {WIDTH} {HEIGHT}" style="max-width: 100%; height: auto;" '
+        f'role="img" aria-label="{escape(label)}" font-family="sans-serif" font-size="10">'
+        f'{"".join(body)}</svg>'
+    )
+
+
+def _y_axis(tick_values, y, domain_line=True):
+    body = ['<g text-anchor="end">']
+    if domain_line:
+        body.append(f'<line x1="{MARGIN_LEFT}" x2="{MARGIN_LEFT}" y1="{MARGIN_TOP}" '
+                    f'y2="{HEIGHT - MARGIN_BOTTOM}" stroke="currentColor"/>')
+    for value in tick_values:
+        ty = round(y(value), 2)
+        body.append(f'<line x1="{MARGIN_LEFT - 6}" x2="{MARGIN_LEFT}" y1="{ty}" y2="{ty}" '
+                    f'stroke="currentColor"/>'
+                    f'<text x="{MARGIN_LEFT - 9}" y="{ty}" dy="0.32em" fill="currentColor">'
+                    f'{_fmt(value)}</text>')
+    body.append('</g>')
+    return body
+
+
+def bar_chart(labels, values, label=""):
+    """Vertical bars with their value on top, one band per label."""
+    tick_values, top = ticks(max(values, default=0), integer=True)
+    bottom = HEIGHT - MARGIN_BOTTOM
+
+    def y(value):
+        return bottom - (bottom - MARGIN_TOP) * value / top
+
+    # d3.scaleBand().padding(0.1)
+    padding = 0.1
+    span = WIDTH - MARGIN_RIGHT - MARGIN_LEFT
+    step = span / max(1, len(labels) - padding + 2 * padding)
+    start = MARGIN_LEFT + (span - step * (len(labels) - padding)) / 2
+    band = step * (1 - padding)
+
+    body = ['<g fill="#d0dbd1">']
+    for i, value in enumerate(values):
+        x = round(start + i * step, 2)
+        body.append(f'<rect x="{x}" y="{round(y(value), 2)}" width="{round(band, 2)}" '
+                    f'height="{round(bottom - y(value), 2)}"/>')
+    body.append('</g>')
+    body.append(f'<g text-anchor="middle"><line x1="{MARGIN_LEFT}" x2="{WIDTH - MARGIN_RIGHT}" '
+                f'y1="{bottom}" y2="{bottom}" stroke="currentColor"/>')
+    for i, name in enumerate(labels):
+        cx = round(start + i * step + band / 2, 2)
+        body.append(f'<line x1="{cx}" x2="{cx}" y1="{bottom}" y2="{bottom + 6}" stroke="currentColor"/>'
+                    f'<text x="{cx}" y="{bottom + 9}" dy="0.71em" fill="currentColor">{escape(name)}</text>')
+    body.append('</g>')
+    body.extend(_y_axis(tick_values, y, domain_line=False))
+    body.append('<g text-anchor="middle" fill="#333">')
+    for i, value in enumerate(values):
+        cx = round(start + i * step + band / 2, 2)
+        body.append(f'<text x="{cx}" y="{round(y(value) - 5, 2)}">{_fmt(value)}</text>')
+    body.append('</g>')
+    return _svg(body, label)
+
+
+def _catmull_rom(points):
+    # uniform Catmull-Rom through the points as cubic Bezier segments
+    path = [f"M{points[0][0]},{points[0][1]}"]
+    for i in range(len(points) - 1):
+        p0 = points[max(i - 1, 0)]
+        p1, p2 = points[i], points[i + 1]
+        p3 = points[min(i + 2, len(points) - 1)]
+        c1 = (round(p1[0] + (p2[0] - p0[0]) / 6, 2), round(p1[1] + (p2[1] - p0[1]) / 6, 2))
+        c2 = (round(p2[0] - (p3[0] - p1[0]) / 6, 2), round(p2[1] - (p3[1] - p1[1]) / 6, 2))
+        path.append(f"C{c1[0]},{c1[1]},{c2[0]},{c2[1]},{p2[0]},{p2[1]}")
+    return "".join(path)
+
+
+def line_chart(series, label="", empty_text=""):
+    """
+    series: [(date, value)] in order, drawn at evenly spaced x positions;
+    the largest value is marked red and labelled, every point has a tooltip.
+    """
+    bottom = HEIGHT - MARGIN_BOTTOM
+    body = [f'<line x1="{MARGIN_LEFT}" x2="{WIDTH - MARGIN_RIGHT}" y1="{bottom}" y2="{bottom}" '
+            f'stroke="green"/>']
+    if not series:
+        body.append(f'<text x="{WIDTH / 2}" y="{(MARGIN_TOP + bottom) / 2}" text-anchor="middle" '
+                    f'font-size="14" fill="currentColor">{escape(empty_text)}</text>')
+        return _svg(body, label)
+
+    best = max(value for _, value in series)
+    top = best if best > 0 else 1
+    tick_values, _ = ticks(top)
+    tick_values = [v for v in tick_values if v <= top]
+
+    def x(i):
+        if len(series) == 1:
+            return (MARGIN_LEFT + WIDTH - MARGIN_RIGHT) / 2
+        return MARGIN_LEFT + (WIDTH - MARGIN_RIGHT - MARGIN_LEFT) * i / (len(series) - 1)
+
+    def y(value):
+        return bottom - (bottom - MARGIN_TOP) * value / top
+
+    points = [(round(x(i), 2), round(y(value), 2)) for i, (_, value) in enumerate(series)]
+    body.extend(_y_axis(tick_values, y))
+    body.append(f'<path d="{_catmull_rom(points)}" fill="none" stroke="blue" stroke-width="1.5"/>')
+    body.append('<g stroke="black" stroke-width="1.5">')
+    for (day, value), (px, py) in zip(series, points):
+        peak = value == best
+        body.append(f'<circle cx="{px}" cy="{py}" r="{6 if peak else 3}" '
+                    f'fill="{"red" if peak else "white"}">'
+                    f'<title>Date: {escape(str(day))}\nMax Weight: {_fmt(value)} kg</title></circle>')
+    body.append('</g>')
+    peak_x, peak_y = points[[value for _, value in series].index(best)]
+    body.append(f'<text x="{peak_x + 10}" y="{peak_y - 10}" fill="red" font-size="12" '
+                f'font-weight="bold">{_fmt(best)} kg</text>')
+    return _svg(body, label)
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+import threading
+
+
+class FragmentCache:
+    """
+    Rendered page fragments (SVG charts, calendar grids) in an LRU. Callers
+    put a data version into the key: a write changes the version, so a stale
+    entry is never read again and just ages out; nothing is invalidated
+    explicitly, which also keeps replicas from serving each other's stale
+    fragments.
+    """
+
+    def __init__(self, max_entries=2000, on_event=None):
+        self.max_entries = max_entries
+        self._on_event = on_event or (lambda kind, event: None)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind, key, render):
+        # render() runs outside the lock; two misses for one key both render
+        key = (kind,) + tuple(key)
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+        if fragment is not None:
+            self._on_event(kind, "hit")
+            return fragment
+        self._on_event(kind, "miss")
+        fragment = render()
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,182 @@
+from datetime import date
+import unicodedata
+import codecs
+import math
+import json
+import csv
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+CHUNK_SIZE = 64 * 1024
+# a CSV line longer than this is refused instead of buffered
+MAX_LINE_BYTES = 1024 * 1024
+TRUE_VALUES = ("1", "true", "yes", "y", "on")
+
+
+def _split(value):
+    # "5;5;5" / "5,5,5" / [5, 5, 5] / 5
+    if value is None or value == "":
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if isinstance(value, (int, float)):
+        return [value]
+    return [v for v in str(value).replace(",", ";").split(";") if v.strip()]
+
+
+def normalize_record(record, date_range=None):
+    """
+    One CSV row / JSON object -> (date, exercise, reps, weights, is_bodyweight).
+    Accepts either one set per record (reps=5, weight=100) or lists
+    ("5;5;5" in CSV, [5, 5, 5] in JSON). date_range: (first, last) allowed date.
+    """
+    try:
+        raw_date = str(record.get("date") or "").strip()
+        day = date.fromisoformat(raw_date[:10])
+    except ValueError:
+        raise ImportRowError(f"invalid date {record.get('date')!r}")
+    if date_range is not None and not date_range[0] <= day <= date_range[1]:
+        raise ImportRowError(f"date must be between {date_range[0]} and {date_range[1]}")
+    name = " ".join(str(record.get("exercise") or "").split())
+    if not name:
+        raise ImportRowError("exercise is required")
+    if len(name) > 50:
+        raise ImportRowError("exercise name longer than 50 characters")
+    # NUL and other control characters (or lone surrogates) can't be stored in Postgres text
+    if any(unicodedata.category(c) in ("Cc", "Cs") for c in name):
+        raise ImportRowError("exercise name contains control characters")
+
+    try:
+        reps = [float(r) for r in _split(record.get("reps"))]
+        weights = [float(w) for w in _split(
+            record.get("weights", record.get("weight", record.get("extra_weight"))))]
+    except (TypeError, ValueError):
+        raise ImportRowError("reps and weights must be numbers")
+    if not all(math.isfinite(v) for v in reps + weights):
+        raise ImportRowError("reps and weights must be finite numbers")
+    reps = [int(r) for r in reps]
+    if not reps:
+        raise ImportRowError("reps are required")
+    if not weights:
+        weights = [0.0] * len(reps)
+    elif len(weights) == 1 and len(reps) > 1:
+        weights = weights * len(reps)
+    if len(weights) != len(reps):
+        raise ImportRowError("reps and weights have different lengths")
+
+    bodyweight = record.get("bodyweight", record.get("is_bodyweight", False))
+    if not isinstance(bodyweight, bool):
+        bodyweight = str(bodyweight).strip().lower() in TRUE_VALUES
+    return day, name, reps, weights, bodyweight
+
+
+def iter_csv(stream):
+    """Yields (line number, row dict); header names are lower-cased."""
+    reader = csv.reader(codecs.iterdecode(_lines(stream), "utf-8-sig"))
+    header = None
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # e.g. a field over csv.field_size_limit(); the rest can't be trusted
+            raise ImportRowError(f"invalid CSV at line {reader.line_num}: {e}")
+        if header is None:
+            header = [h.strip().lower() for h in row]
+            continue
+        if not any(cell.strip() for cell in row):
+            continue
+        yield reader.line_num, dict(zip(header, row))
+
+
+def _lines(stream):
+    # binary lines without reading the whole stream
+    pending = b""
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+        if len(pending) > MAX_LINE_BYTES:
+            raise ImportRowError(f"line longer than {MAX_LINE_BYTES} bytes")
+    if pending:
+        yield pending
+
+
+def _cut_off(error, buffer):
+    # a string still open at the end of the buffer, or an error within the
+    # last few characters (a literal or number not complete yet)
+    return error.msg.startswith("Unterminated string") or error.pos >= len(buffer) - 32
+
+
+def iter_json(stream):
+    """
+    Yields (object number, dict) from a top-level JSON array or from JSON
+    lines, decoding one object at a time from fixed-size chunks.
+    """
+    decoder = json.JSONDecoder()
+    decode_chunk = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    position = 0
+    count = 0
+    eof = False
+    while True:
+        # skip separators between objects
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+        if position < len(buffer):
+            try:
+                obj, end = decoder.raw_decode(buffer, position)
+                decoded = True
+            except json.JSONDecodeError as e:
+                # read on only if the object may just be cut off by the chunk end
+                if eof or not _cut_off(e, buffer):
+                    raise ImportRowError(f"invalid JSON after object {count}")
+                decoded = False
+            if decoded:
+                count += 1
+                position = end
+                if not isinstance(obj, dict):
+                    raise ImportRowError(f"item {count} is not an object")
+                yield count, obj
+                continue
+        elif eof:
+            return
+        chunk = stream.read(CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + decode_chunk.decode(chunk or b"", final=eof)
+        position = 0
+
+
+def group_workouts(records, date_range=None):
+    """
+    Merges consecutive records for the same (date, exercise) into one workout,
+    so per-set exports (one row per set) become one workout per exercise and day.
+    Yields (first line, workout dict) or (line, ImportRowError).
+    """
+    current = None
+    current_line = None
+    for line, record in records:
+        try:
+            day, name, reps, weights, bodyweight = normalize_record(record, date_range)
+        except ImportRowError as e:
+            yield line, e
+            continue
+        if current is not None and current["date"] == day and current["exercise"] == name:
+            current["reps"].extend(reps)
+            current["weights"].extend(weights)
+            continue
+        if current is not None:
+            yield current_line, current
+        current = {"date": day, "exercise": name, "reps": reps,
+                   "weights": weights, "is_bodyweight": bodyweight}
+        current_line = line
+    if current is not None:
+        yield current_line, current
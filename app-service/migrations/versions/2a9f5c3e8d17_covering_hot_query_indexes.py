@@ -0,0 +1,95 @@
+"""covering hot query indexes
+
+Revision ID: 2a9f5c3e8d17
+Revises: 8e4b2c6d1a93
+Create Date: 2026-10-19 23:41:37.052918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a9f5c3e8d17'
+down_revision = '8e4b2c6d1a93'
+branch_labels = None
+depends_on = None
+
+
+# (index, table, key columns, included columns): the calendar month version
+# and the exercise catalog load become index-only scans. The (user_id,
+# exercise_id) index stays as it is: its queries read the pickled reps /
+# extra_weight, which would roughly double the index size.
+INDEXES = [
+    ('ix_workout_user_id_date', 'workout', ['user_id', 'date'], ['version', 'id']),
+    ('ix_exercise_user_id_name', 'exercise', ['user_id', 'name'], ['id']),
+]
+
+
+def _partitions(table):
+    rows = op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"), {"table": table})
+    return [row[0] for row in rows]
+
+
+def _is_partitioned(table):
+    return op.get_bind().execute(sa.text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": table}).scalar() == 'p'
+
+
+def _swap(name, table, columns, included):
+    # the new index is built next to the old one without blocking writes and
+    # renamed into place; a run that failed half way leaves invalid *_new
+    # indexes behind, dropped first
+    spec = f"({', '.join(columns)})"
+    if included:
+        spec += f" INCLUDE ({', '.join(included)})"
+    new = f"{name}_new"
+
+    if not _is_partitioned(table):
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new}")
+        op.execute(f"CREATE INDEX CONCURRENTLY {new} ON {table} {spec}")
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        op.execute(f"ALTER INDEX {new} RENAME TO {name}")
+        return
+
+    # partitioned tables can't be indexed CONCURRENTLY: an index ON ONLY the
+    # parent stays invalid until every partition's index, each built
+    # concurrently, is attached to it. Dropping the old parent index (and
+    # with it the partitions') only takes a brief catalog lock.
+    partitions = _partitions(table)
+    suffix = name[len(f"ix_{table}"):]
+    op.execute(f"DROP INDEX IF EXISTS {new}")
+    for partition in partitions:
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS ix_{partition}{suffix}_new")
+    op.execute(f"CREATE INDEX {new} ON ONLY {table} {spec}")
+    for partition in partitions:
+        child = f"ix_{partition}{suffix}"
+        op.execute(f"CREATE INDEX CONCURRENTLY {child}_new ON {partition} {spec}")
+        op.execute(f"ALTER INDEX {new} ATTACH PARTITION {child}_new")
+    op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute(f"ALTER INDEX {new} RENAME TO {name}")
+    for partition in partitions:
+        child = f"ix_{partition}{suffix}"
+        op.execute(f"ALTER INDEX {child}_new RENAME TO {child}")
+
+
+def _recreate(include):
+    # INCLUDE is Postgres only
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    if op.get_context().as_sql:
+        raise RuntimeError("2a9f5c3e8d17 lists workout's partitions, run it online")
+    with op.get_context().autocommit_block():
+        for name, table, columns, included in INDEXES:
+            _swap(name, table, columns, included if include else [])
+
+
+def upgrade():
+    _recreate(include=True)
+
+
+def downgrade():
+    _recreate(include=False)
@@ -0,0 +1,46 @@
+"""stats personal records
+
+Revision ID: 3d9c6b2f1a85
+Revises: e81b4f0a9c27
+Create Date: 2026-10-19 14:22:08.517390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9c6b2f1a85'
+down_revision = 'e81b4f0a9c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # read model owned by the stats service; filled lazily or by
+    # `flask backfill-records` in the stats container
+    op.create_table('stats_personal_record',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('exercise_id', sa.Integer(), nullable=False),
+    sa.Column('best_weight', sa.Float(), nullable=True),
+    sa.Column('best_weight_reps', sa.Integer(), nullable=True),
+    sa.Column('best_weight_date', sa.Date(), nullable=True),
+    sa.Column('best_e1rm', sa.Float(), nullable=True),
+    sa.Column('best_e1rm_date', sa.Date(), nullable=True),
+    sa.Column('best_tonnage', sa.Float(), nullable=True),
+    sa.Column('best_tonnage_date', sa.Date(), nullable=True),
+    sa.Column('reps_at_weight', sa.Text(), nullable=True),
+    sa.Column('last_session_date', sa.Date(), nullable=True),
+    sa.Column('last_session_tonnage', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('user_id', 'exercise_id')
+    )
+    op.create_table('stats_record_watermark',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('last_workout_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('stats_record_watermark')
+    op.drop_table('stats_personal_record')
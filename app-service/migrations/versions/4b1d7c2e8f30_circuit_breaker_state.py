@@ -0,0 +1,33 @@
+"""circuit breaker state
+
+Revision ID: 4b1d7c2e8f30
+Revises: 9e606950de55
+Create Date: 2026-10-19 10:12:31.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1d7c2e8f30'
+down_revision = '9e606950de55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('circuit_breaker',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('state', sa.String(length=16), nullable=False),
+    sa.Column('fail_counter', sa.Integer(), nullable=False),
+    sa.Column('success_counter', sa.Integer(), nullable=False),
+    sa.Column('opened_at', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.Float(), nullable=True),
+    sa.Column('updated_by', sa.String(length=255), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('circuit_breaker')
@@ -0,0 +1,39 @@
+"""stats quantile sketch
+
+Revision ID: 5f2b8d7e4c19
+Revises: a47e0c93b1d6
+Create Date: 2026-10-19 15:48:26.309412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f2b8d7e4c19'
+down_revision = 'a47e0c93b1d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # per exercise name t-digests of the stats service, and how far into
+    # the workout table they have been built
+    op.create_table('stats_quantile_sketch',
+    sa.Column('exercise_name', sa.String(length=50), nullable=False),
+    sa.Column('metric', sa.String(length=16), nullable=False),
+    sa.Column('digest', sa.Text(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('exercise_name', 'metric')
+    )
+    op.create_table('stats_ingest_watermark',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('last_workout_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('stats_ingest_watermark')
+    op.drop_table('stats_quantile_sketch')
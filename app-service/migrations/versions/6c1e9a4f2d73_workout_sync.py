@@ -0,0 +1,51 @@
+"""workout sync versions and client ids
+
+Revision ID: 6c1e9a4f2d73
+Revises: b93d1f6a2e58
+Create Date: 2026-10-19 18:24:09.530817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1e9a4f2d73'
+down_revision = 'b93d1f6a2e58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sync_version', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('exercise', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=True))
+    with op.batch_alter_table('workout', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('client_id', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=True))
+
+    # existing rows all become version 1, returned by a first (cursor "0") sync
+    op.execute('UPDATE "user" SET sync_version = 1')
+    op.execute('UPDATE exercise SET version = 1')
+    op.execute('UPDATE workout SET version = 1')
+
+    with op.batch_alter_table('exercise', schema=None) as batch_op:
+        batch_op.alter_column('version', existing_type=sa.Integer(), nullable=False)
+    with op.batch_alter_table('workout', schema=None) as batch_op:
+        batch_op.alter_column('version', existing_type=sa.Integer(), nullable=False)
+        # includes date: on Postgres workout is partitioned by it
+        batch_op.create_unique_constraint('uix_workout_user_client', ['user_id', 'client_id', 'date'])
+        batch_op.create_index('ix_workout_user_id_version', ['user_id', 'version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('workout', schema=None) as batch_op:
+        batch_op.drop_index('ix_workout_user_id_version')
+        batch_op.drop_constraint('uix_workout_user_client', type_='unique')
+        batch_op.drop_column('version')
+        batch_op.drop_column('client_id')
+    with op.batch_alter_table('exercise', schema=None) as batch_op:
+        batch_op.drop_column('version')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('sync_version')
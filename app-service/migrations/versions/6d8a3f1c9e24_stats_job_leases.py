@@ -0,0 +1,42 @@
+"""stats job leases, one active job per dedup key
+
+Revision ID: 6d8a3f1c9e24
+Revises: 2a9f5c3e8d17
+Create Date: 2026-10-20 10:12:48.305617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d8a3f1c9e24'
+down_revision = '2a9f5c3e8d17'
+branch_labels = None
+depends_on = None
+
+
+ACTIVE = sa.text("status IN ('queued', 'running')")
+
+
+def upgrade():
+    # bumped by the replica running the job; a stale one means it is gone
+    with op.batch_alter_table('stats_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('heartbeat_at', sa.Float(), nullable=True))
+
+    # replicas could each enqueue the same job: keep the newest active one
+    op.execute(
+        "UPDATE stats_job SET status = 'failed', error = 'duplicate of a newer job' "
+        "WHERE status IN ('queued', 'running') AND EXISTS ("
+        "SELECT 1 FROM stats_job newer WHERE newer.dedup_key = stats_job.dedup_key "
+        "AND newer.status IN ('queued', 'running') "
+        "AND (newer.created_at > stats_job.created_at "
+        "OR (newer.created_at = stats_job.created_at AND newer.id > stats_job.id)))")
+    op.create_index('uix_stats_job_active_dedup_key', 'stats_job', ['dedup_key'], unique=True,
+                    sqlite_where=ACTIVE, postgresql_where=ACTIVE)
+
+
+def downgrade():
+    op.drop_index('uix_stats_job_active_dedup_key', table_name='stats_job')
+    with op.batch_alter_table('stats_job', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
@@ -0,0 +1,34 @@
+"""user session
+
+Revision ID: 7a3f9e1c5d42
+Revises: 4b1d7c2e8f30
+Create Date: 2026-10-19 11:02:48.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3f9e1c5d42'
+down_revision = '4b1d7c2e8f30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_session',
+    sa.Column('sid', sa.String(length=64), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('data', sa.Text(), nullable=False),
+    sa.Column('expires_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('sid')
+    )
+    op.create_index(op.f('ix_user_session_user_id'), 'user_session', ['user_id'], unique=False)
+    op.create_index(op.f('ix_user_session_expires_at'), 'user_session', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_session_expires_at'), table_name='user_session')
+    op.drop_index(op.f('ix_user_session_user_id'), table_name='user_session')
+    op.drop_table('user_session')
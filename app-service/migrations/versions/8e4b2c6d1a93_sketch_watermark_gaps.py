@@ -0,0 +1,27 @@
+"""id gaps behind the sketch watermarks
+
+Revision ID: 8e4b2c6d1a93
+Revises: f3b8a1d6c250
+Create Date: 2026-10-19 23:05:12.418736
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4b2c6d1a93'
+down_revision = 'f3b8a1d6c250'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ids skipped by a sketch scan, re-read once their workouts commit
+    with op.batch_alter_table('stats_ingest_watermark', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('gaps', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('stats_ingest_watermark', schema=None) as batch_op:
+        batch_op.drop_column('gaps')
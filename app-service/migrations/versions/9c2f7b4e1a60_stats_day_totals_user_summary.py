@@ -0,0 +1,44 @@
+"""stats day totals and user summary
+
+Revision ID: 9c2f7b4e1a60
+Revises: 6d8a3f1c9e24
+Create Date: 2026-10-20 11:02:17.640391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2f7b4e1a60'
+down_revision = '6d8a3f1c9e24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # read models of the stats summary, filled from workout.created events
+    # (STATS_INGEST=events) or a records backfill
+    op.create_table('stats_day_totals',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('exercise_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('workouts', sa.Integer(), nullable=False),
+    sa.Column('sets', sa.Integer(), nullable=False),
+    sa.Column('reps', sa.Integer(), nullable=False),
+    sa.Column('tonnage', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'exercise_id', 'date')
+    )
+    op.create_table('stats_user_summary',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('workouts', sa.Integer(), nullable=False),
+    sa.Column('sets', sa.Integer(), nullable=False),
+    sa.Column('reps', sa.Integer(), nullable=False),
+    sa.Column('tonnage', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('stats_user_summary')
+    op.drop_table('stats_day_totals')
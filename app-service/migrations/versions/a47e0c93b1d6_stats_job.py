@@ -0,0 +1,43 @@
+"""stats job
+
+Revision ID: a47e0c93b1d6
+Revises: 3d9c6b2f1a85
+Create Date: 2026-10-19 15:03:44.861025
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a47e0c93b1d6'
+down_revision = '3d9c6b2f1a85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # background jobs of the stats service (JOB_BACKEND=db)
+    op.create_table('stats_job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('dedup_key', sa.String(length=40), nullable=False),
+    sa.Column('type', sa.String(length=50), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('params', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.Float(), nullable=False),
+    sa.Column('started_at', sa.Float(), nullable=True),
+    sa.Column('finished_at', sa.Float(), nullable=True),
+    sa.Column('expires_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stats_job_dedup_key', 'stats_job', ['dedup_key', 'created_at'], unique=False)
+    op.create_index('ix_stats_job_expires_at', 'stats_job', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stats_job_expires_at', table_name='stats_job')
+    op.drop_index('ix_stats_job_dedup_key', table_name='stats_job')
+    op.drop_table('stats_job')
@@ -0,0 +1,46 @@
+"""outbox events
+
+Revision ID: b93d1f6a2e58
+Revises: 5f2b8d7e4c19
+Create Date: 2026-10-19 16:37:52.118046
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b93d1f6a2e58'
+down_revision = '5f2b8d7e4c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(length=50), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.Float(), nullable=False),
+    sa.Column('published_at', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_event_pending', 'outbox_event', ['id'], unique=False,
+                    postgresql_where=sa.text('published_at IS NULL'),
+                    sqlite_where=sa.text('published_at IS NULL'))
+    # event ids the stats service has already applied
+    op.create_table('stats_processed_event',
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(length=50), nullable=False),
+    sa.Column('processed_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+    op.create_index('ix_stats_processed_event_processed_at', 'stats_processed_event', ['processed_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stats_processed_event_processed_at', table_name='stats_processed_event')
+    op.drop_table('stats_processed_event')
+    op.drop_index('ix_outbox_event_pending', table_name='outbox_event')
+    op.drop_table('outbox_event')
@@ -0,0 +1,39 @@
+"""hot query indexes
+
+Revision ID: c5e2a8d1f764
+Revises: 7a3f9e1c5d42
+Create Date: 2026-10-19 12:20:05.771930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e2a8d1f764'
+down_revision = '7a3f9e1c5d42'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_workout_user_id_date', 'workout', ['user_id', 'date']),
+    ('ix_workout_user_id_exercise_id', 'workout', ['user_id', 'exercise_id']),
+    ('ix_exercise_user_id_name', 'exercise', ['user_id', 'name']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction; on Postgres it
+    # builds without locking the table against writes (ignored elsewhere)
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
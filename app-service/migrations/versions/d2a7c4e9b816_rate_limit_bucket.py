@@ -0,0 +1,31 @@
+"""rate limit buckets
+
+Revision ID: d2a7c4e9b816
+Revises: 6c1e9a4f2d73
+Create Date: 2026-10-19 18:41:27.305519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c4e9b816'
+down_revision = '6c1e9a4f2d73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rate_limit_bucket',
+    sa.Column('bucket_key', sa.String(length=128), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket_key')
+    )
+    op.create_index(op.f('ix_rate_limit_bucket_updated_at'), 'rate_limit_bucket', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_rate_limit_bucket_updated_at'), table_name='rate_limit_bucket')
+    op.drop_table('rate_limit_bucket')
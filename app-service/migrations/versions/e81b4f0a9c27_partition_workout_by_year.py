@@ -0,0 +1,106 @@
+"""partition workout by year
+
+Revision ID: e81b4f0a9c27
+Revises: c5e2a8d1f764
+Create Date: 2026-10-19 13:41:17.093264
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81b4f0a9c27'
+down_revision = 'c5e2a8d1f764'
+branch_labels = None
+depends_on = None
+
+
+# partitions created ahead of the current year; `flask create-workout-partitions`
+# keeps extending this
+YEARS_AHEAD = 2
+
+COLUMNS = "id, date, sets, reps, extra_weight, is_bodyweight, exercise_id, user_id"
+
+def _create_workout_table(primary_key, partition_by=""):
+    op.execute(f"""
+        CREATE TABLE workout (
+            id INTEGER NOT NULL DEFAULT nextval('workout_id_seq'),
+            date DATE NOT NULL,
+            sets INTEGER NOT NULL,
+            reps BYTEA NOT NULL,
+            extra_weight BYTEA,
+            is_bodyweight BOOLEAN NOT NULL,
+            exercise_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            CONSTRAINT fk_workout_exercise_id FOREIGN KEY (exercise_id) REFERENCES exercise (id),
+            CONSTRAINT fk_workout_user_id FOREIGN KEY (user_id) REFERENCES "user" (id),
+            CONSTRAINT workout_pkey PRIMARY KEY ({primary_key})
+        ) {partition_by}
+    """)
+
+
+def _drop_workout_indexes():
+    op.execute("DROP INDEX IF EXISTS ix_workout_user_id_date")
+    op.execute("DROP INDEX IF EXISTS ix_workout_user_id_exercise_id")
+
+
+def _create_workout_indexes():
+    op.create_index('ix_workout_user_id_date', 'workout', ['user_id', 'date'], unique=False)
+    op.create_index('ix_workout_user_id_exercise_id', 'workout', ['user_id', 'exercise_id'], unique=False)
+
+
+def upgrade():
+    # Postgres only: SQLite (dev mode) keeps the plain workout table
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    _drop_workout_indexes()
+    op.execute("ALTER TABLE workout RENAME TO workout_unpartitioned")
+    op.execute("ALTER TABLE workout_unpartitioned RENAME CONSTRAINT workout_pkey TO workout_unpartitioned_pkey")
+
+    # the partition key has to be part of the primary key
+    _create_workout_table("id, date", "PARTITION BY RANGE (date)")
+
+    this_year = date.today().year
+    first_year = this_year
+    if not op.get_context().as_sql:
+        first_year = bind.execute(sa.text(
+            "SELECT CAST(EXTRACT(YEAR FROM MIN(date)) AS INTEGER) FROM workout_unpartitioned"
+        )).scalar() or this_year
+    for year in range(min(first_year, this_year), this_year + YEARS_AHEAD + 1):
+        op.execute(
+            f"CREATE TABLE workout_y{year} PARTITION OF workout "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        )
+    # safety net for dates outside the pre-created years
+    op.execute("CREATE TABLE workout_default PARTITION OF workout DEFAULT")
+
+    op.execute(f"INSERT INTO workout ({COLUMNS}) SELECT {COLUMNS} FROM workout_unpartitioned")
+    # keep the id sequence alive when the old table is dropped
+    op.execute("ALTER SEQUENCE workout_id_seq OWNED BY workout.id")
+    op.execute("DROP TABLE workout_unpartitioned")
+
+    _create_workout_indexes()
+    op.execute("ANALYZE workout")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    _drop_workout_indexes()
+    op.execute("ALTER TABLE workout RENAME TO workout_partitioned")
+    op.execute("ALTER TABLE workout_partitioned RENAME CONSTRAINT workout_pkey TO workout_partitioned_pkey")
+
+    _create_workout_table("id")
+    op.execute(f"INSERT INTO workout ({COLUMNS}) SELECT {COLUMNS} FROM workout_partitioned")
+    op.execute("ALTER SEQUENCE workout_id_seq OWNED BY workout.id")
+    # dropping the parent drops every partition
+    op.execute("DROP TABLE workout_partitioned")
+
+    _create_workout_indexes()
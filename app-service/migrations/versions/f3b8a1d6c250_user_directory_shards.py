@@ -0,0 +1,59 @@
+"""user directory for sharding, processed events keyed by source
+
+Revision ID: f3b8a1d6c250
+Revises: d2a7c4e9b816
+Create Date: 2026-10-19 21:12:45.630187
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8a1d6c250'
+down_revision = 'd2a7c4e9b816'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_directory',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=50), nullable=False),
+    sa.Column('shard', sa.String(length=50), nullable=True),
+    sa.Column('moving', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    sa.UniqueConstraint('username')
+    )
+    # every shard has its own outbox: event ids are unique per (source, id);
+    # existing rows came from the single outbox, source ''
+    op.drop_index('ix_stats_processed_event_processed_at', table_name='stats_processed_event')
+    op.rename_table('stats_processed_event', 'stats_processed_event_old')
+    op.create_table('stats_processed_event',
+    sa.Column('source', sa.String(length=50), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(length=50), nullable=False),
+    sa.Column('processed_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('source', 'event_id', name='stats_processed_event_source_pkey')
+    )
+    op.execute("INSERT INTO stats_processed_event (source, event_id, event_type, processed_at) "
+               "SELECT '', event_id, event_type, processed_at FROM stats_processed_event_old")
+    op.drop_table('stats_processed_event_old')
+    op.create_index('ix_stats_processed_event_processed_at', 'stats_processed_event', ['processed_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stats_processed_event_processed_at', table_name='stats_processed_event')
+    op.rename_table('stats_processed_event', 'stats_processed_event_old')
+    op.create_table('stats_processed_event',
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(length=50), nullable=False),
+    sa.Column('processed_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+    op.execute("INSERT INTO stats_processed_event (event_id, event_type, processed_at) "
+               "SELECT event_id, event_type, processed_at FROM stats_processed_event_old "
+               "WHERE source = ''")
+    op.drop_table('stats_processed_event_old')
+    op.create_index('ix_stats_processed_event_processed_at', 'stats_processed_event', ['processed_at'], unique=False)
+    op.drop_table('user_directory')
@@ -0,0 +1,78 @@
+from sqlalchemy import text, bindparam
+import random
+import json
+import time
+
+
+class OutboxRelay:
+    """
+    Publishes outbox_event rows (written in the same transaction as the change
+    they describe) to a consumer, oldest first, in batches. The batch stays
+    row-locked while it is delivered (SKIP LOCKED on Postgres, so relays on
+    several replicas don't send the same rows) and is only marked published
+    once the consumer acknowledged it: delivery is at-least-once, consumers
+    must be idempotent on the event id. With sharded databases each shard has
+    its own outbox and relay; source (the shard name) is sent with every
+    event, as ids are only unique within one outbox.
+    """
+
+    def __init__(self, get_engine, deliver, batch_size=100, table="outbox_event",
+                 retention=24 * 3600, purge_probability=0.05, source=""):
+        self.table = table
+        self.source = source
+        self.batch_size = batch_size
+        self.retention = retention
+        self.purge_probability = purge_probability
+        self._get_engine = get_engine
+        self._deliver = deliver
+
+    def relay_once(self):
+        engine = self._get_engine()
+        lock = " FOR UPDATE SKIP LOCKED" if engine.dialect.name == "postgresql" else ""
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                f"SELECT id, event_type, user_id, payload, created_at FROM {self.table} "
+                f"WHERE published_at IS NULL ORDER BY id LIMIT :limit{lock}"
+            ), {"limit": self.batch_size}).all()
+            if not rows:
+                return 0
+            self._deliver([
+                {
+                    "id": r.id,
+                    "type": r.event_type,
+                    "user_id": r.user_id,
+                    "payload": json.loads(r.payload),
+                    "created_at": r.created_at,
+                    "source": self.source
+                } for r in rows
+            ])
+            conn.execute(text(
+                f"UPDATE {self.table} SET published_at = :now WHERE id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)),
+                {"now": time.time(), "ids": [r.id for r in rows]})
+            if random.random() < self.purge_probability:
+                conn.execute(text(f"DELETE FROM {self.table} WHERE published_at < :cutoff"),
+                             {"cutoff": time.time() - self.retention})
+        return len(rows)
+
+    def drain(self, max_batches=50):
+        # stop after max_batches so one cycle can't run forever under load
+        delivered = 0
+        for _ in range(max_batches):
+            sent = self.relay_once()
+            delivered += sent
+            if sent < self.batch_size:
+                break
+        return delivered
+
+    def backlog(self, user_id=None):
+        # (undelivered events, created_at of the oldest one or None)
+        where, params = "published_at IS NULL", {}
+        if user_id is not None:
+            where, params = where + " AND user_id = :user_id", {"user_id": user_id}
+        with self._get_engine().connect() as conn:
+            row = conn.execute(text(
+                f"SELECT COUNT(*) AS pending, MIN(created_at) AS oldest "
+                f"FROM {self.table} WHERE {where}"
+            ), params).first()
+        return row.pending, row.oldest
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import threading
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchCache:
+    """
+    Values loaded ahead of a user's next requests, keyed by (user id, key).
+    An entry is used once (take) and expires after ttl, so it only answers
+    the request it was fetched for and can't serve stale data for long. It
+    also carries the version of the user's data it was read at (read before
+    the value); take() with another version is a miss, so a write anywhere,
+    on any replica, makes earlier values unusable.
+    """
+
+    def __init__(self, max_entries=5000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, user_id, key, value, version=None):
+        with self._lock:
+            self._entries[(user_id, key)] = (value, time.monotonic(), version)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def take(self, user_id, key, version=None):
+        # (True, value) for a fresh entry read at version, which is removed; (False, None) otherwise
+        with self._lock:
+            entry = self._entries.pop((user_id, key), None)
+        if entry is None or time.monotonic() - entry[1] >= self.ttl or entry[2] != version:
+            return False, None
+        return True, entry[0]
+
+
+class Prefetcher:
+    """
+    Runs per-user warm-up tasks on a small thread pool, off the request path.
+    A prefetch is skipped (not queued) when busy() says the process is under
+    load, when max_pending prefetches are already waiting, or when one for the
+    same user is still pending.
+    """
+
+    def __init__(self, max_workers=2, max_pending=50, busy=None, context=None, on_event=None):
+        self.max_pending = max_pending
+        self._busy = busy or (lambda: False)
+        self._context = context
+        self._on_event = on_event or (lambda event: None)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, user_id, tasks):
+        """Queue tasks (callables taking user_id); returns the outcome as a string."""
+        if self._busy():
+            outcome = "skipped_load"
+        else:
+            with self._lock:
+                if user_id in self._pending:
+                    outcome = "skipped_duplicate"
+                elif len(self._pending) >= self.max_pending:
+                    outcome = "skipped_full"
+                else:
+                    self._pending.add(user_id)
+                    outcome = "scheduled"
+        self._on_event(outcome)
+        if outcome == "scheduled":
+            self._executor.submit(self._run, user_id, tasks)
+        return outcome
+
+    def _run(self, user_id, tasks):
+        try:
+            for task in tasks:
+                try:
+                    if self._context is not None:
+                        with self._context():
+                            task(user_id)
+                    else:
+                        task(user_id)
+                    self._on_event("done")
+                except Exception:
+                    logger.exception("prefetch %s for user %s failed",
+                                     getattr(task, "__name__", task), user_id)
+                    self._on_event("failed")
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
@@ -0,0 +1,172 @@
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import ClosingIterator
+from sqlalchemy import text
+import threading
+import logging
+import signal
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class HealthChecks:
+    """
+    State behind the liveness / readiness / startup probes. Readiness runs the
+    registered checks at most once per cache_ttl seconds however often it is
+    probed; a failing critical check makes the instance unready, a failing
+    non-critical one only marks it degraded.
+    """
+
+    def __init__(self, cache_ttl=2.0, drain=None):
+        self.cache_ttl = cache_ttl
+        self.drain = drain
+        self.started = threading.Event()
+        self._checks = []
+        self._lock = threading.Lock()
+        self._cached = None
+
+    def add_check(self, name, check, critical=True):
+        # check() returns details (JSON-serializable) or raises
+        self._checks.append((name, check, critical))
+
+    def warm_up(self, *steps):
+        """
+        Runs steps in a background thread, then reports started. Failed steps
+        are only logged: the readiness checks decide whether to take traffic.
+        """
+        def run():
+            for step in steps:
+                try:
+                    step()
+                except Exception:
+                    logger.exception("warm-up step %s failed", getattr(step, "__name__", step))
+            self.started.set()
+        threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+    def _run_checks(self):
+        results = {}
+        ready = True
+        degraded = False
+        for name, check, critical in self._checks:
+            began = time.perf_counter()
+            try:
+                results[name] = {"ok": True, "detail": check()}
+            except Exception as e:
+                results[name] = {"ok": False, "error": str(e)}
+                ready = ready and not critical
+                degraded = True
+            results[name]["critical"] = critical
+            results[name]["seconds"] = round(time.perf_counter() - began, 4)
+        return ready, degraded, results
+
+    def readiness(self):
+        # (ready, body); draining / warm-up are live, the checks are cached
+        now = time.monotonic()
+        with self._lock:
+            if self._cached is None or now - self._cached[0] >= self.cache_ttl:
+                self._cached = (now, self._run_checks())
+            checked_at, (ready, degraded, results) = self._cached
+        if self.drain is not None and self.drain.draining:
+            status = "DRAINING"
+        elif not self.started.is_set():
+            status = "STARTING"
+        elif not ready:
+            status = "DOWN"
+        else:
+            status = "DEGRADED" if degraded else "UP"
+        body = {"status": status, "checks": results, "age_seconds": round(now - checked_at, 3)}
+        return status in ("UP", "DEGRADED"), body
+
+
+def warm_pool(engine, connections):
+    # open the pool's first connections now instead of on the first requests
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            opened.append(conn)
+    finally:
+        for conn in opened:
+            conn.close()
+
+
+def check_database(engine):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return {"pool": engine.pool.status()}
+
+
+class GracefulDrain:
+    """
+    WSGI middleware counting in-flight requests (until the response body is
+    closed, so streamed responses count too). After begin(), new requests get
+    503 + Retry-After except for the exempt paths (probes, metrics).
+    """
+
+    def __init__(self, wsgi_app, timeout=25.0, exempt=()):
+        self.wsgi_app = wsgi_app
+        self.timeout = timeout
+        self.exempt = tuple(exempt)
+        self.draining = False
+        self._in_flight = 0
+        self._idle = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        if self.draining and environ.get("PATH_INFO", "") not in self.exempt:
+            response = Response('{"error": "shutting down"}', status=503,
+                                mimetype="application/json",
+                                headers={"Retry-After": "1"})
+            return response(environ, start_response)
+        with self._idle:
+            self._in_flight += 1
+        try:
+            app_iter = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self._finished()
+            raise
+        return ClosingIterator(app_iter, self._finished)
+
+    def _finished(self):
+        with self._idle:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.notify_all()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def begin(self):
+        self.draining = True
+
+    def wait(self):
+        # blocks until no request is in flight or timeout; returns those still running
+        with self._idle:
+            self._idle.wait_for(lambda: self._in_flight == 0, self.timeout)
+            return self._in_flight
+
+    def install(self, server):
+        """
+        SIGTERM (and SIGINT) start draining; once in-flight requests are done,
+        or after timeout, server.serve_forever() returns.
+        """
+        def shutdown():
+            began = time.monotonic()
+            left = self.wait()
+            logger.warning("drained in %.2fs, %d request(s) cut off",
+                           time.monotonic() - began, left)
+            server.shutdown()
+
+        def handle(signum, frame):
+            if self.draining:
+                return
+            logger.warning("signal %d: draining %d in-flight request(s), up to %.0fs",
+                           signum, self.in_flight, self.timeout)
+            self.begin()
+            # not in the handler: it runs on the thread inside serve_forever()
+            threading.Thread(target=shutdown, name="drain", daemon=True).start()
+
+        signal.signal(signal.SIGTERM, handle)
+        signal.signal(signal.SIGINT, handle)
@@ -0,0 +1,153 @@
+from sqlalchemy.exc import IntegrityError
+from collections import OrderedDict
+from sqlalchemy import text
+import threading
+import random
+import math
+import time
+
+
+class RateLimit:
+    # rate tokens per second, up to burst; in_flight caps concurrent requests per key
+    def __init__(self, rate, burst, in_flight=None):
+        self.rate = rate
+        self.burst = burst
+        self.in_flight = in_flight
+
+    def __repr__(self):
+        return f"RateLimit(rate={self.rate}, burst={self.burst}, in_flight={self.in_flight})"
+
+
+def parse_rate_limits(value, defaults):
+    """
+    "stats_summary=1:10:2,sync=5:20" -> {endpoint: RateLimit} on top of defaults;
+    fields are rate per second, burst and (optional) per-user in-flight cap.
+    A rate of 0 removes the endpoint's limit.
+    """
+    limits = dict(defaults)
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        endpoint, _, spec = item.partition("=")
+        fields = spec.split(":")
+        rate = float(fields[0])
+        if rate <= 0:
+            limits.pop(endpoint.strip(), None)
+            continue
+        burst = float(fields[1]) if len(fields) > 1 and fields[1] else max(rate, 1.0)
+        in_flight = int(fields[2]) if len(fields) > 2 and fields[2] else None
+        limits[endpoint.strip()] = RateLimit(rate, burst, in_flight)
+    return limits
+
+
+def _refill(tokens, updated_at, now, limit):
+    return min(limit.burst, tokens + max(0.0, now - updated_at) * limit.rate)
+
+
+def _retry_after(tokens, limit, cost):
+    return max(1, math.ceil((cost - tokens) / limit.rate))
+
+
+class MemoryBucketStore:
+    # in-process token buckets (tests / single process), LRU-evicted
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, limit, cost=1):
+        # (allowed, seconds until a retry can succeed)
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (limit.burst, now))
+            tokens = _refill(tokens, updated_at, now, limit)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else _retry_after(tokens, limit, cost)
+
+
+class SQLBucketStore:
+    """
+    Token buckets shared by every core replica, one row per key. Taking a
+    token is a single conditional UPDATE (refill and spend computed in SQL),
+    so concurrent requests on different replicas can't both spend the last
+    token. Rows idle for idle_ttl are purged; a purged bucket comes back full,
+    which is what it would have refilled to anyway as long as
+    burst / rate < idle_ttl.
+    """
+
+    def __init__(self, get_engine, table="rate_limit_bucket", idle_ttl=3600,
+                 purge_probability=0.001):
+        self.table = table
+        self.idle_ttl = idle_ttl
+        self.purge_probability = purge_probability
+        self._get_engine = get_engine
+
+    def take(self, key, limit, cost=1):
+        now = time.time()
+        refill = ("CASE WHEN tokens + (:now - updated_at) * :rate > :burst "
+                  "THEN :burst ELSE tokens + (:now - updated_at) * :rate END")
+        params = {"key": key, "now": now, "rate": limit.rate, "burst": limit.burst, "cost": cost}
+        for _ in range(2):
+            with self._get_engine().begin() as conn:
+                spent = conn.execute(text(
+                    f"UPDATE {self.table} SET tokens = {refill} - :cost, updated_at = :now "
+                    f"WHERE bucket_key = :key AND {refill} >= :cost"
+                ), params).rowcount
+                if spent:
+                    if random.random() < self.purge_probability:
+                        conn.execute(text(f"DELETE FROM {self.table} WHERE updated_at < :cutoff"),
+                                     {"cutoff": now - self.idle_ttl})
+                    return True, 0
+                row = conn.execute(text(
+                    f"SELECT tokens, updated_at FROM {self.table} WHERE bucket_key = :key"
+                ), {"key": key}).first()
+            if row is not None:
+                return False, _retry_after(_refill(row.tokens, row.updated_at, now, limit), limit, cost)
+            try:
+                with self._get_engine().begin() as conn:
+                    conn.execute(text(
+                        f"INSERT INTO {self.table} (bucket_key, tokens, updated_at) "
+                        "VALUES (:key, :tokens, :now)"
+                    ), {"key": key, "tokens": limit.burst - cost, "now": now})
+                return True, 0
+            except IntegrityError:
+                # another request created the bucket first, spend from it
+                continue
+        return False, 1
+
+
+class InFlightLimiter:
+    """
+    Counts requests in progress per key in this process and refuses one more
+    past the limit; release() must follow every successful acquire().
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, limit):
+        with self._lock:
+            count = self._counts.get(key, 0)
+            if count >= limit:
+                return False
+            self._counts[key] = count + 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            count = self._counts.get(key, 0) - 1
+            if count > 0:
+                self._counts[key] = count
+            else:
+                self._counts.pop(key, None)
+
+    def current(self, key):
+        with self._lock:
+            return self._counts.get(key, 0)
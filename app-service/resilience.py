@@ -0,0 +1,308 @@
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+from datetime import datetime, timezone
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import text
+from collections import deque
+import pybreaker
+import threading
+import logging
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    # sliding window of recent successful upstream latencies (seconds)
+    def __init__(self, window=500, min_samples=20):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.min_samples = min_samples
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q):
+        # None until there are enough samples to trust the tail
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self):
+        return {
+            "samples": len(self),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+
+class Hedger:
+    """
+    Runs fn(); if it hasn't finished after hedge_after seconds, starts a second
+    fn() and returns whichever succeeds first. Only use for idempotent calls.
+    """
+
+    def __init__(self, max_in_flight=4):
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_in_flight * 2, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self.max_in_flight = max_in_flight
+        self.sent = 0
+        self.won = 0
+        self.skipped = 0
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def call(self, fn, hedge_after):
+        if not self._slots.acquire(blocking=False):
+            # all hedge slots busy -> plain call in the request thread
+            self._count("skipped")
+            return fn()
+
+        futures = [self._pool.submit(fn)]
+        try:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                futures.append(self._pool.submit(fn))
+                self._count("sent")
+
+            first_error = None
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    first_error = first_error or e
+                    continue
+                if future is not futures[0]:
+                    self._count("won")
+                return result
+            raise first_error
+        finally:
+            self._release_when_done(futures)
+
+    def _release_when_done(self, futures):
+        # the losing request keeps running until its own timeout, keep its
+        # slot taken until then so the pool never queues
+        pending = [f for f in futures if not f.done()]
+        if not pending:
+            self._slots.release()
+            return
+        lock = threading.Lock()
+        left = [len(pending)]
+
+        def on_done(_):
+            with lock:
+                left[0] -= 1
+                last = left[0] == 0
+            if last:
+                self._slots.release()
+
+        for future in pending:
+            future.add_done_callback(on_done)
+
+    def snapshot(self):
+        return {
+            "max_in_flight": self.max_in_flight,
+            "sent": self.sent,
+            "won": self.won,
+            "skipped": self.skipped
+        }
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs fn(),
+    callers arriving while it runs wait for it and get the same result (or
+    exception). Nothing is kept once the call returned, so it never serves
+    anything older than an in-progress call.
+    """
+
+    def __init__(self, on_coalesced=None):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._on_coalesced = on_coalesced or (lambda key: None)
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        # (result, True if it came from another caller's call)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            self._on_coalesced(key)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def snapshot(self):
+        with self._lock:
+            in_flight = len(self._flights)
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": in_flight}
+
+
+class CircuitSQLStorage(pybreaker.CircuitBreakerStorage):
+    """
+    Circuit breaker state kept in a shared SQL table, so every worker and
+    replica opens and half-opens together. Counters are updated atomically in
+    the database; state reads are cached for cache_ttl seconds to keep the
+    common (closed) path from costing a query per call. If the database is
+    unreachable the breaker keeps working on its local copy.
+    """
+
+    def __init__(self, get_engine, name="stats", cache_ttl=1.0,
+                 table="circuit_breaker", initial_state=pybreaker.STATE_CLOSED):
+        super().__init__("sql")
+        self.breaker_name = name
+        self.cache_ttl = cache_ttl
+        self.table = table
+        self.replica = socket.gethostname()
+        self._get_engine = get_engine
+        self._lock = threading.Lock()
+        self._ensured = False
+        self._cached_at = 0.0
+        self._local = {
+            "state": initial_state,
+            "fail_counter": 0,
+            "success_counter": 0,
+            "opened_at": None,
+            "updated_at": None,
+            "updated_by": None
+        }
+
+    def _ensure_row(self, conn):
+        if self._ensured:
+            return
+        try:
+            with conn.begin_nested():
+                conn.execute(text(
+                    f"INSERT INTO {self.table} (name, state, fail_counter, success_counter, updated_at, updated_by) "
+                    "VALUES (:name, :state, 0, 0, :now, :by)"
+                ), {"name": self.breaker_name, "state": self._local["state"],
+                    "now": time.time(), "by": self.replica})
+        except IntegrityError:
+            pass
+        self._ensured = True
+
+    def _refresh(self, force=False):
+        if not force and time.monotonic() - self._cached_at < self.cache_ttl:
+            return self._local
+        try:
+            with self._get_engine().begin() as conn:
+                self._ensure_row(conn)
+                row = conn.execute(text(
+                    f"SELECT state, fail_counter, success_counter, opened_at, updated_at, updated_by "
+                    f"FROM {self.table} WHERE name = :name"
+                ), {"name": self.breaker_name}).mappings().first()
+            if row is not None:
+                with self._lock:
+                    self._local.update(row)
+                    self._cached_at = time.monotonic()
+        except Exception as e:
+            logger.warning("circuit breaker store unavailable: %s", e)
+        return self._local
+
+    def _write(self, assignments, params=None, **local):
+        with self._lock:
+            for key, value in local.items():
+                self._local[key] = value(self._local[key]) if callable(value) else value
+        try:
+            with self._get_engine().begin() as conn:
+                self._ensure_row(conn)
+                conn.execute(text(
+                    f"UPDATE {self.table} SET {assignments}, updated_at = :now, updated_by = :by "
+                    "WHERE name = :name"
+                ), {"name": self.breaker_name, "now": time.time(), "by": self.replica, **(params or {})})
+        except Exception as e:
+            logger.warning("circuit breaker store unavailable: %s", e)
+        # next read goes to the database
+        self._cached_at = 0.0
+
+    @property
+    def state(self):
+        return self._refresh()["state"]
+
+    @state.setter
+    def state(self, state):
+        self._write("state = :state", {"state": state}, state=state)
+
+    def increment_counter(self):
+        self._write("fail_counter = fail_counter + 1", fail_counter=lambda v: v + 1)
+
+    def reset_counter(self):
+        # pybreaker resets after every successful call; skip the write while
+        # the (recently refreshed) shared counter is already zero
+        if self._refresh()["fail_counter"] == 0:
+            return
+        self._write("fail_counter = 0", fail_counter=0)
+
+    def increment_success_counter(self):
+        self._write("success_counter = success_counter + 1", success_counter=lambda v: v + 1)
+
+    def reset_success_counter(self):
+        if self._refresh()["success_counter"] == 0:
+            return
+        self._write("success_counter = 0", success_counter=0)
+
+    @property
+    def counter(self):
+        # pybreaker compares this against fail_max right after incrementing
+        return self._refresh(force=True)["fail_counter"]
+
+    @property
+    def success_counter(self):
+        return self._refresh(force=True)["success_counter"]
+
+    @property
+    def opened_at(self):
+        ts = self._refresh()["opened_at"]
+        return datetime.fromtimestamp(ts, timezone.utc) if ts is not None else None
+
+    @opened_at.setter
+    def opened_at(self, value):
+        ts = value.timestamp()
+        self._write("opened_at = :opened_at", {"opened_at": ts}, opened_at=ts)
+
+    def snapshot(self):
+        row = self._refresh()
+        return {
+            "backend": self.name,
+            "replica": self.replica,
+            "updated_at": row["updated_at"],
+            "updated_by": row["updated_by"]
+        }
@@ -0,0 +1,172 @@
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import Signer, BadSignature
+from flask.json.tag import TaggedJSONSerializer
+from werkzeug.datastructures import CallbackDict
+from collections import OrderedDict
+from sqlalchemy import text
+import threading
+import secrets
+import random
+import time
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        # new id after login (session fixation); the old entry is dropped on save
+        self.previous_sid = self.previous_sid or self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class MemorySessionStore:
+    # in-process store for tests / single-process dev, LRU-evicted
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            data, expires_at, _ = entry
+            if expires_at < time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return data
+
+    def set(self, sid, data, ttl, user_id=None):
+        with self._lock:
+            self._entries[sid] = (data, time.time() + ttl, user_id)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            for sid in [s for s, e in self._entries.items() if e[2] == user_id]:
+                del self._entries[sid]
+
+
+class SQLSessionStore:
+    # shared store in the database, visible to every core replica
+    def __init__(self, get_engine, table="user_session", purge_probability=0.01):
+        self.table = table
+        self.purge_probability = purge_probability
+        self._get_engine = get_engine
+
+    def get(self, sid):
+        with self._get_engine().connect() as conn:
+            row = conn.execute(text(
+                f"SELECT data, expires_at FROM {self.table} WHERE sid = :sid"
+            ), {"sid": sid}).first()
+        if row is None or row.expires_at < time.time():
+            return None
+        return row.data
+
+    def set(self, sid, data, ttl, user_id=None):
+        params = {"sid": sid, "data": data, "expires_at": time.time() + ttl, "user_id": user_id}
+        with self._get_engine().begin() as conn:
+            updated = conn.execute(text(
+                f"UPDATE {self.table} SET data = :data, expires_at = :expires_at, user_id = :user_id "
+                "WHERE sid = :sid"
+            ), params).rowcount
+            if not updated:
+                conn.execute(text(
+                    f"INSERT INTO {self.table} (sid, data, expires_at, user_id) "
+                    "VALUES (:sid, :data, :expires_at, :user_id)"
+                ), params)
+            if random.random() < self.purge_probability:
+                conn.execute(text(f"DELETE FROM {self.table} WHERE expires_at < :now"),
+                             {"now": time.time()})
+
+    def delete(self, sid):
+        with self._get_engine().begin() as conn:
+            conn.execute(text(f"DELETE FROM {self.table} WHERE sid = :sid"), {"sid": sid})
+
+    def delete_user(self, user_id):
+        with self._get_engine().begin() as conn:
+            conn.execute(text(f"DELETE FROM {self.table} WHERE user_id = :user_id"),
+                         {"user_id": user_id})
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Keeps session data in a store; the cookie only carries a signed session id.
+    Entries expire after `lifetime` seconds without activity.
+    """
+
+    serializer = TaggedJSONSerializer()
+    salt = "liftlog-session"
+
+    def __init__(self, store, lifetime=7 * 24 * 3600, refresh_after=300):
+        self.store = store
+        self.lifetime = lifetime
+        self.refresh_after = refresh_after
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie and app.secret_key:
+            try:
+                sid = self._signer(app).unsign(cookie).decode("utf-8")
+            except BadSignature:
+                sid = None
+            if sid:
+                raw = self.store.get(sid)
+                if raw is not None:
+                    data = self.serializer.loads(raw)
+                    session = ServerSideSession(data.get("data"), sid=sid)
+                    session.saved_at = data.get("saved_at", 0)
+                    return session
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # unchanged sessions are only re-written to push their expiry forward
+        stale = time.time() - getattr(session, "saved_at", 0) > self.refresh_after
+        if not (session.modified or session.new or stale):
+            return
+
+        payload = self.serializer.dumps({"data": dict(session), "saved_at": time.time()})
+        self.store.set(session.sid, payload, self.lifetime, user_id=session.get("uid"))
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode("utf-8")).decode("utf-8"),
+            max_age=self.lifetime,
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            domain=domain,
+            path=path
+        )
@@ -0,0 +1,131 @@
+from flask import Blueprint, jsonify
+from flask_sqlalchemy import SQLAlchemy
+import importlib.util
+import subprocess
+import socket
+import threading
+import signal
+import time
+import requests
+import os
+
+
+class LazySwagger:
+    """
+    Serves /apidocs/ and /apispec_1.json like flasgger's Swagger(app), but
+    only imports flasgger (yaml, jsonschema, mistune) and builds the spec
+    on the first request to them instead of on every process start.
+    """
+
+    def __init__(self, app=None, template=None):
+        self.template = template
+        self.app = None
+        self._swagger = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        # flasgger's UI templates / static files, found without importing it
+        package = importlib.util.find_spec("flasgger").submodule_search_locations[0]
+        # same blueprint / endpoint names as flasgger, its views url_for() them
+        blueprint = Blueprint(
+            "flasgger", __name__,
+            template_folder=os.path.join(package, "ui3", "templates"),
+            static_folder=os.path.join(package, "ui3", "static"),
+            static_url_path="/flasgger_static"
+        )
+        blueprint.add_url_rule("/apidocs/", "apidocs", self.apidocs)
+        blueprint.add_url_rule("/apispec_1.json", "apispec_1", self.apispec)
+        app.register_blueprint(blueprint)
+
+    @property
+    def loaded(self):
+        return self._swagger is not None
+
+    def swagger(self):
+        with self._lock:
+            if self._swagger is None:
+                from flasgger import Swagger
+                # not bound with init_app: the routes above stand in for its views
+                swagger = Swagger(template=self.template)
+                swagger.app = self.app
+                swagger.load_config(self.app)
+                self._swagger = swagger
+        return self._swagger
+
+    def apispec(self):
+        return jsonify(self.swagger().get_apispecs("apispec_1"))
+
+    def apidocs(self):
+        from flasgger.base import APIDocsView
+        return APIDocsView(view_args={"config": self.swagger().config}).get()
+
+
+class _PendingEngine:
+    def __init__(self, bind_key, options, app):
+        self.bind_key = bind_key
+        self.options = options
+        self.app = app
+
+
+class LazySQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy creates its engines in init_app, at import time (for
+    Postgres that loads the driver and dialect); this creates each engine
+    on first use instead. Connections were already opened lazily.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._engine_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def _make_engine(self, bind_key, options, app):
+        return _PendingEngine(bind_key, options, app)
+
+    @property
+    def engines(self):
+        engines = super().engines
+        for key, engine in list(engines.items()):
+            if isinstance(engine, _PendingEngine):
+                with self._engine_lock:
+                    if isinstance(engines[key], _PendingEngine):
+                        engines[key] = super()._make_engine(
+                            engine.bind_key, engine.options, engine.app)
+        return engines
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_healthy(command, url, env=None, timeout=60, cwd=None):
+    """
+    Starts command and polls url until it answers 200; returns the seconds
+    from spawning the process to that response. The process (and anything
+    it spawned, e.g. the debug reloader's child) is stopped afterwards.
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, cwd=cwd, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"exited with {process.returncode} before {url} was healthy")
+            try:
+                if requests.get(url, timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"{url} not healthy after {timeout}s")
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
@@ -0,0 +1,80 @@
+async function loadNavTime()
+{
+    const el = document.getElementById("navTime");
+    if (!el) return;
+
+    try
+    {
+        const r = await fetch("/api/time", { cache: "no-store" });
+        const d = await r.json();
+
+        const timeStr = d.formatted || d.datetime || "";
+        const src = d.source ? ` (${d.source})` : "";
+
+        el.textContent = `${timeStr} ${src}`;
+    } catch (e)
+    {
+        el.textContent = "";
+    }
+}
+
+document.addEventListener("DOMContentLoaded", () =>
+{
+    loadNavTime();
+    // refresh every 60s
+    setInterval(loadNavTime, 60_000);
+});
+
+function toggleMenu()
+{
+    const menu = document.querySelector('.menu');
+    menu.classList.toggle('active');
+}
+
+// Apply dark mode to all elements
+function applyDarkModeToAllElements()
+{
+    document.querySelectorAll('*').forEach(element =>
+    {
+        element.classList.add('dark-mode');
+    });
+}
+
+// Remove dark mode from all elements
+function removeDarkModeFromAllElements()
+{
+    document.querySelectorAll('*').forEach(element =>
+    {
+        element.classList.remove('dark-mode');
+    });
+}
+
+// Toggle Dark Mode
+function toggleDarkMode()
+{
+    const isDarkMode = document.body.classList.toggle('dark-mode');
+
+    if (isDarkMode)
+    {
+        applyDarkModeToAllElements();
+    } else
+    {
+        removeDarkModeFromAllElements();
+    }
+
+    localStorage.setItem('darkMode', isDarkMode ? 'enabled' : 'disabled');
+}
+
+// Apply dark mode if saved in localStorage
+window.addEventListener('DOMContentLoaded', () =>
+{
+    if (localStorage.getItem('darkMode') === 'enabled')
+    {
+        applyDarkModeToAllElements();
+    }
+});
+
+function Logout()
+{
+    window.location.href = '/logout';
+}
@@ -0,0 +1,186 @@
+function openPopup()
+{
+    document.getElementById('popup-overlay').style.display = 'flex';
+}
+function openPopup2()
+{
+    document.getElementById('popup-overlay2').style.display = 'flex';
+}
+
+function closePopup()
+{
+    document.getElementById('popup-overlay').style.display = 'none';
+}
+function closePopup2()
+{
+    document.getElementById('popup-overlay2').style.display = 'none';
+    location.reload();
+}
+
+// workouts wait in localStorage until the server confirmed them, so a lost
+// connection or a retried request never logs one twice (see /sync)
+const PENDING_KEY = "liftlog.pendingWorkouts";
+
+function pendingWorkouts()
+{
+    return JSON.parse(localStorage.getItem(PENDING_KEY) || "[]");
+}
+
+function newClientId()
+{
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+}
+
+function localDate()
+{
+    var d = new Date();
+    return d.getFullYear() + "-" + String(d.getMonth() + 1).padStart(2, "0") + "-" + String(d.getDate()).padStart(2, "0");
+}
+
+function syncPending()
+{
+    var pending = pendingWorkouts();
+    if (pending.length === 0) return;
+
+    fetch("/sync", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json"
+        },
+        body: JSON.stringify({
+            workouts: pending.slice(0, 200)
+        })
+    })
+        .then(response =>
+        {
+            if (!response.ok) throw new Error("HTTP " + response.status);
+            return response.json();
+        })
+        .then(result =>
+        {
+            result.rejected.forEach(w => console.error("Workout rejected:", w.error));
+            var done = new Set(result.accepted.concat(result.rejected).map(w => w.client_id));
+            localStorage.setItem(PENDING_KEY, JSON.stringify(
+                pendingWorkouts().filter(w => !done.has(w.client_id))));
+        })
+        .catch(err => console.error("Sync failed, will retry:", err));
+}
+
+function addWorkout()
+{
+    var workout = document.getElementById('exercise').value;
+    var reps = [];
+    var weights = [];
+    var children = repCol.children;
+
+    for (var i = 0; i < children.length; i++)
+    {
+        reps.push(parseInt(children[i].querySelector('input').value) || 0);
+        weights.push(parseFloat(weightCol.children[i].querySelector('input').value) || 0);
+    }
+
+    var pending = pendingWorkouts();
+    pending.push({
+        client_id: newClientId(),
+        date: localDate(),
+        exercise_id: parseInt(workout),
+        reps: reps,
+        weights: weights,
+        is_bodyweight: false
+    });
+    localStorage.setItem(PENDING_KEY, JSON.stringify(pending));
+    syncPending();
+}
+
+window.addEventListener("online", syncPending);
+syncPending();
+
+function btn_add_workout()
+{
+    const inputField = document.getElementById("new-workout-name");
+
+    var workoutname = inputField.value.trim();
+
+    if (workoutname.length > 0)
+    {
+        fetch("/addExercise", {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json"
+            },
+            body: JSON.stringify({
+                name: workoutname
+            })
+        })
+            .then(response => response.text())
+            .then(data =>
+            {
+                console.log(data);
+                reloadExerciseDropdown();
+            })
+            .catch(err => console.error("Error adding exercise:", err));
+        inputField.value = "";
+        closePopup();
+    } else
+    {
+        alert("Prosimo vnesite ime vaje.");
+        inputField.focus();
+    }
+}
+function reloadExerciseDropdown()
+{
+    fetch('/getAllExercises')
+        .then(response => response.json())
+        .then(exercises =>
+        {
+            const dropdown = document.getElementById('exercise');
+            dropdown.innerHTML = '';
+            exercises.forEach(exercise =>
+            {
+                const option = document.createElement('option');
+                option.value = exercise.id;
+                option.textContent = exercise.name;
+                dropdown.appendChild(option);
+            });
+        })
+        .catch(error =>
+        {
+            console.error('Error loading exercises:', error);
+        });
+}
+
+function setKgRepsBySets(sets)
+{
+    var childCount = weightCol.childElementCount;
+    if (sets == childCount) return;
+    if (sets < childCount)
+    {
+        for (var i = childCount; i > sets; i--)
+        {
+            weightCol.removeChild(weightCol.lastElementChild);
+            repCol.removeChild(repCol.lastElementChild);
+        }
+    }
+    for (var i = childCount; i < sets; i++)
+    {
+        var idReps = "reps" + i;
+        var idWeight = "weight" + i;
+
+        var repsWrapper = document.createElement("div");
+        repsWrapper.className = "input_wrapper";
+        repsWrapper.innerHTML = `
+  <button class="btn-decrement" onclick="document.getElementById('${idReps}').value = Math.max(1, parseInt(document.getElementById('${idReps}').value) - 1)">−</button>
+  <input id="${idReps}" type="number" value="1" min="1">
+  <button class="btn-increment" onclick="document.getElementById('${idReps}').value = parseInt(document.getElementById('${idReps}').value) + 1">+</button>`;
+
+        var weightWrapper = document.createElement("div");
+        weightWrapper.className = "input_wrapper";
+        weightWrapper.innerHTML = `
+  <button class="btn-decrement" onclick="document.getElementById('${idWeight}').value = Math.max(0, parseInt(document.getElementById('${idWeight}').value) - 1)">−</button>
+  <input id="${idWeight}" type="number" value="0" min="0">
+  <button class="btn-increment" onclick="document.getElementById('${idWeight}').value = parseInt(document.getElementById('${idWeight}').value) + 1">+</button>`;
+        repCol.appendChild(repsWrapper);
+        weightCol.appendChild(weightWrapper);
+    }
+}
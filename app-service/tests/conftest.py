@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the app reads its configuration at import: two SQLite shards, "a" on the
+# primary database, directory routing without a cache so moves apply at once
+_tmp = tempfile.mkdtemp()
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_tmp}/a.db",
+    SHARD_URLS=f"a=sqlite:///{_tmp}/a.db,b=sqlite:///{_tmp}/b.db",
+    SHARD_ROUTING="directory", SHARD_DIRECTORY_TTL="0",
+    SECRET_KEY="test", STATS_SERVICE_URL="http://127.0.0.1:9",
+    OUTBOX_RELAY_INTERVAL="0", PREFETCH_WORKERS="0",
+    RATE_LIMITS="import_workouts=100:100:1,sync=100:100:4")
+
+
+@pytest.fixture(scope="session")
+def core():
+    import app as core
+    with core.app.app_context():
+        core.db.create_all()
+        for name in core.shard_router.names:
+            core.db.metadata.create_all(core._shard_engine(name))
+    return core
+
+
+def login(core, username, password="pw"):
+    client = core.app.test_client()
+    client.post("/login", data={"username": username, "password": password, "action": "register"})
+    client.post("/login", data={"username": username, "password": password, "action": "login"})
+    return client
+
+
+@pytest.fixture(scope="session")
+def make_client(core):
+    return lambda username: login(core, username)
@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+
+def seed(core, username, workouts=50):
+    # a user with enough workouts that the planner has a choice to make
+    core.app.test_client().post("/login", data={"username": username, "password": "pw",
+                                                "action": "register"})
+    user_id = core.user_directory.find(username)[0]
+    with core.app.app_context(), core.shard_router.for_user(user_id):
+        exercises = core.getExercises(user_id)
+        core.db.session.add_all([
+            core.Workout(date=date(2026, 6, 30) - timedelta(days=n), sets=3, reps=[5, 5, 5],
+                         extra_weight=[60, 60, 60], is_bodyweight=False,
+                         exercise_id=exercises[n % len(exercises)]["id"], user_id=user_id)
+            for n in range(workouts)])
+        core.db.session.commit()
+    return user_id, exercises[0]["id"]
+
+
+def test_hot_queries_use_an_index(core):
+    # no ANALYZE: on a table this small SQLite would rightly prefer a scan
+    for n in range(4):
+        user_id, exercise_id = seed(core, f"explain-{n}")
+    with core.app.app_context(), core.shard_router.for_user(user_id):
+        plans = {name: core._explain(query) for name, query in
+                 core._hot_queries(user_id, exercise_id, date(2026, 6, 15)).items()}
+    assert {name: plan for name, (uses_index, plan) in plans.items() if not uses_index} == {}
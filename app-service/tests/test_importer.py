@@ -0,0 +1,73 @@
+import io
+import json
+
+import pytest
+
+from importer import ImportRowError, iter_csv, iter_json, normalize_record
+
+
+def record(**fields):
+    return dict({"date": "2026-03-01", "exercise": "Bench", "reps": "5", "weight": "100"}, **fields)
+
+
+def test_normalize_record():
+    assert normalize_record(record(reps="5;5", weight="100")) == \
+        (normalize_record(record())[0], "Bench", [5, 5], [100.0, 100.0], False)
+
+
+@pytest.mark.parametrize("fields", [
+    {"reps": "inf"},
+    {"reps": "1e999"},
+    {"reps": [float("inf")]},
+    {"weight": "nan"},
+    {"weight": "-inf"},
+    {"reps": "five"},
+    {"exercise": "Bench\x00Press"},
+    {"exercise": "Bench\x7f"},
+    {"exercise": "\ud800"},
+    {"date": "not a date"},
+])
+def test_bad_rows_are_import_row_errors(fields):
+    with pytest.raises(ImportRowError):
+        normalize_record(record(**fields))
+
+
+def test_oversized_csv_field_is_an_import_row_error():
+    data = b"date,exercise,reps,weight\n2026-03-01,\"" + b"x" * 200_000 + b"\",5,100\n"
+    with pytest.raises(ImportRowError):
+        list(iter_csv(io.BytesIO(data)))
+
+
+def test_json_syntax_error_fails_early():
+    data = b'[{"a": 1}, {"a": 2,, "b": 3}, ' + b", ".join([b'{"x": 1}'] * 50_000) + b"]"
+    stream = io.BytesIO(data)
+    with pytest.raises(ImportRowError):
+        list(iter_json(stream))
+    assert stream.tell() < len(data)
+
+
+def import_csv(client, body):
+    r = client.post("/importWorkouts?format=csv", data=body, content_type="text/csv")
+    assert r.status_code == 200
+    return [json.loads(line) for line in r.data.decode().splitlines()]
+
+
+def test_bad_rows_are_rejected_and_the_import_finishes(make_client):
+    client = make_client("importer")
+    progress = import_csv(client, (
+        "date,exercise,reps,weight\n"
+        "2026-03-01,Bench,1e999,100\n"
+        "2026-03-02,Bench,5,nan\n"
+        "2026-03-03,Bench\x00Press,5,100\n"
+        "2026-03-04,Squat,5,120\n").encode())
+    final = progress[-1]
+    assert final["done"] and "failed" not in final
+    assert (final["workouts"], final["rejected"]) == (1, 3)
+
+
+def test_oversized_field_ends_the_import_with_a_done_line(make_client):
+    client = make_client("importer-big")
+    progress = import_csv(client, b"date,exercise,reps,weight\n2026-03-01,Squat,5,120\n"
+                                  b"2026-03-02,\"" + b"x" * 200_000 + b"\",5,100\n")
+    final = progress[-1]
+    assert final["done"] and "invalid CSV" in final["failed"]
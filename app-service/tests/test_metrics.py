@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(make_client):
+    return make_client("metrics")
+
+
+def http_series(client):
+    text = client.get("/metrics").data.decode()
+    return {line.rsplit(" ", 1)[0] for line in text.splitlines()
+            if line.startswith(("http_requests_total{", "http_request_duration_seconds_bucket{"))}
+
+
+def visit_days(client, first, days):
+    for i in range(days):
+        day = first + timedelta(days=i)
+        assert client.get(f"/workouts/{day.isoformat()}").status_code == 200
+        assert client.get(f"/no-such-page/{day.isoformat()}").status_code == 404
+
+
+def test_series_count_does_not_grow_with_distinct_paths(client):
+    visit_days(client, date(2026, 1, 1), 2)
+    http_series(client)  # /metrics itself gets its series on the first scrape
+    before = http_series(client)
+
+    visit_days(client, date(2026, 2, 1), 28)
+    after = http_series(client)
+
+    assert len(after) == len(before)
+    assert any('endpoint="/workouts/<date>"' in s for s in after)
+    assert any('endpoint="<unmatched>"' in s for s in after)
+    assert not any("2026-02" in s for s in after)
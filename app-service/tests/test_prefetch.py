@@ -0,0 +1,21 @@
+from datetime import date
+
+
+def test_login_prefetch_warms_the_calendar_grid(make_client, core):
+    client = make_client("prefetch-calendar")
+    client.post("/addExercise", json={"name": "Squat"})
+    user_id = core.user_directory.find("prefetch-calendar")[0]
+    with core.app.app_context(), core.shard_router.for_user(user_id):
+        exercise_id = core.getExercises(user_id)[0]["id"]
+    today = date.today()
+    client.post("/addWorkout", json={"workout": exercise_id, "sets": 1, "reps": [5],
+                                     "weights": [100], "date": today.isoformat()})
+
+    # what the prefetcher's thread runs: an app context, no request
+    with core.app.app_context():
+        core.prefetch_calendar_grid(user_id)
+    hits = core.CALENDAR_CACHE_EVENTS.labels(core.SERVICE_NAME, "hit")._value.get()
+    page = client.get(f"/calendar/{today.year}/{today.month}")
+    assert page.status_code == 200
+    assert core.CALENDAR_CACHE_EVENTS.labels(core.SERVICE_NAME, "hit")._value.get() == hits + 1
+    assert f"/workouts/{today.isoformat()}".encode() in page.data
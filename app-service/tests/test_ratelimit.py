@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+
+import ratelimit
+from ratelimit import MemoryBucketStore, RateLimit, SQLBucketStore, parse_rate_limits
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    return now
+
+
+def test_bucket_refills_at_the_rate(clock):
+    store, limit = MemoryBucketStore(), RateLimit(0.5, 3)
+    assert [store.take("k", limit) for _ in range(4)] == [(True, 0)] * 3 + [(False, 2)]
+    clock[0] += 1
+    assert store.take("k", limit) == (False, 1)
+    clock[0] += 1
+    assert store.take("k", limit) == (True, 0)
+    clock[0] += 3600
+    assert [store.take("k", limit)[0] for _ in range(4)] == [True] * 3 + [False]
+
+
+def test_parse_rate_limits_overrides_defaults():
+    defaults = {"sync": RateLimit(2, 20), "api_time": RateLimit(1, 10)}
+    limits = parse_rate_limits(" sync=5:30:2, api_time=0,import=0.5,, stats=3::1", defaults)
+    assert sorted(limits) == ["import", "stats", "sync"]
+    assert vars(limits["sync"]) == {"rate": 5.0, "burst": 30.0, "in_flight": 2}
+    assert vars(limits["import"]) == {"rate": 0.5, "burst": 1.0, "in_flight": None}
+    assert vars(limits["stats"]) == {"rate": 3.0, "burst": 3.0, "in_flight": 1}
+    assert parse_rate_limits("", defaults) == defaults and defaults["api_time"].rate == 1
+
+
+def test_endpoint_answers_429_with_retry_after(make_client, core, monkeypatch):
+    monkeypatch.setitem(core.RATE_LIMITS, "sync", RateLimit(0.25, 2))
+    client = make_client("limited")
+    codes = [client.post("/sync", json={"workouts": []}).status_code for _ in range(2)]
+    refused = client.post("/sync", json={"workouts": []})
+    assert codes == [200, 200] and refused.status_code == 429
+    assert refused.headers["Retry-After"] == "4"
+    assert refused.get_json()["reason"] == "rate"
+
+
+def test_in_flight_slot_is_released_after_the_stream(make_client, core):
+    client = make_client("streamer")
+    key = f"user:{core.user_directory.find('streamer')[0]}:import_workouts"
+    body = "date,exercise,reps,weight\n2026-03-01,Row,5,60\n"
+
+    def start():
+        return client.post("/importWorkouts?format=csv", data=body, content_type="text/csv",
+                           buffered=False)
+
+    streaming = start()
+    assert streaming.status_code == 200 and core.in_flight_limiter.current(key) == 1
+    refused = start()
+    assert refused.status_code == 429 and refused.get_json()["reason"] == "in_flight"
+    assert b'"done": true' in b"".join(streaming.response)
+    streaming.close()
+    assert core.in_flight_limiter.current(key) == 0
+    assert start().status_code == 200
+
+
+def test_sql_buckets_allow_exactly_burst_under_concurrency(tmp_path, core):
+    engine = create_engine(f"sqlite:///{tmp_path}/buckets.db", connect_args={"timeout": 30})
+    core.RateLimitBucket.__table__.create(engine)
+    store, limit = SQLBucketStore(lambda: engine), RateLimit(0.001, 10)
+    start, allowed = threading.Barrier(16), []
+
+    def take():
+        start.wait()
+        for _ in range(5):
+            allowed.append(store.take("user:1:sync", limit)[0])
+
+    threads = [threading.Thread(target=take) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(allowed) == 80 and allowed.count(True) == 10
@@ -0,0 +1,168 @@
+import pytest
+import sqlalchemy as sa
+
+from conftest import login
+
+
+def user_on(core, shard, prefix):
+    # register users until the ring places one on the shard
+    for n in range(100):
+        username = f"{prefix}-{n}"
+        client = login(core, username)
+        user_id, home = core.user_directory.find(username)
+        if home == shard:
+            return user_id, client
+    raise AssertionError(f"no user placed on {shard}")
+
+
+def rows(core, shard, table, user_id):
+    column = "id" if table == "user" else "user_id"
+    with core._shard_engine(shard).connect() as conn:
+        return conn.execute(sa.text(f'SELECT COUNT(*) FROM "{table}" WHERE {column} = :u'),
+                            {"u": user_id}).scalar()
+
+
+def ids_from(core, shard, floor):
+    # new exercises and workouts on the shard get ids above floor, away from
+    # the other shard's (what SHARD_ID_RANGE does on Postgres)
+    with core._shard_engine(shard).begin() as conn:
+        for table in (core.Exercise.__table__, core.Workout.__table__):
+            if (conn.execute(sa.select(sa.func.max(table.c.id))).scalar() or 0) < floor:
+                row = {"id": floor, "user_id": 0, "version": 0}
+                if table is core.Exercise.__table__:
+                    row.update(name="id floor")
+                else:
+                    row.update(date=sa.func.current_date(), sets=0, reps=[], is_bodyweight=False,
+                               exercise_id=floor)
+                conn.execute(table.insert().values(**row))
+
+
+@pytest.fixture
+def delivered(core, monkeypatch):
+    # stats is not running: the relays hand their batches to a list
+    events = []
+    for relay in core.outbox_relays.values():
+        monkeypatch.setattr(relay, "_deliver", events.extend)
+    return events
+
+
+def move(core, user_id, shard):
+    return core.app.test_cli_runner().invoke(args=["move-user", str(user_id), shard])
+
+
+def test_hash_routing_places_users_on_the_ring(core, monkeypatch):
+    monkeypatch.setattr(core.shard_router, "scheme", "hash")
+    placed = {user_id: core.shard_router.shard_for(user_id) for user_id in range(1, 200)}
+    assert set(placed.values()) == {"a", "b"}
+    assert all(shard == core.shard_router.place(user_id) for user_id, shard in placed.items())
+
+
+def test_directory_routing_follows_the_directory(core):
+    user_id, _ = user_on(core, "a", "routed")
+    router = core.shard_router
+    assert router.shard_for(user_id) == "a"
+    try:
+        core.user_directory.set_shard(user_id, "b", moving=True)
+        with pytest.raises(core.ShardMoving):
+            router.shard_for(user_id)
+        core.user_directory.set_shard(user_id, "b")
+        assert router.shard_for(user_id) == "b"
+    finally:
+        core.user_directory.set_shard(user_id, "a")
+    assert router.shard_for(987654) == router.place(987654)
+
+
+def test_register_and_login_on_both_shards(core):
+    for shard in ("a", "b"):
+        user_id, client = user_on(core, shard, f"login-{shard}")
+        other = "b" if shard == "a" else "a"
+        assert (rows(core, shard, "user", user_id), rows(core, other, "user", user_id)) == (1, 0)
+        assert rows(core, shard, "exercise", user_id) > 0
+        assert client.post("/addExercise", json={"name": "Dip"}).status_code in (200, 201)
+        assert client.get("/getExercisesInMonth/2026/3").get_json() == []
+
+
+def test_move_with_colliding_ids_changes_nothing(core, delivered):
+    user_id, client = user_on(core, "a", "collide")
+    other_id, _ = user_on(core, "b", "collide-target")
+    with core._shard_engine("a").connect() as conn:
+        exercise_id = conn.execute(sa.text("SELECT MIN(id) FROM exercise WHERE user_id = :u"),
+                                   {"u": user_id}).scalar()
+    with core._shard_engine("b").begin() as conn:
+        if not conn.execute(sa.text("SELECT 1 FROM exercise WHERE id = :id"), {"id": exercise_id}).first():
+            conn.execute(sa.text("INSERT INTO exercise (id, name, version, user_id) "
+                                 "VALUES (:id, 'collider', 0, :u)"), {"id": exercise_id, "u": other_id})
+
+    result = move(core, user_id, "b")
+    assert result.exit_code != 0 and "ids collide on b, nothing moved" in result.output
+    assert core.user_directory.locate(user_id) == ("a", False)
+    assert rows(core, "b", "user", user_id) == 0 and rows(core, "a", "user", user_id) == 1
+    assert client.get("/getExercisesInMonth/2026/3").status_code == 200
+
+
+def test_move_to_a_clean_shard(core, delivered):
+    ids_from(core, "b", 100000)
+    user_id, client = user_on(core, "b", "mover")
+    with core.app.app_context(), core.shard_router.for_user(user_id):
+        exercise_id = core.getExercises(user_id)[0]["id"]
+    client.post("/addWorkout", json={"workout": exercise_id, "sets": 1, "reps": [5],
+                                     "weights": [80], "date": "2026-03-05"})
+    exercises = rows(core, "b", "exercise", user_id)
+
+    result = move(core, user_id, "a")
+    assert result.exit_code == 0, result.output
+    # the source's outbox was drained before the copy
+    assert any(e["source"] == "b" and e["type"] == "workout.created" and e["user_id"] == user_id
+               for e in delivered)
+    assert core.user_directory.locate(user_id) == ("a", False)
+    assert rows(core, "a", "exercise", user_id) == exercises and rows(core, "b", "exercise", user_id) == 0
+    assert rows(core, "b", "user", user_id) == 0
+    with core._shard_engine("a").connect() as conn:
+        assert conn.execute(sa.text("SELECT COUNT(*) FROM outbox_event WHERE event_type = 'user.moved' "
+                                    "AND user_id = :u"), {"u": user_id}).scalar() == 1
+    assert client.get("/getExercisesInMonth/2026/3").get_json() == [5]
+
+
+def test_clean_shards_deletes_leftovers(core, delivered, monkeypatch):
+    ids_from(core, "a", 200000)
+    user_id, _ = user_on(core, "a", "leftover")
+
+    def disk_full(*args):
+        raise RuntimeError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(core, "delete_user_rows", disk_full)
+        result = move(core, user_id, "b")
+    assert result.exit_code != 0 and "flask clean-shards" in result.output
+    assert core.user_directory.locate(user_id) == ("b", False)
+    assert rows(core, "a", "user", user_id) == 1 and rows(core, "b", "user", user_id) == 1
+
+    runner = core.app.test_cli_runner()
+    result = runner.invoke(args=["clean-shards", "--dry-run"])
+    assert f"user {user_id}: leftover rows on a (moved to b)" in result.output
+    assert rows(core, "a", "user", user_id) == 1
+    result = runner.invoke(args=["clean-shards"])
+    assert result.exit_code == 0 and rows(core, "a", "user", user_id) == 0
+    assert rows(core, "a", "exercise", user_id) == 0 and rows(core, "b", "user", user_id) == 1
+    assert "0 leftover users deleted" in runner.invoke(args=["clean-shards"]).output
+
+
+def test_each_shard_relays_its_own_event_ids(core, delivered):
+    # outbox ids are per shard, so stats dedupes on (source, id): every event
+    # carries the shard it was written on, and a redelivery the same pair
+    for shard in ("a", "b"):
+        user_on(core, shard, f"events-{shard}")
+    core.run_outbox_relay()
+    first = [(e["source"], e["id"]) for e in delivered]
+    assert {source for source, _ in first} == {"a", "b"}
+    assert all(e["source"] == core.shard_router.shard_for(e["user_id"]) for e in delivered
+               if e["type"] == "user.registered")
+
+    for shard in ("a", "b"):
+        with core._shard_engine(shard).begin() as conn:
+            conn.execute(sa.text("UPDATE outbox_event SET published_at = NULL WHERE id IN :ids")
+                         .bindparams(sa.bindparam("ids", expanding=True)),
+                         {"ids": [i for source, i in first if source == shard]})
+    del delivered[:]
+    core.run_outbox_relay()
+    assert sorted((e["source"], e["id"]) for e in delivered) == sorted(first)
@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+
+
+def push(client, *workouts):
+    r = client.post("/sync", json={"workouts": list(workouts)})
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def item(client_id, **fields):
+    return dict({"client_id": client_id, "date": "2026-03-01", "exercise": "Row",
+                 "reps": [5], "weights": [60]}, **fields)
+
+
+def test_bad_items_are_rejected_one_by_one(make_client):
+    client = make_client("sync-bad")
+    result = push(client, item("ok"), item("huge", reps=["1e999"]), item("nan", weights=["nan"]),
+                  item("bad-exercise", exercise_id={"x": 1}), item("far", date="9999-01-01"),
+                  item("old", date="0001-01-01"))
+    assert [a["client_id"] for a in result["accepted"]] == ["ok"]
+    assert [r["client_id"] for r in result["rejected"]] == ["huge", "nan", "bad-exercise", "far", "old"]
+
+
+def test_repeated_item_in_one_push_is_stored_once(make_client, core):
+    client = make_client("sync-repeat")
+    result = push(client, item("same"), item("same"), item("other"))
+    first, repeat, other = result["accepted"]
+    assert first["duplicate"] is False and repeat["duplicate"] is True
+    assert first["id"] == repeat["id"] != other["id"]
+    assert push(client, item("same"))["accepted"][0] == dict(first, duplicate=True)
+
+
+def test_add_workout_dates_are_bounded(make_client, core):
+    client = make_client("add-dates")
+    client.post("/addExercise", json={"name": "Curl"})
+    user_id = core.user_directory.find("add-dates")[0]
+    with core.app.app_context(), core.shard_router.for_user(user_id):
+        exercise_id = core.getExercises(user_id)[0]["id"]
+
+    def add(day):
+        return client.post("/addWorkout", json={"workout": exercise_id, "sets": 1, "reps": [5],
+                                                "weights": [10], "date": day}).status_code
+
+    assert add(date.today().isoformat()) == 200
+    assert add((date.today() + timedelta(days=3 * 365)).isoformat()) == 400
+    assert add("0001-01-01") == 400
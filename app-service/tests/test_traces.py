@@ -0,0 +1,15 @@
+from tracing import InMemoryExporter
+
+
+def test_traces_needs_the_token(core, monkeypatch):
+    client = core.app.test_client()
+    monkeypatch.setattr(core.tracer, "exporter", InMemoryExporter())
+    assert client.get("/traces").status_code == 404
+
+    monkeypatch.setattr(core, "TRACES_TOKEN", "s3cret")
+    assert client.get("/traces").status_code == 401
+    assert client.get("/traces", headers={"Authorization": "Bearer nope"}).status_code == 401
+    # non-ASCII headers are a wrong token, not a server error
+    assert client.get("/traces", headers={"Authorization": "Bearer é"}).status_code == 401
+    r = client.get("/traces", headers={"Authorization": "Bearer s3cret"})
+    assert r.status_code == 200 and isinstance(r.get_json(), list)
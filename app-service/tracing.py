@@ -0,0 +1,194 @@
+from collections import deque
+from contextvars import ContextVar
+import importlib
+import threading
+import time
+import json
+import os
+
+
+# W3C trace context: 00-<32 hex trace id>-<16 hex span id>-<2 hex flags>
+TRACEPARENT_HEADER = "traceparent"
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, tracer, name, trace_id, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        self.status = "error"
+        self.attributes["error.type"] = type(exc).__name__
+        self.attributes["error.message"] = str(exc)
+
+    def end(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        self.tracer.export(self)
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.tracer.service,
+            "start_time": self.start_time,
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+    def end(self):
+        pass
+
+    def traceparent(self):
+        return None
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class InMemoryExporter:
+    # keeps the last N finished spans, for /traces and tests
+    def __init__(self, max_spans=5000):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+    def clear(self):
+        self.spans.clear()
+
+
+class FileExporter:
+    # one JSON object per line
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def load_exporter(spec, path=None):
+    # "none" | "memory" | "file" | "package.module:ExporterClass"
+    if not spec or spec == "none":
+        return None
+    if spec == "memory":
+        return InMemoryExporter()
+    if spec == "file":
+        return FileExporter(path or "traces.jsonl")
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def parse_traceparent(value):
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None, None
+    return parts[1], parts[2]
+
+
+class Tracer:
+    def __init__(self, service, exporter=None):
+        self.service = service
+        self.exporter = exporter
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    def export(self, span):
+        try:
+            self.exporter.export(span)
+        except Exception:
+            # tracing must never break a request
+            pass
+
+    def current_span(self):
+        return _current_span.get()
+
+    def start_span(self, name, attributes=None, traceparent=None):
+        # parent: explicit traceparent header > current span > new trace
+        if not self.enabled:
+            return NOOP_SPAN
+        trace_id, parent_id = parse_traceparent(traceparent)
+        if trace_id is None:
+            parent = _current_span.get()
+            if parent is not None:
+                trace_id, parent_id = parent.trace_id, parent.span_id
+            else:
+                trace_id = os.urandom(16).hex()
+        return Span(self, name, trace_id, parent_id, attributes)
+
+    def activate(self, span):
+        # returns the previously active span so the caller can restore it
+        previous = _current_span.get()
+        if span is not NOOP_SPAN:
+            _current_span.set(span)
+        return previous
+
+    def restore(self, previous):
+        _current_span.set(previous)
+
+    def span(self, name, attributes=None):
+        return _SpanScope(self, name, attributes)
+
+    def inject(self, headers):
+        span = _current_span.get()
+        if span is not None:
+            headers[TRACEPARENT_HEADER] = span.traceparent()
+        return headers
+
+
+class _SpanScope:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.span = self.tracer.start_span(self.name, self.attributes)
+        self.previous = self.tracer.activate(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.span.record_exception(exc)
+        self.tracer.restore(self.previous)
+        self.span.end()
+        return False
@@ -0,0 +1,288 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from itertools import chain
+import random
+import time
+
+import numpy as np
+
+
+PERIODS = ("week", "month")
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class SetFrame:
+    """
+    One row per logged set, stored column-wise: day, exercise_id, reps, weight.
+    Built once per request from (date, exercise_id, reps, extra_weight) rows;
+    every trend below is computed on the arrays without touching Python objects.
+    """
+
+    def __init__(self, days, exercise_ids, reps, weights):
+        self.days = days
+        self.exercise_ids = exercise_ids
+        self.reps = reps
+        self.weights = weights
+
+    @classmethod
+    def from_rows(cls, rows):
+        # reps / extra_weight are pickled per workout, so unpacking them is the
+        # one per-row Python step; pairs beyond the shorter list are ignored
+        days, exercise_ids, counts, reps, weights = [], [], [], [], []
+        for day, exercise_id, r, w in rows:
+            r = r or []
+            w = w or []
+            n = min(len(r), len(w))
+            # ordinals: numpy converts date objects one by one, ~20x slower
+            days.append(day.toordinal() - _EPOCH_ORDINAL)
+            exercise_ids.append(exercise_id)
+            counts.append(n)
+            reps.append(r if len(r) == n else r[:n])
+            weights.append(w if len(w) == n else w[:n])
+
+        counts = np.array(counts, dtype=np.int64)
+        return cls(
+            np.repeat(np.array(days, dtype=np.int64), counts).astype("datetime64[D]"),
+            np.repeat(np.array(exercise_ids, dtype=np.int64), counts),
+            np.nan_to_num(np.array(list(chain.from_iterable(reps)), dtype=np.float64)),
+            np.nan_to_num(np.array(list(chain.from_iterable(weights)), dtype=np.float64))
+        )
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def tonnage(self):
+        return self.reps * self.weights
+
+    def only_exercise(self, exercise_id):
+        mask = self.exercise_ids == exercise_id
+        return SetFrame(self.days[mask], self.exercise_ids[mask], self.reps[mask], self.weights[mask])
+
+
+def _weekday(days):
+    # 1970-01-01 was a Thursday; Monday == 0
+    return (days.astype(np.int64) + 3) % 7
+
+
+def bucket(days, period):
+    """Zero-filled bucket labels covering the data, plus the bucket index of each set."""
+    if period == "week":
+        starts = days - _weekday(days).astype("timedelta64[D]")
+        first = starts.min()
+        labels = np.arange(first, starts.max() + 1, 7)
+        return labels, ((starts - first) // 7).astype(np.int64)
+    if period == "month":
+        months = days.astype("datetime64[M]")
+        first = months.min()
+        labels = np.arange(first, months.max() + 1)
+        return labels, (months - first).astype(np.int64)
+    raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+
+
+def rolling_mean(values, window):
+    # trailing mean along the last axis; the first window-1 points average
+    # over what is available
+    csum = np.cumsum(values, axis=-1, dtype=np.float64)
+    shifted = np.zeros_like(csum)
+    shifted[..., window:] = csum[..., :-window]
+    counts = np.minimum(np.arange(1, values.shape[-1] + 1), window)
+    return (csum - shifted) / counts
+
+
+def _labels(labels):
+    return labels.astype(str).tolist()
+
+
+def tonnage_trend(frame, period="week", window=4):
+    if not len(frame):
+        return {"period": period, "window": window, "labels": [], "tonnage": [], "sets": [], "rolling_tonnage": []}
+    labels, idx = bucket(frame.days, period)
+    tonnage = np.bincount(idx, weights=frame.tonnage, minlength=len(labels))
+    sets = np.bincount(idx, minlength=len(labels))
+    return {
+        "period": period,
+        "window": window,
+        "labels": _labels(labels),
+        "tonnage": np.round(tonnage, 2).tolist(),
+        "sets": sets.tolist(),
+        "rolling_tonnage": np.round(rolling_mean(tonnage, window), 2).tolist()
+    }
+
+
+def exercise_volume(frame, period="week", window=4):
+    """Volume (reps x weight) per exercise and bucket, with a moving average."""
+    if not len(frame):
+        return {"period": period, "window": window, "labels": [], "exercises": []}
+    labels, idx = bucket(frame.days, period)
+    exercise_ids, ex_idx = np.unique(frame.exercise_ids, return_inverse=True)
+    grid = np.bincount(ex_idx * len(labels) + idx, weights=frame.tonnage,
+                       minlength=len(exercise_ids) * len(labels)).reshape(len(exercise_ids), len(labels))
+    moving = rolling_mean(grid, window)
+    return {
+        "period": period,
+        "window": window,
+        "labels": _labels(labels),
+        "exercises": [
+            {
+                "exercise_id": int(exercise_id),
+                "volume": np.round(grid[i], 2).tolist(),
+                "moving_average": np.round(moving[i], 2).tolist()
+            } for i, exercise_id in enumerate(exercise_ids)
+        ]
+    }
+
+
+def frequency_heatmap(frame):
+    """Sets per weekday (rows, Monday first) and week (columns)."""
+    if not len(frame):
+        return {"weekdays": list(WEEKDAYS), "weeks": [], "sets": [[] for _ in WEEKDAYS], "training_days": []}
+    labels, week_idx = bucket(frame.days, "week")
+    weekday = _weekday(frame.days)
+    grid = np.bincount(weekday * len(labels) + week_idx,
+                       minlength=7 * len(labels)).reshape(7, len(labels))
+    return {
+        "weekdays": list(WEEKDAYS),
+        "weeks": _labels(labels),
+        "sets": grid.tolist(),
+        "training_days": np.count_nonzero(grid, axis=0).tolist()
+    }
+
+
+def weight_percentiles(frame, qs=(50, 75, 90, 95)):
+    """Per-exercise percentiles of the weight used on working (weight > 0) sets."""
+    working = frame.weights > 0
+    exercise_ids = frame.exercise_ids[working]
+    weights = frame.weights[working]
+    if not len(weights):
+        return {"percentiles": list(qs), "exercises": []}
+    order = np.lexsort((weights, exercise_ids))
+    exercise_ids, weights = exercise_ids[order], weights[order]
+    uniq, starts, counts = np.unique(exercise_ids, return_index=True, return_counts=True)
+    # linear interpolation on the sorted slices, all exercises at once
+    pos = (np.asarray(qs, dtype=np.float64)[None, :] / 100.0) * (counts[:, None] - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, counts[:, None] - 1)
+    frac = pos - lo
+    values = weights[starts[:, None] + lo] * (1 - frac) + weights[starts[:, None] + hi] * frac
+    return {
+        "percentiles": list(qs),
+        "exercises": [
+            {
+                "exercise_id": int(exercise_id),
+                "sets": int(counts[i]),
+                "weights": np.round(values[i], 2).tolist()
+            } for i, exercise_id in enumerate(uniq)
+        ]
+    }
+
+
+# pure-Python reference implementations, used by the benchmark to check the
+# vectorized results
+
+def _reference_tonnage_trend(rows, window):
+    weekly = defaultdict(float)
+    for day, _, reps, weights in rows:
+        week = day - timedelta(days=day.weekday())
+        for i in range(min(len(reps or []), len(weights or []))):
+            weekly[week] += float(reps[i] or 0) * float(weights[i] or 0)
+    first, last = min(weekly), max(weekly)
+    series = []
+    week = first
+    while week <= last:
+        series.append(weekly.get(week, 0.0))
+        week += timedelta(days=7)
+    rolling = []
+    for i in range(len(series)):
+        chunk = series[max(0, i - window + 1):i + 1]
+        rolling.append(sum(chunk) / len(chunk))
+    return series, rolling
+
+
+def _reference_weight_percentiles(rows, qs):
+    per_exercise = defaultdict(list)
+    for _, exercise_id, reps, weights in rows:
+        for i in range(min(len(reps or []), len(weights or []))):
+            w = float(weights[i] or 0)
+            if w > 0:
+                per_exercise[exercise_id].append(w)
+    result = {}
+    for exercise_id, values in per_exercise.items():
+        values.sort()
+        out = []
+        for q in qs:
+            pos = q / 100.0 * (len(values) - 1)
+            lo = int(pos)
+            hi = min(lo + 1, len(values) - 1)
+            out.append(values[lo] * (1 - (pos - lo)) + values[hi] * (pos - lo))
+        result[exercise_id] = out
+    return result
+
+
+def synthetic_rows(n_sets, n_exercises=12, years=5, seed=1):
+    """(date, exercise_id, reps, extra_weight) rows, 3-5 sets per workout."""
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=365 * years)
+    rows, total = [], 0
+    while total < n_sets:
+        sets = min(rng.randint(3, 5), n_sets - total)
+        weight = rng.choice([0, 20, 40, 60, 80, 100, 120])
+        rows.append((
+            start + timedelta(days=rng.randrange(365 * years)),
+            rng.randrange(1, n_exercises + 1),
+            [rng.randint(1, 12) for _ in range(sets)],
+            [weight] * sets
+        ))
+        total += sets
+    return rows
+
+
+def benchmark(n_sets=100_000, window=4, repeat=3):
+    """Time the vectorized trends against the pure-Python reference."""
+    rows = synthetic_rows(n_sets)
+    qs = (50, 75, 90, 95)
+
+    def best_of(fn):
+        best, result = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def vectorized():
+        frame = SetFrame.from_rows(rows)
+        return tonnage_trend(frame, "week", window), weight_percentiles(frame, qs)
+
+    def reference():
+        return _reference_tonnage_trend(rows, window), _reference_weight_percentiles(rows, qs)
+
+    frame = SetFrame.from_rows(rows)
+    build_time, _ = best_of(lambda: SetFrame.from_rows(rows))
+    compute_time, _ = best_of(lambda: (tonnage_trend(frame, "week", window), weight_percentiles(frame, qs)))
+    numpy_time, (trend, pct) = best_of(vectorized)
+    python_time, ((series, rolling), ref_pct) = best_of(reference)
+
+    # not assert: the comparison must also run under python -O
+    mismatches = [name for name, ok in [
+        ("tonnage", np.allclose(trend["tonnage"], series, atol=0.01)),
+        ("rolling_tonnage", np.allclose(trend["rolling_tonnage"], rolling, atol=0.01)),
+    ] + [(f"percentiles of exercise {e['exercise_id']}",
+          np.allclose(e["weights"], ref_pct[e["exercise_id"]], atol=0.01)) for e in pct["exercises"]]
+        if not ok]
+    if mismatches:
+        raise RuntimeError(f"vectorized results differ from the reference: {', '.join(mismatches)}")
+
+    # end to end includes unpacking the pickled rows, which stays per-row Python
+    return {
+        "sets": len(frame),
+        "workouts": len(rows),
+        "python_seconds": round(python_time, 4),
+        "numpy_seconds": round(numpy_time, 4),
+        "numpy_build_seconds": round(build_time, 4),
+        "numpy_compute_seconds": round(compute_time, 4),
+        "speedup": round(python_time / numpy_time, 1),
+        "compute_speedup": round(python_time / compute_time, 1)
+    }
@@ -1,13 +1,52 @@
+import time
+
+# taken before the other imports, the startup metric includes loading them
+STARTED_AT = time.perf_counter()
+
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-from flask import Flask, jsonify, request, Response
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-from flasgger import Swagger
+from flask import Flask, jsonify, request, Response, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.engine import Engine
+from sqlalchemy import event
+from datetime import datetime, date
+from tracing import Tracer, load_exporter, TRACEPARENT_HEADER
+from records import apply_session, record_to_dict, estimated_1rm
+from sketch import TDigest
+from jobs import JobRunner, MemoryJobStore, SQLJobStore, QueueFull
+from startup import LazySwagger, LazySQLAlchemy, time_to_healthy, free_port
+from probes import HealthChecks, GracefulDrain, warm_pool, check_database
+from sharding import ShardRouter, ShardMoving, UserDirectory, parse_shard_urls, shard_binds, sharded_session
+from werkzeug.serving import make_server
+import analytics
+from sqlalchemy.exc import IntegrityError
+from itertools import groupby
 import requests
-import time
+import click
+import threading
+import functools
+import hashlib
+import hmac
+import random
+import json
+import sys
+import re
 import os
 
 
+def parse_buckets(value, default):
+    # "0.05,0.1,0.5" -> (0.05, 0.1, 0.5)
+    if not value:
+        return default
+    return tuple(sorted(float(b) for b in value.split(",") if b.strip()))
+
+
+# most requests are single-digit ms DB lookups, proxied stats calls can take
+# several seconds when tenacity retries kick in
+HTTP_LATENCY_BUCKETS = parse_buckets(
+    os.getenv("HTTP_LATENCY_BUCKETS"),
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 7.5, 10.0)
+)
+
 REQUEST_COUNT = Counter(
     "http_requests_total",
     "Total HTTP requests",
@@ -17,7 +56,8 @@ REQUEST_COUNT = Counter(
 REQUEST_LATENCY = Histogram(
     "http_request_duration_seconds",
     "HTTP request latency (seconds)",
-    ["service", "method", "endpoint"]
+    ["service", "method", "endpoint"],
+    buckets=HTTP_LATENCY_BUCKETS
 )
 
 IN_PROGRESS = Gauge(
@@ -26,7 +66,80 @@ IN_PROGRESS = Gauge(
     ["service"]
 )
 
+DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per HTTP request",
+    ["service", "method", "endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+
+DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in the database per HTTP request (seconds)",
+    ["service", "method", "endpoint"],
+    buckets=HTTP_LATENCY_BUCKETS
+)
+
+SLOW_QUERIES = Counter(
+    "db_slow_queries_total",
+    "SQL statements slower than SLOW_QUERY_THRESHOLD_MS",
+    ["service", "fingerprint"]
+)
+
+JOB_EVENTS = Counter(
+    "stats_jobs_total",
+    "Background jobs by type and event (submitted, deduplicated, rejected, succeeded, failed)",
+    ["service", "type", "event"]
+)
+
+JOB_DURATION = Histogram(
+    "stats_job_duration_seconds",
+    "Background job run time (seconds)",
+    ["service", "type", "status"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+
+JOB_QUEUE_DEPTH = Gauge(
+    "stats_job_queue_depth",
+    "Background jobs waiting for a worker",
+    ["service"]
+)
+
+JOB_RUNNING = Gauge(
+    "stats_jobs_running",
+    "Background jobs currently running",
+    ["service"]
+)
+
+EVENTS_CONSUMED = Counter(
+    "stats_events_total",
+    "Domain events received from core, by outcome (applied, duplicate, rejected)",
+    ["service", "type", "outcome"]
+)
+
+EVENTS_LAG = Gauge(
+    "stats_event_lag_seconds",
+    "Time between an event being written by core and applied here (last batch)",
+    ["service"]
+)
+
+APP_STARTUP = Gauge(
+    "app_startup_seconds",
+    "Seconds from process start to the end of module import (phase=import) / the first response (phase=first_response)",
+    ["service", "phase"]
+)
+
 SERVICE_NAME = os.getenv("SERVICE_NAME", "stats")
+PORT = int(os.getenv("PORT", "5000"))
+# FLASK_DEBUG=0 in the cluster: no reloader (which starts the app twice), no debugger
+DEBUG = os.getenv("FLASK_DEBUG", "1").lower() in ("1", "true", "yes")
+
+# TRACE_EXPORTER: none (default) | memory | file | module:ExporterClass
+tracer = Tracer(SERVICE_NAME, load_exporter(
+    os.getenv("TRACE_EXPORTER"), os.getenv("TRACE_FILE")))
+# spans carry every user's queries and ids: /traces needs
+# "Authorization: Bearer $TRACES_TOKEN" and is off without it
+TRACES_TOKEN = os.getenv("TRACES_TOKEN", "")
 
 
 app = Flask(__name__)
@@ -39,19 +152,56 @@ swagger_template = {
         "version": "1.0.0"
     }
 }
-Swagger(app, template=swagger_template)
+# flasgger is only imported when /apidocs is first opened
+LazySwagger(app, template=swagger_template)
+
+
+class TracedJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        with tracer.span("json.serialize"):
+            return super().response(*args, **kwargs)
+
+
+app.json = TracedJSONProvider(app)
+
+
+def with_driver(url):
+    # explicit driver: SQLAlchemy 2.1 defaults postgresql:// to psycopg 3, requirements ship psycopg2
+    if url.startswith(("postgres://", "postgresql://")):
+        return "postgresql+psycopg2://" + url.split("://", 1)[1]
+    return url
 
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL env var is required")
-
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+DATABASE_URL = with_driver(DATABASE_URL)
 
 app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-db = SQLAlchemy(app)
+
+
+def _db_engine():
+    with app.app_context():
+        return db.engine
+
+
+# SHARD_*: the same settings as core (see there). workout and exercise are
+# read from the user's shard, the stats_* tables stay on DATABASE_URL.
+SHARD_URLS = {name: with_driver(url)
+              for name, url in parse_shard_urls(os.getenv("SHARD_URLS")).items()}
+SHARD_DIRECTORY_TTL = float(os.getenv("SHARD_DIRECTORY_TTL", "5"))
+SHARDED_TABLES = ("workout", "exercise")
+
+app.config["SQLALCHEMY_BINDS"], SHARD_BIND_KEYS = shard_binds(SHARD_URLS, DATABASE_URL)
+shard_router = ShardRouter(
+    SHARD_URLS, scheme=os.getenv("SHARD_ROUTING", "hash"), directory=UserDirectory(_db_engine),
+    cache_ttl=SHARD_DIRECTORY_TTL, vnodes=int(os.getenv("SHARD_VNODES", "64")),
+    id_range=int(os.getenv("SHARD_ID_RANGE", "0")))
+
+# the engine is created on first use, not at import
+db = LazySQLAlchemy(app, session_options={
+    "class_": sharded_session(shard_router, SHARDED_TABLES, SHARD_BIND_KEYS)})
 
 
 class Workout(db.Model):
@@ -76,12 +226,206 @@ class Exercise(db.Model):
         return {"id": self.id, "name": self.name, "user_id": self.user_id}
 
 
+# stats-owned read model (tables prefixed stats_, created by the core migrations)
+
+class PersonalRecord(db.Model):
+    __tablename__ = "stats_personal_record"
+    user_id = db.Column(db.Integer, primary_key=True)
+    exercise_id = db.Column(db.Integer, primary_key=True)
+    best_weight = db.Column(db.Float, nullable=True)
+    best_weight_reps = db.Column(db.Integer, nullable=True)
+    best_weight_date = db.Column(db.Date, nullable=True)
+    best_e1rm = db.Column(db.Float, nullable=True)
+    best_e1rm_date = db.Column(db.Date, nullable=True)
+    best_tonnage = db.Column(db.Float, nullable=True)
+    best_tonnage_date = db.Column(db.Date, nullable=True)
+    # {"<weight>": max reps} as JSON text
+    reps_at_weight = db.Column(db.Text, nullable=True)
+    last_session_date = db.Column(db.Date, nullable=True)
+    last_session_tonnage = db.Column(db.Float, nullable=True)
+
+
+class RecordWatermark(db.Model):
+    __tablename__ = "stats_record_watermark"
+    user_id = db.Column(db.Integer, primary_key=True)
+    last_workout_id = db.Column(db.Integer, nullable=False, default=0)
+
+
+class QuantileSketch(db.Model):
+    __tablename__ = "stats_quantile_sketch"
+    # normalized exercise name, shared by every user logging it
+    exercise_name = db.Column(db.String(50), primary_key=True)
+    metric = db.Column(db.String(16), primary_key=True)
+    digest = db.Column(db.Text, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.Float, nullable=True)
+
+
+class DayTotals(db.Model):
+    __tablename__ = "stats_day_totals"
+    # what a user logged of one exercise on one day; the back-dated prior of
+    # the records and the summary's date ranges in events mode
+    user_id = db.Column(db.Integer, primary_key=True)
+    exercise_id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    workouts = db.Column(db.Integer, nullable=False, default=0)
+    sets = db.Column(db.Integer, nullable=False, default=0)
+    reps = db.Column(db.Integer, nullable=False, default=0)
+    tonnage = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class UserSummary(db.Model):
+    __tablename__ = "stats_user_summary"
+    # /stats/summary without a date range in events mode
+    user_id = db.Column(db.Integer, primary_key=True)
+    workouts = db.Column(db.Integer, nullable=False, default=0)
+    sets = db.Column(db.Integer, nullable=False, default=0)
+    reps = db.Column(db.Integer, nullable=False, default=0)
+    tonnage = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class IngestWatermark(db.Model):
+    __tablename__ = "stats_ingest_watermark"
+    name = db.Column(db.String(50), primary_key=True)
+    last_workout_id = db.Column(db.Integer, nullable=False, default=0)
+    # JSON [[low, high, seen_at]]: id ranges below last_workout_id not read yet
+    gaps = db.Column(db.Text, nullable=True)
+
+
+class ProcessedEvent(db.Model):
+    __tablename__ = "stats_processed_event"
+    # core outbox_event.id and the shard it came from ('' unsharded); makes
+    # redelivered events a no-op
+    source = db.Column(db.String(50), primary_key=True)
+    event_id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    processed_at = db.Column(db.Float, nullable=False, index=True)
+
+
+def _shard_engine(name=None):
+    # the named (default: currently selected) shard's engine
+    name = name or shard_router.current()
+    with app.app_context():
+        return db.engines[SHARD_BIND_KEYS[name]] if name else db.engine
+
+
+# background jobs; JOB_BACKEND: memory (default, single process) | db (stats_job table)
+JOB_BACKEND = os.getenv("JOB_BACKEND", "memory")
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+# seconds without a heartbeat after which a db job's replica counts as gone
+JOB_LEASE = float(os.getenv("JOB_LEASE", "60"))
+
+
+def record_job_event(event, job_type, duration=None):
+    JOB_EVENTS.labels(SERVICE_NAME, job_type, event).inc()
+    if duration is not None:
+        JOB_DURATION.labels(SERVICE_NAME, job_type, event).observe(duration)
+
+
+job_runner = JobRunner(
+    SQLJobStore(_db_engine, lease=JOB_LEASE) if JOB_BACKEND == "db" else MemoryJobStore(),
+    max_workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_queue=int(os.getenv("JOB_MAX_QUEUE", "100")),
+    result_ttl=float(os.getenv("JOB_RESULT_TTL", "3600")),
+    context=app.app_context,
+    on_event=record_job_event
+)
+JOB_QUEUE_DEPTH.labels(SERVICE_NAME).set_function(job_runner.depth)
+JOB_RUNNING.labels(SERVICE_NAME).set_function(job_runner.running)
+
+
 TIMEZONEDB_API_KEY = os.getenv("TIMEZONEDB_API_KEY")
 DEFAULT_TZ = os.getenv("DEFAULT_TZ", "Europe/Ljubljana")
 
 
 # helpers
 
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "0"))
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_PARAMS = re.compile(r"%\(\w+\)s|%s|\?|(?<!:):\w+")
+_SQL_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SQL_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint_sql(statement):
+    # literals / bind params -> ?, IN (?, ?, ...) -> (?+), collapse whitespace
+    sql = _SQL_LITERALS.sub("?", statement)
+    sql = _SQL_PARAMS.sub("?", sql)
+    sql = _SQL_IN_LISTS.sub("(?+)", sql)
+    return _SQL_WHITESPACE.sub(" ", sql).strip()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def db_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start_time"] = time.perf_counter()
+    if tracer.current_span() is not None:
+        conn.info["query_span"] = tracer.start_span("db.query")
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def db_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("query_start_time", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    span = conn.info.pop("query_span", None)
+    if span is not None:
+        span.set_attribute("db.statement", fingerprint_sql(statement))
+        span.end()
+    if has_request_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_time = g.get("db_time", 0.0) + elapsed
+    if SLOW_QUERY_THRESHOLD_MS and elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        fingerprint = fingerprint_sql(statement)
+        digest = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+        SLOW_QUERIES.labels(SERVICE_NAME, digest).inc()
+        app.logger.warning("slow query %.1fms [%s] %s",
+                           elapsed * 1000, digest, fingerprint)
+
+
+def endpoint_label():
+    # label by the matched URL rule, not the raw path, so /workouts/<date>
+    # stays a single series; anything unrouted (404s) shares one bucket
+    rule = request.url_rule
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+@app.before_request
+def trace_before():
+    if not tracer.enabled:
+        return
+    span = tracer.start_span(
+        f"{request.method} {endpoint_label()}",
+        {"http.method": request.method, "http.target": request.full_path},
+        traceparent=request.headers.get(TRACEPARENT_HEADER)
+    )
+    g.trace_previous = tracer.activate(span)
+    g.trace_span = span
+
+
+@app.after_request
+def trace_after(response):
+    span = g.get("trace_span")
+    if span is not None:
+        span.set_attribute("http.status_code", response.status_code)
+    return response
+
+
+@app.teardown_request
+def trace_teardown(exc):
+    span = g.pop("trace_span", None)
+    if span is None:
+        return
+    if exc is not None:
+        span.record_exception(exc)
+    tracer.restore(g.pop("trace_previous", None))
+    span.end()
+
+
+first_response_recorded = False
+
+
 @app.before_request
 def metrics_before():
     IN_PROGRESS.labels(SERVICE_NAME).inc()
@@ -92,16 +436,582 @@ def metrics_before():
 def metrics_after(response):
     try:
         elapsed = time.time() - getattr(request, "_start_time", time.time())
-        endpoint = request.path
+        endpoint = endpoint_label()
         REQUEST_LATENCY.labels(
             SERVICE_NAME, request.method, endpoint).observe(elapsed)
         REQUEST_COUNT.labels(SERVICE_NAME, request.method,
                              endpoint, str(response.status_code)).inc()
+        DB_QUERIES.labels(SERVICE_NAME, request.method,
+                          endpoint).observe(g.get("db_queries", 0))
+        DB_DURATION.labels(SERVICE_NAME, request.method,
+                           endpoint).observe(g.get("db_time", 0.0))
     finally:
         IN_PROGRESS.labels(SERVICE_NAME).dec()
+    global first_response_recorded
+    if not first_response_recorded:
+        first_response_recorded = True
+        APP_STARTUP.labels(SERVICE_NAME, "first_response").set(time.perf_counter() - STARTED_AT)
     return response
 
 
+# per-user routes read workout / exercise from the ?user_id= user's shard
+@app.before_request
+def shard_before():
+    user_id = request.args.get("user_id", type=int)
+    shard = shard_router.shard_for(user_id) if shard_router.enabled and user_id else None
+    g.shard_previous = shard_router.activate(shard)
+
+
+@app.teardown_request
+def shard_teardown(exc):
+    if "shard_previous" in g:
+        shard_router.restore(g.pop("shard_previous"))
+
+
+@app.errorhandler(ShardMoving)
+def shard_moving(e):
+    # core is moving the user to another shard; events are redelivered
+    return jsonify({"error": "user is being moved, retry shortly"}), 503, \
+        {"Retry-After": str(max(1, int(SHARD_DIRECTORY_TTL)))}
+
+
+def filter_date_range(query):
+    # optional ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive); plain dates so
+    # Postgres can prune workout partitions. Raises ValueError on bad input.
+    start = request.args.get("from")
+    end = request.args.get("to")
+    if start:
+        query = query.filter(Workout.date >= date.fromisoformat(start))
+    if end:
+        query = query.filter(Workout.date <= date.fromisoformat(end))
+    return query
+
+
+def fold_totals(user_id, exercise_id, day, workouts):
+    """
+    Add workouts to the user's day and summary totals, kept next to the
+    records (same watermark). Returns the tonnage already folded into the
+    day, i.e. the prior of a back-dated session.
+    """
+    day_totals = db.session.get(DayTotals, (user_id, exercise_id, day))
+    if day_totals is None:
+        day_totals = DayTotals(user_id=user_id, exercise_id=exercise_id, date=day,
+                               workouts=0, sets=0, reps=0, tonnage=0.0)
+        db.session.add(day_totals)
+    summary = db.session.get(UserSummary, user_id)
+    if summary is None:
+        summary = UserSummary(user_id=user_id, workouts=0, sets=0, reps=0, tonnage=0.0)
+        db.session.add(summary)
+    prior = day_totals.tonnage
+
+    for w in workouts:
+        reps_list = w.reps or []
+        weights_list = w.extra_weight or []
+        reps, tonnage = 0, 0.0
+        for i in range(min(len(reps_list), len(weights_list))):
+            reps += int(reps_list[i] or 0)
+            tonnage += float(reps_list[i] or 0) * float(weights_list[i] or 0)
+        for totals in (day_totals, summary):
+            totals.workouts += 1
+            totals.sets += w.sets or 0
+            totals.reps += reps
+            totals.tonnage += tonnage
+    return prior
+
+
+def fold_new_workouts(user_id):
+    # refresh_records without the commit
+    mark = db.session.get(RecordWatermark, user_id, with_for_update=True)
+    fresh = mark is None
+    if fresh:
+        mark = RecordWatermark(user_id=user_id, last_workout_id=0)
+        db.session.add(mark)
+    applied_up_to = mark.last_workout_id
+
+    query = Workout.query.filter(Workout.user_id == user_id, Workout.id > applied_up_to)
+    # with SHARD_ID_RANGE new workouts get ids from the shard's range; rows
+    # moved in keep another shard's ids and are only read by a fresh rebuild
+    bounds = shard_router.id_bounds(shard_router.current())
+    if bounds is not None and not fresh:
+        query = query.filter(Workout.id <= bounds[1])
+    new_workouts = query.order_by(Workout.exercise_id, Workout.date, Workout.id).all()
+    if new_workouts:
+        _apply_workouts(user_id, new_workouts, applied_up_to)
+        mark.last_workout_id = max(w.id for w in new_workouts)
+        if bounds is not None:
+            mark.last_workout_id = max([w.id for w in new_workouts if bounds[0] < w.id <= bounds[1]]
+                                       + [applied_up_to, bounds[0]])
+    return len(new_workouts)
+
+
+def refresh_records(user_id):
+    """
+    Fold the user's workouts logged since the last refresh into their personal
+    records. Only workouts past the user's watermark are read, so a refresh
+    costs O(new workouts) and reading the records O(exercises).
+    """
+    applied = fold_new_workouts(user_id)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # another worker created the watermark first and did the same work
+        db.session.rollback()
+    return applied
+
+
+def _apply_workouts(user_id, new_workouts, applied_up_to):
+    records = {r.exercise_id: r for r in PersonalRecord.query.filter_by(user_id=user_id)}
+    for (exercise_id, day), session_workouts in groupby(new_workouts, key=lambda w: (w.exercise_id, w.date)):
+        record = records.get(exercise_id)
+        if record is None:
+            record = records[exercise_id] = PersonalRecord(user_id=user_id, exercise_id=exercise_id)
+            db.session.add(record)
+
+        session_workouts = list(session_workouts)
+        applied = fold_totals(user_id, exercise_id, day, session_workouts)
+        prior = 0.0
+        if record.last_session_date == day:
+            prior = record.last_session_tonnage or 0.0
+        elif record.last_session_date is not None and day < record.last_session_date:
+            # back-dated entry, the day may already have a partial session
+            prior = applied
+        apply_session(record, day, session_workouts, prior)
+
+
+def rebuild_records(user_id):
+    # one transaction; readers see the old records until commit
+    PersonalRecord.query.filter_by(user_id=user_id).delete()
+    DayTotals.query.filter_by(user_id=user_id).delete()
+    UserSummary.query.filter_by(user_id=user_id).delete()
+    RecordWatermark.query.filter_by(user_id=user_id).delete()
+    return refresh_records(user_id)
+
+
+# cross-user quantile sketches per exercise name
+
+SKETCH_METRICS = ("tonnage", "e1rm")
+SKETCH_COMPRESSION = int(os.getenv("SKETCH_COMPRESSION", "100"))
+SKETCH_INTERVAL = float(os.getenv("SKETCH_INTERVAL", "30"))
+SKETCH_CACHE_TTL = float(os.getenv("SKETCH_CACHE_TTL", "30"))
+# Postgres assigns ids at INSERT, so a workout can commit after ones with
+# higher ids; ids a scan skipped are looked for again for this many seconds
+SKETCH_GAP_TTL = float(os.getenv("SKETCH_GAP_TTL", "600"))
+_sketch_cache = {}
+
+
+def normalize_exercise_name(name):
+    return " ".join((name or "").lower().split())
+
+
+def sketch_values(reps_list, weights_list):
+    # tonnage per workout, estimated 1RM per working set
+    values = {"tonnage": [], "e1rm": []}
+    tonnage = 0.0
+    for i in range(min(len(reps_list or []), len(weights_list or []))):
+        reps = int(reps_list[i] or 0)
+        weight = float(weights_list[i] or 0)
+        tonnage += reps * weight
+        if reps > 0 and weight > 0:
+            values["e1rm"].append(estimated_1rm(weight, reps))
+    if tonnage > 0:
+        values["tonnage"].append(tonnage)
+    return values
+
+
+def update_sketches(entries):
+    """
+    Add (exercise_name, reps, extra_weight) entries to the stored sketches and
+    compact them. Caller commits.
+    """
+    additions = {}
+    for name, reps, weights in entries:
+        for metric, values in sketch_values(reps, weights).items():
+            if values:
+                additions.setdefault((normalize_exercise_name(name), metric), []).extend(values)
+    if not additions:
+        return 0
+
+    names = {name for name, _ in additions}
+    rows = {(r.exercise_name, r.metric): r for r in
+            QuantileSketch.query.filter(QuantileSketch.exercise_name.in_(names))}
+    now = time.time()
+    for key, values in additions.items():
+        row = rows.get(key)
+        if row is None:
+            row = QuantileSketch(exercise_name=key[0], metric=key[1])
+            db.session.add(row)
+            digest = TDigest(SKETCH_COMPRESSION)
+        else:
+            digest = TDigest.from_dict(json.loads(row.digest))
+        for value in values:
+            digest.add(value)
+        digest.compress()
+        row.digest = json.dumps(digest.to_dict())
+        row.count = digest.count
+        row.updated_at = now
+        _sketch_cache[key] = (digest, time.monotonic())
+    return len(additions)
+
+
+def sketch_watermark(shard):
+    # workout ids only increase within one shard: a watermark per shard
+    return f"sketches:{shard}" if shard else "sketches"
+
+
+def ingest_sketches(batch_size=5000):
+    """
+    Fold workouts logged since the last run into the sketches, in id order,
+    batch_size at a time. Returns the number of workouts read.
+    """
+    total = 0
+    for shard in shard_router.names or [None]:
+        with shard_router.use(shard):
+            total += _ingest_shard_sketches(shard, batch_size)
+    return total
+
+
+def _id_gaps(after, ids, seen_at):
+    # [low, high, seen_at] ranges of the ids in (after, ids[-1]) missing from ids (sorted)
+    gaps, expected = [], after + 1
+    for i in ids:
+        if i > expected:
+            gaps.append([expected, i - 1, seen_at])
+        expected = i + 1
+    return gaps
+
+
+def _in_gaps(mark, workout_id):
+    return any(low <= workout_id <= high for low, high, _ in json.loads(mark.gaps or "[]"))
+
+
+def _ingest_shard_sketches(shard, batch_size):
+    total = 0
+    # rows moved in from other shards (their ids) were counted there
+    bounds = shard_router.id_bounds(shard)
+    check_gaps = True
+    while True:
+        mark = db.session.get(IngestWatermark, sketch_watermark(shard), with_for_update=True)
+        if mark is None:
+            mark = IngestWatermark(name=sketch_watermark(shard), last_workout_id=0)
+            db.session.add(mark)
+        now = time.time()
+        gaps = [g for g in json.loads(mark.gaps or "[]") if now - g[2] < SKETCH_GAP_TTL]
+        query = db.session.query(Workout.id, Exercise.name, Workout.reps, Workout.extra_weight).join(
+            Exercise, Exercise.id == Workout.exercise_id)
+
+        rows = []
+        if check_gaps and gaps:
+            # committed since the last pass, behind the watermark
+            rows = query.filter(db.or_(*(Workout.id.between(low, high) for low, high, _ in gaps))) \
+                .order_by(Workout.id).all()
+            found = [r.id for r in rows]
+            gaps = [g for low, high, seen_at in gaps
+                    for g in _id_gaps(low - 1, [i for i in found if low <= i <= high] + [high + 1], seen_at)]
+        check_gaps = False
+
+        after = max(mark.last_workout_id, bounds[0]) if bounds is not None else mark.last_workout_id
+        query = query.filter(Workout.id > after)
+        if bounds is not None:
+            query = query.filter(Workout.id <= bounds[1])
+        new_rows = query.order_by(Workout.id).limit(batch_size).all()
+        if new_rows:
+            gaps += _id_gaps(after, [r.id for r in new_rows], now)
+            mark.last_workout_id = new_rows[-1].id
+        rows += new_rows
+        if rows:
+            update_sketches((r.name, r.reps, r.extra_weight) for r in rows)
+        mark.gaps = json.dumps(gaps) if gaps else None
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # another replica created the watermark first; it does this batch
+            db.session.rollback()
+            return total
+        total += len(rows)
+        if len(new_rows) < batch_size:
+            return total
+
+
+def load_sketch(exercise_name, metric):
+    # served from memory; the stored sketch is re-read at most every SKETCH_CACHE_TTL
+    key = (exercise_name, metric)
+    cached = _sketch_cache.get(key)
+    if cached is not None and time.monotonic() - cached[1] < SKETCH_CACHE_TTL:
+        return cached[0]
+    row = db.session.get(QuantileSketch, key)
+    digest = TDigest.from_dict(json.loads(row.digest)) if row is not None else None
+    _sketch_cache[key] = (digest, time.monotonic())
+    return digest
+
+
+def start_sketch_updater():
+    if SKETCH_INTERVAL <= 0 or STATS_INGEST != "scan":
+        return
+
+    def loop():
+        while True:
+            try:
+                with app.app_context():
+                    ingest_sketches()
+            except Exception:
+                app.logger.exception("sketch update failed")
+            time.sleep(SKETCH_INTERVAL)
+
+    threading.Thread(target=loop, name="sketch-updater", daemon=True).start()
+
+
+# probes: /health/live (process serves), /health/startup (warm-up done),
+# /health/ready (warmed up, DB reachable, not draining); the readiness checks
+# run at most every READINESS_CACHE_TTL seconds. On SIGTERM new requests get
+# 503 while in-flight ones get up to DRAIN_TIMEOUT seconds to finish.
+READINESS_CACHE_TTL = float(os.getenv("READINESS_CACHE_TTL", "2"))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "25"))
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "2"))
+PROBE_PATHS = ("/health/live", "/health/ready", "/health/startup", "/metrics")
+
+drain = GracefulDrain(app.wsgi_app, timeout=DRAIN_TIMEOUT, exempt=PROBE_PATHS)
+app.wsgi_app = drain
+health_checks = HealthChecks(cache_ttl=READINESS_CACHE_TTL, drain=drain)
+health_checks.add_check("database", lambda: check_database(_db_engine()))
+for _shard in shard_router.names:
+    if SHARD_BIND_KEYS[_shard] is not None:
+        health_checks.add_check(f"shard_{_shard}",
+                                functools.partial(lambda name: check_database(_shard_engine(name)), _shard))
+
+
+def _check_job_queue():
+    depth = job_runner.depth()
+    if depth >= job_runner.max_queue:
+        raise RuntimeError(f"job queue full ({depth}), submissions get 503")
+    return {"depth": depth, "running": job_runner.running()}
+
+
+# not critical: a full queue only rejects job submissions, other routes work
+health_checks.add_check("job_queue", _check_job_queue, critical=False)
+
+
+def warm_db_pool():
+    warm_pool(_db_engine(), DB_POOL_WARM)
+    for name in shard_router.names:
+        if SHARD_BIND_KEYS[name] is not None:
+            warm_pool(_shard_engine(name), DB_POOL_WARM)
+
+
+def warm_sketch_cache():
+    # percentile requests are then answered from memory from the first one
+    with app.app_context():
+        now = time.monotonic()
+        for row in QuantileSketch.query:
+            _sketch_cache[(row.exercise_name, row.metric)] = (
+                TDigest.from_dict(json.loads(row.digest)), now)
+
+
+def start_warm_up():
+    health_checks.warm_up(warm_db_pool, warm_sketch_cache)
+
+
+# domain events from core (POST /stats/events)
+
+# STATS_INGEST: scan (default) = records / sketches catch up by re-reading the
+# workout table; events = they are only updated from workout.created events
+STATS_INGEST = os.getenv("STATS_INGEST", "scan")
+EVENT_RETENTION = float(os.getenv("EVENT_RETENTION", str(7 * 24 * 3600)))
+
+
+class _LoggedWorkout:
+    def __init__(self, payload):
+        self.reps = payload.get("reps") or []
+        self.extra_weight = payload.get("extra_weight") or []
+        self.sets = payload.get("sets") if isinstance(payload.get("sets"), int) else len(self.reps)
+
+
+def apply_workout_created(event):
+    payload = event["payload"]
+    user_id = event["user_id"]
+    workout_id = payload["workout_id"]
+    day = date.fromisoformat(payload["date"])
+
+    # workouts up to a watermark were already read by a backfill / rebuild
+    mark = db.session.get(RecordWatermark, user_id)
+    if mark is None or workout_id > mark.last_workout_id:
+        record = db.session.get(PersonalRecord, (user_id, payload["exercise_id"]))
+        if record is None:
+            record = PersonalRecord(user_id=user_id, exercise_id=payload["exercise_id"])
+            db.session.add(record)
+        # as in scan mode: a back-dated workout joins what that day already has
+        workout = _LoggedWorkout(payload)
+        applied = fold_totals(user_id, payload["exercise_id"], day, [workout])
+        prior = 0.0
+        if record.last_session_date == day:
+            prior = record.last_session_tonnage or 0.0
+        elif record.last_session_date is not None and day < record.last_session_date:
+            prior = applied
+        apply_session(record, day, [workout], prior)
+
+    sketch_mark = db.session.get(IngestWatermark, sketch_watermark(event.get("source")))
+    if payload.get("exercise_name") and (sketch_mark is None or workout_id > sketch_mark.last_workout_id
+                                         or _in_gaps(sketch_mark, workout_id)):
+        update_sketches([(payload["exercise_name"], payload.get("reps"), payload.get("extra_weight"))])
+
+
+def apply_user_moved(event):
+    # the user's rows are on another shard now (see core `flask move-user`),
+    # where new workouts get ids from that shard: rebuild from the rows there
+    user_id = event["user_id"]
+    PersonalRecord.query.filter_by(user_id=user_id).delete()
+    DayTotals.query.filter_by(user_id=user_id).delete()
+    UserSummary.query.filter_by(user_id=user_id).delete()
+    RecordWatermark.query.filter_by(user_id=user_id).delete()
+    fold_new_workouts(user_id)
+
+
+EVENT_HANDLERS = {
+    "workout.created": apply_workout_created
+}
+# applied in both STATS_INGEST modes
+MAINTENANCE_HANDLERS = {
+    "user.moved": apply_user_moved
+}
+# payload fields the handlers read, by event type
+EVENT_PAYLOAD_FIELDS = {
+    "workout.created": {"workout_id": int, "date": str, "exercise_id": int}
+}
+
+
+def event_problem(event):
+    # why a handler can't apply the event, None if it can
+    if not isinstance(event.get("user_id"), int):
+        return "user_id must be an integer"
+    fields = EVENT_PAYLOAD_FIELDS.get(event["type"])
+    if not fields:
+        return None
+    payload = event.get("payload")
+    if not isinstance(payload, dict):
+        return "payload must be an object"
+    for name, kind in fields.items():
+        if not isinstance(payload.get(name), kind):
+            return f"payload.{name} must be a {kind.__name__}"
+    if "date" in fields:
+        try:
+            date.fromisoformat(payload["date"])
+        except ValueError:
+            return "payload.date must be YYYY-MM-DD"
+    for name in ("reps", "extra_weight"):
+        values = payload.get(name)
+        if values is not None and not (isinstance(values, list) and all(
+                v is None or isinstance(v, (int, float)) for v in values)):
+            return f"payload.{name} must be a list of numbers"
+    return None
+
+
+def apply_events(events):
+    """
+    Apply a batch of events in one transaction. Events seen before are skipped,
+    so redelivery is harmless. Events a handler can't apply are logged and
+    recorded as processed without applying them, so they can't hold up the
+    ones behind them. Returns (applied, duplicates, rejected).
+    """
+    # ids are unique per outbox, i.e. per source shard
+    events = sorted(events, key=lambda e: (e.get("source", ""), e["id"]))
+    seen = set()
+    for source in {e.get("source", "") for e in events}:
+        seen.update((source, pid) for (pid,) in db.session.query(ProcessedEvent.event_id).filter(
+            ProcessedEvent.source == source,
+            ProcessedEvent.event_id.in_([e["id"] for e in events if e.get("source", "") == source])))
+    now = time.time()
+    applied, rejected = [], []
+    for e in events:
+        key = (e.get("source", ""), e["id"])
+        if key in seen:
+            EVENTS_CONSUMED.labels(SERVICE_NAME, e["type"], "duplicate").inc()
+            continue
+        seen.add(key)
+        handler = MAINTENANCE_HANDLERS.get(e["type"])
+        if handler is None and STATS_INGEST == "events":
+            handler = EVENT_HANDLERS.get(e["type"])
+        problem = event_problem(e) if handler is not None else None
+        if problem is not None:
+            app.logger.warning("rejected event %s/%s (%s): %s", key[0], e["id"], e["type"], problem)
+            rejected.append(e)
+        elif handler is not None:
+            with shard_router.for_user(e["user_id"]):
+                handler(e)
+        db.session.add(ProcessedEvent(source=key[0], event_id=e["id"], event_type=e["type"],
+                                      processed_at=now))
+        if problem is None:
+            applied.append(e)
+    if random.random() < 0.01:
+        ProcessedEvent.query.filter(ProcessedEvent.processed_at < now - EVENT_RETENTION).delete()
+    db.session.commit()
+
+    for e in applied:
+        EVENTS_CONSUMED.labels(SERVICE_NAME, e["type"], "applied").inc()
+    for e in rejected:
+        EVENTS_CONSUMED.labels(SERVICE_NAME, e["type"], "rejected").inc()
+    if events:
+        EVENTS_LAG.labels(SERVICE_NAME).set(max(0.0, now - events[-1].get("created_at", now)))
+    return len(applied), len(events) - len(applied) - len(rejected), len(rejected)
+
+
+def _trend_rows(user_id, start=None, end=None):
+    query = db.session.query(Workout.date, Workout.exercise_id, Workout.reps,
+                             Workout.extra_weight).filter(Workout.user_id == user_id)
+    if start:
+        query = query.filter(Workout.date >= start)
+    if end:
+        query = query.filter(Workout.date < end)
+    return query.all()
+
+
+# jobs (run on the job_runner pool, inside an app context, on the user's shard)
+
+@job_runner.register("year-in-review")
+@shard_router.on_user_shard
+def year_in_review_job(user_id, params):
+    year = int(params.get("year") or date.today().year)
+    rows = _trend_rows(user_id, date(year, 1, 1), date(year + 1, 1, 1))
+    frame = analytics.SetFrame.from_rows(rows)
+    volume = analytics.exercise_volume(frame, "month", 1)
+    names = {e.id: e.name for e in Exercise.query.filter_by(user_id=user_id)}
+    top = sorted(volume["exercises"], key=lambda e: -sum(e["volume"]))[:5]
+    return {
+        "year": year,
+        "workouts": len(rows),
+        "training_days": len({r.date for r in rows}),
+        "sets": len(frame),
+        "reps": int(frame.reps.sum()),
+        "tonnage": round(float(frame.tonnage.sum()), 2),
+        "monthly": analytics.tonnage_trend(frame, "month", 3),
+        "frequency": analytics.frequency_heatmap(frame),
+        "top_exercises": [
+            {"exercise_id": e["exercise_id"], "exercise_name": names.get(e["exercise_id"]),
+             "volume": round(sum(e["volume"]), 2)} for e in top
+        ]
+    }
+
+
+@job_runner.register("trends")
+@shard_router.on_user_shard
+def trends_job(user_id, params):
+    # every trend over the full history
+    period = params.get("period", "week")
+    window = int(params.get("window", 4))
+    if period not in analytics.PERIODS or not 1 <= window <= TREND_MAX_WINDOW:
+        raise ValueError("invalid period/window")
+    frame = analytics.SetFrame.from_rows(_trend_rows(user_id))
+    return {metric: fn(frame, period, window) for metric, fn in TRENDS.items()}
+
+
+@job_runner.register("records-rebuild")
+@shard_router.on_user_shard
+def records_rebuild_job(user_id, params):
+    return {"workouts": rebuild_records(user_id)}
+
+
+def job_to_dict(job):
+    return {k: v for k, v in job.items() if k != "dedup_key"}
+
+
 # routes
 
 @app.get("/metrics")
@@ -109,6 +1019,45 @@ def metrics():
     return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 
+@app.get("/traces")
+def traces():
+    """
+    Recently finished tracing spans (only with TRACE_EXPORTER=memory and
+    TRACES_TOKEN set).
+    ---
+    tags:
+      - Tracing
+    parameters:
+      - name: Authorization
+        in: header
+        type: string
+        required: true
+        description: "Bearer <TRACES_TOKEN>"
+      - name: trace_id
+        in: query
+        type: string
+        required: false
+    responses:
+      200:
+        description: List of spans, oldest first
+      401:
+        description: Missing or wrong token
+      404:
+        description: In-memory exporter or TRACES_TOKEN not enabled
+    """
+    if not TRACES_TOKEN:
+        return jsonify({"error": "TRACES_TOKEN is not set"}), 404
+    # bytes: compare_digest rejects non-ASCII str
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode("utf-8"),
+                               f"Bearer {TRACES_TOKEN}".encode("utf-8")):
+        return jsonify({"error": "unauthorized"}), 401
+    spans = getattr(tracer.exporter, "spans", None)
+    if spans is None:
+        return jsonify({"error": "in-memory trace exporter is not enabled"}), 404
+    trace_id = request.args.get("trace_id")
+    return jsonify([s for s in list(spans) if not trace_id or s["trace_id"] == trace_id])
+
+
 @app.get("/external/time")
 def external_time():
     """
@@ -287,10 +1236,100 @@ def health():
         return jsonify({"status": "DOWN", "error": str(e)}), 500
 
 
+@app.get("/health/live")
+def health_live():
+    """
+    Liveness probe: the process answers requests. Checks nothing else, so a
+    database outage does not get pods restarted.
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: Process is alive
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: UP
+    """
+    return jsonify({"status": "UP"}), 200
+
+
+@app.get("/health/startup")
+def health_startup():
+    """
+    Startup probe: warm-up (DB pool, quantile sketch cache) has finished.
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: Warm-up finished
+      503:
+        description: Still warming up
+    """
+    if health_checks.started.is_set():
+        return jsonify({"status": "UP"}), 200
+    return jsonify({"status": "STARTING"}), 503
+
+
+@app.get("/health/ready")
+def health_ready():
+    """
+    Readiness probe: warmed up, database reachable and not draining. A full
+    job queue only reports DEGRADED (still 200). Check results are cached
+    for READINESS_CACHE_TTL seconds.
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: Ready for traffic (UP or DEGRADED)
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: UP
+            checks:
+              type: object
+            age_seconds:
+              type: number
+              example: 0.42
+      503:
+        description: STARTING, DOWN or DRAINING
+    """
+    ready, body = health_checks.readiness()
+    return jsonify(body), 200 if ready else 503
+
+
+def summary_totals(user_id):
+    # events mode: from the totals kept by fold_totals, never the workout table
+    start, end = request.args.get("from"), request.args.get("to")
+    if not start and not end:
+        summary = db.session.get(UserSummary, user_id)
+        rows = [summary] if summary is not None else []
+    else:
+        query = DayTotals.query.filter(DayTotals.user_id == user_id)
+        if start:
+            query = query.filter(DayTotals.date >= date.fromisoformat(start))
+        if end:
+            query = query.filter(DayTotals.date <= date.fromisoformat(end))
+        rows = query.all()
+    return {
+        "total_workouts": sum(r.workouts for r in rows),
+        "total_sets": sum(r.sets for r in rows),
+        "total_reps": sum(r.reps for r in rows),
+        "total_tonnage": sum((r.tonnage for r in rows), 0.0),
+    }
+
+
 @app.get("/stats/summary")
 def summary_for_user():
     """
-    Stats summary for a user.
+    Stats summary for a user, optionally limited to a date range.
     ---
     tags:
       - Stats
@@ -300,6 +1339,16 @@ def summary_for_user():
         type: integer
         required: true
         example: 1
+      - name: from
+        in: query
+        type: string
+        required: false
+        example: "2026-01-01"
+      - name: to
+        in: query
+        type: string
+        required: false
+        example: "2026-12-31"
     responses:
       200:
         description: Summary stats for the user
@@ -323,7 +1372,19 @@ def summary_for_user():
     if not user_id:
         return jsonify({"error": "user_id query param is required"}), 400
 
-    workouts = Workout.query.filter_by(user_id=user_id).all()
+    if STATS_INGEST == "events":
+        try:
+            totals = summary_totals(user_id)
+        except ValueError:
+            return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+        return jsonify(dict(totals, user_id=user_id,
+                            generated_at=datetime.utcnow().isoformat() + "Z"))
+
+    try:
+        workouts = filter_date_range(
+            Workout.query.filter_by(user_id=user_id)).all()
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
     total_workouts = len(workouts)
     total_sets = sum(w.sets for w in workouts)
 
@@ -352,7 +1413,7 @@ def summary_for_user():
 @app.get("/stats/workouts")
 def workouts_for_user():
     """
-    Get workouts (ordered by date) for a user.
+    Get workouts (ordered by date) for a user, optionally limited to a date range.
     ---
     tags:
       - Stats
@@ -362,6 +1423,16 @@ def workouts_for_user():
         type: integer
         required: true
         example: 1
+      - name: from
+        in: query
+        type: string
+        required: false
+        example: "2026-01-01"
+      - name: to
+        in: query
+        type: string
+        required: false
+        example: "2026-12-31"
     responses:
       200:
         description: List of workouts
@@ -395,8 +1466,11 @@ def workouts_for_user():
     if not user_id:
         return jsonify({"error": "user_id query param is required"}), 400
 
-    workouts = Workout.query.filter_by(
-        user_id=user_id).order_by(Workout.date.asc()).all()
+    try:
+        workouts = filter_date_range(Workout.query.filter_by(
+            user_id=user_id)).order_by(Workout.date.asc()).all()
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
     return jsonify([
         {
             "id": w.id,
@@ -411,5 +1485,453 @@ def workouts_for_user():
     ])
 
 
+@app.get("/stats/records")
+def records_for_user():
+    """
+    Personal records per exercise (best weight, best reps at each weight,
+    best estimated 1RM, best session tonnage).
+    ---
+    tags:
+      - Stats
+    parameters:
+      - name: user_id
+        in: query
+        type: integer
+        required: true
+        example: 1
+      - name: exercise_id
+        in: query
+        type: integer
+        required: false
+        example: 2
+    responses:
+      200:
+        description: List of personal records, one per exercise
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              exercise_id: {type: integer, example: 2}
+              exercise_name: {type: string, example: "bench press"}
+              best_weight: {type: number, example: 100.0}
+              best_weight_reps: {type: integer, example: 3}
+              best_weight_date: {type: string, example: "2026-01-10"}
+              best_e1rm: {type: number, example: 110.0}
+              best_e1rm_date: {type: string, example: "2026-01-10"}
+              best_tonnage: {type: number, example: 4200.0}
+              best_tonnage_date: {type: string, example: "2026-01-03"}
+              reps_at_weight:
+                type: object
+                example: {"80": 10, "100": 3}
+      400:
+        description: Missing user_id
+        schema:
+          type: object
+          properties:
+            error: {type: string, example: "user_id query param is required"}
+    """
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return jsonify({"error": "user_id query param is required"}), 400
+
+    if STATS_INGEST == "scan":
+        refresh_records(user_id)
+
+    query = PersonalRecord.query.filter_by(user_id=user_id)
+    exercise_id = request.args.get("exercise_id", type=int)
+    if exercise_id:
+        query = query.filter_by(exercise_id=exercise_id)
+    names = {e.id: e.name for e in Exercise.query.filter_by(user_id=user_id)}
+    return jsonify(sorted(
+        (record_to_dict(r, names.get(r.exercise_id)) for r in query),
+        key=lambda r: r["exercise_name"] or ""
+    ))
+
+
+TRENDS = {
+    "tonnage": lambda frame, period, window: analytics.tonnage_trend(frame, period, window),
+    "volume": lambda frame, period, window: analytics.exercise_volume(frame, period, window),
+    "frequency": lambda frame, period, window: analytics.frequency_heatmap(frame),
+    "percentiles": lambda frame, period, window: analytics.weight_percentiles(frame)
+}
+TREND_MAX_WINDOW = 52
+
+
+@app.post("/stats/events")
+def ingest_events():
+    """
+    Ingest a batch of domain events from the core outbox relay (at-least-once;
+    already processed event ids are skipped).
+    ---
+    tags:
+      - Events
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            events:
+              type: array
+              items:
+                type: object
+                properties:
+                  id: {type: integer, example: 42}
+                  type: {type: string, example: "workout.created"}
+                  user_id: {type: integer, example: 1}
+                  payload: {type: object}
+                  created_at: {type: number, example: 1792432440.5}
+                  source: {type: string, example: "a", description: "Shard of the outbox ('' unsharded)"}
+    responses:
+      200:
+        description: Batch applied
+        schema:
+          type: object
+          properties:
+            applied: {type: integer, example: 10}
+            duplicates: {type: integer, example: 0}
+            rejected: {type: integer, example: 0, description: "Malformed events, logged and skipped"}
+      400:
+        description: Malformed batch
+      409:
+        description: Batch raced with a concurrent delivery of the same events; retry
+    """
+    data = request.get_json(silent=True) or {}
+    events = data.get("events")
+    if not isinstance(events, list) or not all(
+            isinstance(e, dict) and isinstance(e.get("id"), int) and e.get("type")
+        and isinstance(e.get("source", ""), str) for e in events):
+        return jsonify({"error": "events must be a list of {id, type, user_id, payload}"}), 400
+    try:
+        applied, duplicates, rejected = apply_events(events)
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "concurrent delivery, retry"}), 409
+    return jsonify({"applied": applied, "duplicates": duplicates, "rejected": rejected})
+
+
+@app.get("/stats/percentile")
+def exercise_percentile():
+    """
+    Where a value ranks among all users' workouts for an exercise (matched by
+    name, case-insensitive). Answered from a precomputed quantile sketch,
+    without reading workouts.
+    ---
+    tags:
+      - Stats
+    parameters:
+      - name: exercise
+        in: query
+        type: string
+        required: true
+        example: "bench press"
+      - name: value
+        in: query
+        type: number
+        required: true
+        example: 3000
+      - name: metric
+        in: query
+        type: string
+        required: false
+        enum: [tonnage, e1rm]
+        default: tonnage
+        description: tonnage per workout, or estimated 1RM per set
+    responses:
+      200:
+        description: Percentile of the value (share of samples at or below it)
+        schema:
+          type: object
+          properties:
+            exercise: {type: string, example: "bench press"}
+            metric: {type: string, example: "tonnage"}
+            value: {type: number, example: 3000}
+            percentile: {type: number, example: 72.4}
+            samples: {type: integer, example: 18234}
+            quantiles:
+              type: object
+              example: {"p50": 2400.0, "p75": 3100.0, "p90": 3900.0, "p99": 5600.0}
+      400:
+        description: Missing exercise/value or unknown metric
+      404:
+        description: No data for this exercise yet
+    """
+    exercise = normalize_exercise_name(request.args.get("exercise"))
+    value = request.args.get("value", type=float)
+    metric = request.args.get("metric", "tonnage")
+    if not exercise or value is None:
+        return jsonify({"error": "exercise and value query params are required"}), 400
+    if metric not in SKETCH_METRICS:
+        return jsonify({"error": f"metric must be one of {', '.join(SKETCH_METRICS)}"}), 400
+
+    digest = load_sketch(exercise, metric)
+    if digest is None or not digest.count:
+        return jsonify({"error": f"no data for '{exercise}' yet"}), 404
+    return jsonify({
+        "exercise": exercise,
+        "metric": metric,
+        "value": value,
+        "percentile": round(digest.cdf(value) * 100, 1),
+        "samples": digest.count,
+        "quantiles": {f"p{int(q * 100)}": round(digest.quantile(q), 2) for q in (0.5, 0.75, 0.9, 0.99)}
+    })
+
+
+@app.cli.command("rebuild-sketches")
+def rebuild_sketches():
+    """Rebuild the cross-user quantile sketches from the full workout history."""
+    QuantileSketch.query.delete()
+    IngestWatermark.query.filter(db.or_(IngestWatermark.name == "sketches",
+                                        IngestWatermark.name.startswith("sketches:"))).delete()
+    _sketch_cache.clear()
+    click.echo(f"{ingest_sketches()} workouts")
+
+
+@app.post("/stats/jobs")
+def submit_job():
+    """
+    Submit a background job. An identical job (type, user, params) that is
+    queued, running or has a fresh result is returned instead of starting a new one.
+    ---
+    tags:
+      - Jobs
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          required: [type, user_id]
+          properties:
+            type: {type: string, enum: [year-in-review, trends, records-rebuild], example: "year-in-review"}
+            user_id: {type: integer, example: 1}
+            params: {type: object, example: {"year": 2026}}
+    responses:
+      202:
+        description: Job queued
+        schema:
+          type: object
+          properties:
+            id: {type: string, example: "9f1c2e0b7a5d4c3e8f6a1b2c3d4e5f60"}
+            status: {type: string, example: "queued"}
+      200:
+        description: Existing identical job
+      400:
+        description: Missing or invalid type / user_id
+      503:
+        description: Job queue is full (Retry-After header set)
+    """
+    data = request.get_json(silent=True) or {}
+    job_type = data.get("type")
+    user_id = data.get("user_id")
+    params = data.get("params") or {}
+    if not isinstance(user_id, int) or user_id <= 0 or not isinstance(params, dict):
+        return jsonify({"error": "user_id (integer) is required, params must be an object"}), 400
+    try:
+        job, created = job_runner.submit(job_type, user_id, params)
+    except KeyError:
+        return jsonify({"error": f"type must be one of {', '.join(job_runner.job_types)}"}), 400
+    except QueueFull:
+        return jsonify({"error": "job queue is full"}), 503, {"Retry-After": "5"}
+    return jsonify(job_to_dict(job)), 202 if created else 200
+
+
+@app.get("/stats/jobs/<job_id>")
+def get_job(job_id):
+    """
+    Job status and result. With ?wait=N the request long-polls up to N seconds
+    (capped at JOB_MAX_WAIT) until the job has finished.
+    ---
+    tags:
+      - Jobs
+    parameters:
+      - name: job_id
+        in: path
+        type: string
+        required: true
+      - name: wait
+        in: query
+        type: number
+        required: false
+        example: 10
+    responses:
+      200:
+        description: Job (status queued, running, succeeded or failed; result set when succeeded)
+      404:
+        description: Unknown or expired job
+    """
+    wait = min(max(request.args.get("wait", 0, type=float), 0), JOB_MAX_WAIT)
+    job = job_runner.wait(job_id, wait) if wait else job_runner.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job_to_dict(job))
+
+
+@app.get("/stats/trends/<metric>")
+def trends_for_user(metric):
+    """
+    Long-range trends for a user, computed on columnar per-set arrays.
+    tonnage = tonnage and sets per week/month with a rolling average,
+    volume = per-exercise volume with a moving average,
+    frequency = sets per weekday and week (heatmap),
+    percentiles = per-exercise working weight percentiles.
+    ---
+    tags:
+      - Stats
+    parameters:
+      - name: metric
+        in: path
+        type: string
+        required: true
+        enum: [tonnage, volume, frequency, percentiles]
+      - name: user_id
+        in: query
+        type: integer
+        required: true
+        example: 1
+      - name: period
+        in: query
+        type: string
+        required: false
+        enum: [week, month]
+        default: week
+      - name: window
+        in: query
+        type: integer
+        required: false
+        default: 4
+        description: Rolling window in periods (1-52)
+      - name: exercise_id
+        in: query
+        type: integer
+        required: false
+      - name: from
+        in: query
+        type: string
+        required: false
+        example: "2026-01-01"
+      - name: to
+        in: query
+        type: string
+        required: false
+        example: "2026-12-31"
+    responses:
+      200:
+        description: Trend series; labels are week starts (Mondays) or months
+        schema:
+          type: object
+          properties:
+            user_id: {type: integer, example: 1}
+            period: {type: string, example: "week"}
+            labels:
+              type: array
+              items: {type: string}
+              example: ["2026-01-05", "2026-01-12"]
+            tonnage:
+              type: array
+              items: {type: number}
+              example: [4200.0, 0.0]
+            rolling_tonnage:
+              type: array
+              items: {type: number}
+              example: [4200.0, 2100.0]
+      400:
+        description: Missing user_id or invalid parameters
+        schema:
+          type: object
+          properties:
+            error: {type: string, example: "user_id query param is required"}
+      404:
+        description: Unknown trend
+    """
+    if metric not in TRENDS:
+        return jsonify({"error": f"unknown trend '{metric}'"}), 404
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return jsonify({"error": "user_id query param is required"}), 400
+    period = request.args.get("period", "week")
+    if period not in analytics.PERIODS:
+        return jsonify({"error": "period must be week or month"}), 400
+    window = request.args.get("window", 4, type=int)
+    if not 1 <= window <= TREND_MAX_WINDOW:
+        return jsonify({"error": f"window must be between 1 and {TREND_MAX_WINDOW}"}), 400
+
+    # one columnar fetch, no ORM objects
+    query = db.session.query(Workout.date, Workout.exercise_id, Workout.reps,
+                             Workout.extra_weight).filter(Workout.user_id == user_id)
+    exercise_id = request.args.get("exercise_id", type=int)
+    if exercise_id:
+        query = query.filter(Workout.exercise_id == exercise_id)
+    try:
+        rows = filter_date_range(query).all()
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+
+    with tracer.span("analytics.compute", {"trend": metric, "workouts": len(rows)}):
+        payload = TRENDS[metric](analytics.SetFrame.from_rows(rows), period, window)
+    payload["user_id"] = user_id
+    return jsonify(payload)
+
+
+@app.cli.command("benchmark-trends")
+@click.option("--sets", default=100_000, show_default=True, help="Number of synthetic sets.")
+@click.option("--repeat", default=3, show_default=True)
+def benchmark_trends(sets, repeat):
+    """Compare the vectorized trends against a pure-Python reference."""
+    try:
+        results = analytics.benchmark(sets, repeat=repeat)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    for key, value in results.items():
+        click.echo(f"{key:>22}: {value}")
+
+
+@app.cli.command("backfill-records")
+@click.option("--user-id", type=int, default=None, help="Only rebuild this user's records.")
+def backfill_records(user_id):
+    """Rebuild personal records from the full workout history."""
+    if user_id:
+        with shard_router.for_user(user_id):
+            click.echo(f"user {user_id}: {rebuild_records(user_id)} workouts")
+        return
+
+    for shard in shard_router.names or [None]:
+        with shard_router.use(shard):
+            for uid in [uid for (uid,) in db.session.query(Workout.user_id).distinct()]:
+                click.echo(f"user {uid}: {rebuild_records(uid)} workouts")
+
+
+@app.cli.command("benchmark-startup")
+@click.option("--runs", default=5, show_default=True)
+@click.option("--debug/--no-debug", default=False, show_default=True,
+              help="With the debug reloader, which imports the app twice.")
+def benchmark_startup(runs, debug):
+    """Time from `python app.py` to the first healthy /health response."""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), FLASK_DEBUG="1" if debug else "0",
+               SKETCH_INTERVAL="0")
+    env.pop("FLASK_RUN_FROM_CLI", None)
+    timings = sorted(
+        time_to_healthy([sys.executable, "app.py"], f"http://127.0.0.1:{port}/health",
+                        env=env, cwd=app.root_path)
+        for _ in range(runs))
+    click.echo(f"time to healthy over {runs} runs: min {timings[0]:.3f}s, "
+               f"median {timings[len(timings) // 2]:.3f}s, max {timings[-1]:.3f}s")
+
+
+APP_STARTUP.labels(SERVICE_NAME, "import").set(time.perf_counter() - STARTED_AT)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # with the debug reloader only the serving child process runs the updater
+    if not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_sketch_updater()
+        start_warm_up()
+    if DEBUG:
+        app.run(host="0.0.0.0", port=PORT, debug=True)
+    else:
+        # SIGTERM drains in-flight requests before serve_forever() returns
+        server = make_server("0.0.0.0", PORT, app, threaded=True)
+        drain.install(server)
+        server.serve_forever()
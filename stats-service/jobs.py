@@ -0,0 +1,310 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import text
+import threading
+import hashlib
+import secrets
+import random
+import json
+import time
+
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+ACTIVE = (QUEUED, RUNNING)
+DONE = (SUCCEEDED, FAILED)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class DuplicateJob(Exception):
+    # another replica added an active job with the same dedup key first
+    pass
+
+
+def dedup_key(job_type, user_id, params):
+    raw = json.dumps([job_type, user_id, params], sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryJobStore:
+    # in-process store for tests / single-process dev; its jobs die with the
+    # process, so there are no leases
+    lease = None
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["expires_at"] < time.time():
+                del self._jobs[job_id]
+                return None
+            return dict(job)
+
+    def find(self, key):
+        # newest unexpired job with this dedup key; failed ones may be retried
+        now = time.time()
+        with self._lock:
+            for job in sorted(self._jobs.values(), key=lambda j: -j["created_at"]):
+                if job["dedup_key"] == key and job["status"] != FAILED and job["expires_at"] >= now:
+                    return dict(job)
+        return None
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            now = time.time()
+            for job_id in [i for i, j in self._jobs.items() if j["expires_at"] < now]:
+                del self._jobs[job_id]
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def heartbeat(self, job_ids, now):
+        pass
+
+
+class SQLJobStore:
+    """
+    Job rows in the database (SQLite locally, Postgres in the cluster), so
+    status and results survive a restart and every replica can answer a poll.
+    The replica running a queued or running job bumps its heartbeat_at; once
+    that is lease seconds old the replica is gone, and the job is failed the
+    next time it is looked at so that it can be submitted again. A unique
+    partial index keeps one active job per dedup key across replicas.
+    """
+
+    columns = ("id", "dedup_key", "type", "user_id", "params", "status", "result", "error",
+               "created_at", "started_at", "finished_at", "expires_at", "heartbeat_at")
+
+    def __init__(self, get_engine, table="stats_job", purge_probability=0.01, lease=60):
+        self.table = table
+        self.purge_probability = purge_probability
+        self.lease = lease
+        self._get_engine = get_engine
+
+    def _abandon(self, conn, where, params):
+        # active jobs whose replica stopped heartbeating
+        now = time.time()
+        conn.execute(text(
+            f"UPDATE {self.table} SET status = :failed, error = :error, finished_at = :now "
+            f"WHERE {where} AND status IN (:queued, :running) "
+            "AND COALESCE(heartbeat_at, created_at) < :stale"
+        ), dict(params, failed=FAILED, error="abandoned: its replica stopped", now=now,
+                queued=QUEUED, running=RUNNING, stale=now - self.lease))
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(row._mapping)
+        job["params"] = json.loads(job["params"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def get(self, job_id):
+        with self._get_engine().begin() as conn:
+            self._abandon(conn, "id = :id", {"id": job_id})
+            row = conn.execute(text(
+                f"SELECT {', '.join(self.columns)} FROM {self.table} "
+                "WHERE id = :id AND expires_at >= :now"
+            ), {"id": job_id, "now": time.time()}).first()
+        return self._row_to_job(row)
+
+    def find(self, key):
+        with self._get_engine().begin() as conn:
+            self._abandon(conn, "dedup_key = :key", {"key": key})
+            row = conn.execute(text(
+                f"SELECT {', '.join(self.columns)} FROM {self.table} "
+                "WHERE dedup_key = :key AND status != :failed AND expires_at >= :now "
+                "ORDER BY created_at DESC LIMIT 1"
+            ), {"key": key, "failed": FAILED, "now": time.time()}).first()
+        return self._row_to_job(row)
+
+    def add(self, job):
+        params = dict(job, params=json.dumps(job["params"]), result=None)
+        try:
+            with self._get_engine().begin() as conn:
+                conn.execute(text(
+                    f"INSERT INTO {self.table} ({', '.join(self.columns)}) "
+                    f"VALUES ({', '.join(':' + c for c in self.columns)})"
+                ), params)
+        except IntegrityError as e:
+            raise DuplicateJob(job["dedup_key"]) from e
+        if random.random() < self.purge_probability:
+            with self._get_engine().begin() as conn:
+                conn.execute(text(f"DELETE FROM {self.table} WHERE expires_at < :now"),
+                             {"now": time.time()})
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"]) if fields["result"] is not None else None
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        with self._get_engine().begin() as conn:
+            conn.execute(text(f"UPDATE {self.table} SET {assignments} WHERE id = :id"),
+                         dict(fields, id=job_id))
+
+    def heartbeat(self, job_ids, now):
+        with self._get_engine().begin() as conn:
+            conn.execute(text(
+                f"UPDATE {self.table} SET heartbeat_at = :now "
+                "WHERE id = :id AND status IN (:queued, :running)"
+            ), [{"id": job_id, "now": now, "queued": QUEUED, "running": RUNNING}
+                for job_id in job_ids])
+
+
+class JobRunner:
+    """
+    Runs registered job types on a bounded thread pool. Submitting a job that
+    is identical (type, user, params) to one still queued, running, or with an
+    unexpired successful result returns the existing job instead of a new one.
+    Results are kept for result_ttl seconds after the job finishes. While a
+    job of this process is queued or running, a thread heartbeats it every
+    third of the store's lease.
+    """
+
+    def __init__(self, store, max_workers=2, max_queue=100, result_ttl=3600,
+                 context=None, on_event=None):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self._context = context
+        self._on_event = on_event or (lambda event, job_type, duration=None: None)
+        self._handlers = {}
+        self._executor = None
+        self._queued = 0
+        self._running = 0
+        self._done = {}
+        self._heartbeat = None
+        self._lock = threading.Lock()
+
+    def register(self, job_type):
+        def decorator(fn):
+            self._handlers[job_type] = fn
+            return fn
+        return decorator
+
+    @property
+    def job_types(self):
+        return sorted(self._handlers)
+
+    def depth(self):
+        return self._queued
+
+    def running(self):
+        return self._running
+
+    def submit(self, job_type, user_id, params=None):
+        """Returns (job, created). Raises KeyError / QueueFull."""
+        if job_type not in self._handlers:
+            raise KeyError(job_type)
+        params = params or {}
+        key = dedup_key(job_type, user_id, params)
+
+        with self._lock:
+            existing = self.store.find(key)
+            if existing is not None:
+                self._on_event("deduplicated", job_type)
+                return existing, False
+            if self._queued >= self.max_queue:
+                self._on_event("rejected", job_type)
+                raise QueueFull(f"{self._queued} jobs queued")
+
+            job = {
+                "id": secrets.token_hex(16),
+                "dedup_key": key,
+                "type": job_type,
+                "user_id": user_id,
+                "params": params,
+                "status": QUEUED,
+                "result": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "expires_at": time.time() + self.result_ttl,
+                "heartbeat_at": time.time()
+            }
+            try:
+                self.store.add(job)
+            except DuplicateJob:
+                existing = self.store.find(key)
+                if existing is None:
+                    raise
+                self._on_event("deduplicated", job_type)
+                return existing, False
+            self._queued += 1
+            self._done[job["id"]] = threading.Event()
+            if self._executor is None:
+                # started lazily so importing the app doesn't spawn threads
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="stats-job")
+            if self._heartbeat is None and self.store.lease:
+                self._heartbeat = threading.Thread(target=self._beat, name="stats-job-heartbeat",
+                                                   daemon=True)
+                self._heartbeat.start()
+            self._executor.submit(self._run, job)
+        self._on_event("submitted", job_type)
+        return job, True
+
+    def _beat(self):
+        while True:
+            time.sleep(self.store.lease / 3)
+            with self._lock:
+                job_ids = list(self._done)
+            if not job_ids:
+                continue
+            try:
+                self.store.heartbeat(job_ids, time.time())
+            except Exception:
+                # the next beat retries; a lease is three beats long
+                pass
+
+    def _run(self, job):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        started = time.time()
+        status, result, error = SUCCEEDED, None, None
+        try:
+            self.store.update(job["id"], status=RUNNING, started_at=started, heartbeat_at=started)
+            if self._context is not None:
+                with self._context():
+                    result = self._handlers[job["type"]](job["user_id"], job["params"])
+            else:
+                result = self._handlers[job["type"]](job["user_id"], job["params"])
+        except Exception as e:
+            status, error = FAILED, f"{type(e).__name__}: {e}"
+        finished = time.time()
+        try:
+            self.store.update(job["id"], status=status, result=result, error=error,
+                              finished_at=finished, expires_at=finished + self.result_ttl)
+        finally:
+            with self._lock:
+                self._running -= 1
+                done = self._done.pop(job["id"], None)
+            if done is not None:
+                done.set()
+            self._on_event(status, job["type"], finished - started)
+
+    def wait(self, job_id, timeout, poll_interval=0.5):
+        """Long-poll: the job once it is done, or as it is after timeout seconds."""
+        deadline = time.monotonic() + timeout
+        done = self._done.get(job_id)
+        if done is not None:
+            # submitted by this process, no need to poll the store
+            done.wait(timeout)
+            return self.store.get(job_id)
+        while True:
+            job = self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in DONE or remaining <= 0:
+                return job
+            time.sleep(min(poll_interval, remaining))
@@ -0,0 +1,71 @@
+import json
+
+
+def estimated_1rm(weight, reps):
+    # Epley; a single is its own 1RM
+    if reps <= 0 or weight <= 0:
+        return 0.0
+    if reps == 1:
+        return float(weight)
+    return weight * (1 + reps / 30.0)
+
+
+def apply_session(record, day, workouts, prior_tonnage=0.0):
+    """
+    Fold the workouts of one exercise on one day into a personal record row.
+    `prior_tonnage` is what was already lifted that day by workouts applied
+    earlier, so a session logged in several parts still counts as one.
+    """
+    reps_at_weight = json.loads(record.reps_at_weight or "{}")
+    tonnage = prior_tonnage
+
+    for w in workouts:
+        reps_list = w.reps or []
+        weights_list = w.extra_weight or []
+        for i in range(min(len(reps_list), len(weights_list))):
+            reps = int(reps_list[i] or 0)
+            weight = float(weights_list[i] or 0)
+            tonnage += reps * weight
+
+            if weight > (record.best_weight or 0) or \
+                    (weight == record.best_weight and reps > (record.best_weight_reps or 0)):
+                record.best_weight = weight
+                record.best_weight_reps = reps
+                record.best_weight_date = day
+
+            key = f"{weight:g}"
+            if reps > reps_at_weight.get(key, 0):
+                reps_at_weight[key] = reps
+
+            e1rm = estimated_1rm(weight, reps)
+            if e1rm > (record.best_e1rm or 0):
+                record.best_e1rm = round(e1rm, 2)
+                record.best_e1rm_date = day
+
+    if tonnage > (record.best_tonnage or 0):
+        record.best_tonnage = tonnage
+        record.best_tonnage_date = day
+    if record.last_session_date is None or day >= record.last_session_date:
+        record.last_session_date = day
+        record.last_session_tonnage = tonnage
+
+    record.reps_at_weight = json.dumps(reps_at_weight, sort_keys=True)
+    return record
+
+
+def record_to_dict(record, exercise_name=None):
+    def iso(d):
+        return d.isoformat() if d else None
+
+    return {
+        "exercise_id": record.exercise_id,
+        "exercise_name": exercise_name,
+        "best_weight": record.best_weight,
+        "best_weight_reps": record.best_weight_reps,
+        "best_weight_date": iso(record.best_weight_date),
+        "best_e1rm": record.best_e1rm,
+        "best_e1rm_date": iso(record.best_e1rm_date),
+        "best_tonnage": record.best_tonnage,
+        "best_tonnage_date": iso(record.best_tonnage_date),
+        "reps_at_weight": json.loads(record.reps_at_weight or "{}")
+    }
@@ -0,0 +1,286 @@
+from flask_sqlalchemy.session import Session
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import text
+import sqlalchemy as sa
+import functools
+import threading
+import hashlib
+import bisect
+import time
+
+
+_current_shard = ContextVar("current_shard", default=None)
+
+
+class ShardMoving(Exception):
+    """The user's rows are being moved to another shard; retry shortly."""
+
+
+def parse_shard_urls(value):
+    """"a=postgresql://...,b=sqlite:///b.db" -> {"a": url, "b": url}, in order."""
+    shards = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        name, sep, url = item.partition("=")
+        if not sep or not name.strip() or not url.strip():
+            raise ValueError(f"shard must be name=url: {item!r}")
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+def _point(key):
+    return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hashing with vnodes points per shard: adding a shard moves
+    about 1/N of the users, all of them onto the new shard.
+    """
+
+    def __init__(self, names, vnodes=64):
+        points = sorted((_point(f"{name}#{i}"), name) for name in names for i in range(vnodes))
+        self._points = [p for p, _ in points]
+        self._names = [name for _, name in points]
+
+    def node(self, key):
+        i = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._names[i]
+
+
+class UserDirectory:
+    """
+    user_directory rows on the primary database: allocates user ids (unique
+    across shards), maps usernames to them for login and records the shard
+    each user's rows are on.
+    """
+
+    def __init__(self, get_engine, table="user_directory"):
+        self.table = table
+        self._get_engine = get_engine
+
+    def register(self, username, place):
+        # (user_id, shard) for a new username, None if it is taken
+        try:
+            with self._get_engine().begin() as conn:
+                user_id = conn.execute(text(
+                    f"INSERT INTO {self.table} (username, moving) VALUES (:username, :moving) "
+                    "RETURNING user_id"
+                ), {"username": username, "moving": False}).scalar()
+                shard = place(user_id)
+                conn.execute(text(f"UPDATE {self.table} SET shard = :shard WHERE user_id = :id"),
+                             {"shard": shard, "id": user_id})
+        except sa.exc.IntegrityError:
+            return None
+        return user_id, shard
+
+    def add(self, user_id, username, shard):
+        # existing users when sharding is switched on; False if already listed
+        try:
+            with self._get_engine().begin() as conn:
+                conn.execute(text(
+                    f"INSERT INTO {self.table} (user_id, username, shard, moving) "
+                    "VALUES (:id, :username, :shard, :moving)"
+                ), {"id": user_id, "username": username, "shard": shard, "moving": False})
+        except sa.exc.IntegrityError:
+            return False
+        return True
+
+    def find(self, username):
+        # (user_id, shard) or None
+        with self._get_engine().connect() as conn:
+            row = conn.execute(text(
+                f"SELECT user_id, shard FROM {self.table} WHERE username = :username"
+            ), {"username": username}).first()
+        return tuple(row) if row is not None else None
+
+    def locate(self, user_id):
+        # (shard, moving) or None
+        with self._get_engine().connect() as conn:
+            row = conn.execute(text(
+                f"SELECT shard, moving FROM {self.table} WHERE user_id = :id"
+            ), {"id": user_id}).first()
+        return (row.shard, bool(row.moving)) if row is not None else None
+
+    def set_shard(self, user_id, shard, moving=False):
+        with self._get_engine().begin() as conn:
+            conn.execute(text(
+                f"UPDATE {self.table} SET shard = :shard, moving = :moving WHERE user_id = :id"
+            ), {"shard": shard, "moving": moving, "id": user_id})
+
+    def users(self):
+        # [(user_id, shard)] of every listed user
+        with self._get_engine().connect() as conn:
+            return [tuple(r) for r in conn.execute(text(
+                f"SELECT user_id, shard FROM {self.table} ORDER BY user_id"))]
+
+
+class ShardRouter:
+    """
+    Maps user ids to shard names and holds the shard selected for the current
+    request / thread. scheme=hash places users on a consistent-hash ring, no
+    lookup needed; scheme=directory routes by the user_directory's shard
+    column (cached for cache_ttl), so single users can be moved online, and
+    falls back to the ring for users not listed. With no shards routing is off.
+    id_range > 0: shard i allocates ids in (i * id_range, (i + 1) * id_range].
+    """
+
+    def __init__(self, names, scheme="hash", directory=None, cache_ttl=5.0, vnodes=64,
+                 id_range=0, max_cached=100000):
+        if scheme not in ("hash", "directory"):
+            raise ValueError(f"unknown shard routing scheme {scheme!r}")
+        self.names = list(names)
+        self.scheme = scheme
+        self.directory = directory
+        self.cache_ttl = cache_ttl
+        self.id_range = id_range
+        self.max_cached = max_cached
+        self.ring = HashRing(self.names, vnodes) if self.names else None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.names)
+
+    @property
+    def default(self):
+        # used outside a user's context: CLI tools, global scans
+        return self.names[0] if self.names else None
+
+    def id_bounds(self, name):
+        # (low, high] of the ids the shard allocates itself, None without ranges
+        if not self.id_range or name not in self.names:
+            return None
+        i = self.names.index(name)
+        return i * self.id_range, (i + 1) * self.id_range
+
+    def place(self, user_id):
+        return self.ring.node(user_id)
+
+    def shard_for(self, user_id):
+        if self.scheme == "hash":
+            return self.place(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(user_id)
+        if entry is None or now - entry[0] >= self.cache_ttl:
+            entry = (now, self.directory.locate(user_id))
+            with self._lock:
+                if len(self._cache) >= self.max_cached:
+                    self._cache.clear()
+                self._cache[user_id] = entry
+        location = entry[1]
+        if location is None or location[0] is None:
+            return self.place(user_id)
+        shard, moving = location
+        if moving:
+            raise ShardMoving(f"user {user_id} is being moved to another shard")
+        return shard
+
+    def forget(self, user_id):
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def current(self):
+        return _current_shard.get() or self.default
+
+    def activate(self, name):
+        # returns the previously selected shard so the caller can restore it
+        previous = _current_shard.get()
+        _current_shard.set(name)
+        return previous
+
+    def restore(self, previous):
+        _current_shard.set(previous)
+
+    @contextmanager
+    def use(self, name):
+        previous = self.activate(name)
+        try:
+            yield name
+        finally:
+            self.restore(previous)
+
+    def for_user(self, user_id):
+        return self.use(self.shard_for(user_id) if self.enabled else None)
+
+    def on_user_shard(self, fn):
+        # fn(user_id, ...) runs with user_id's shard selected
+        @functools.wraps(fn)
+        def run(user_id, *args, **kwargs):
+            with self.for_user(user_id):
+                return fn(user_id, *args, **kwargs)
+        return run
+
+
+def shard_binds(shards, primary_url):
+    """
+    (SQLALCHEMY_BINDS entries, {shard: bind key}); a shard on the primary
+    database uses the default engine (bind key None) instead of a second pool.
+    """
+    binds, keys = {}, {}
+    for name, url in shards.items():
+        if url == primary_url:
+            keys[name] = None
+        else:
+            keys[name] = f"shard_{name}"
+            binds[keys[name]] = url
+    return binds, keys
+
+
+def _table_name(mapper, clause):
+    if mapper is not None:
+        return sa.inspect(mapper).local_table.name
+    if isinstance(clause, sa.Table):
+        return clause.name
+    if isinstance(clause, sa.sql.dml.UpdateBase) and isinstance(clause.table, sa.Table):
+        return clause.table.name
+    return None
+
+
+def sharded_session(router, tables, bind_keys):
+    """
+    Session class for SQLAlchemy(session_options={"class_": ...}): ORM
+    queries and Core statements on the given tables go to the current
+    shard's engine, everything else to the usual bind.
+    """
+    tables = frozenset(tables)
+
+    class ShardedSession(Session):
+        def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+            if bind is None and router.enabled and _table_name(mapper, clause) in tables:
+                return self._db.engines[bind_keys[router.current()]]
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    return ShardedSession
+
+
+def copy_user_rows(source, target, tables, user_id, in_transaction=None, batch_size=1000):
+    """
+    Copies a user's rows of tables ([(sa.Table, user id column)], parents
+    first) from the source to the target engine, keeping their ids, in one
+    target transaction that also runs in_transaction(conn). An id already
+    taken on the target raises IntegrityError and nothing is written.
+    Returns {table name: rows copied}.
+    """
+    copied = {}
+    with source.connect() as src, target.begin() as dst:
+        for table, column in tables:
+            rows = [dict(r) for r in src.execute(
+                sa.select(table).where(table.c[column] == user_id)).mappings()]
+            for i in range(0, len(rows), batch_size):
+                dst.execute(table.insert(), rows[i:i + batch_size])
+            copied[table.name] = len(rows)
+        if in_transaction is not None:
+            in_transaction(dst)
+    return copied
+
+
+def delete_user_rows(engine, tables, user_id):
+    # children first: tables in the order given to copy_user_rows, reversed
+    with engine.begin() as conn:
+        for table, column in reversed(tables):
+            conn.execute(table.delete().where(table.c[column] == user_id))
@@ -0,0 +1,109 @@
+import math
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning): a few hundred weighted centroids that answer
+    rank/quantile queries over any number of samples with small error, most
+    accurate near the tails. New values are buffered and merged in compress().
+    """
+
+    def __init__(self, compression=100, centroids=None, count=0, min=None, max=None):
+        self.compression = compression
+        self.centroids = [list(c) for c in centroids or []]
+        self.count = count
+        self.min = min
+        self.max = max
+        self._buffer = []
+
+    def add(self, value, weight=1):
+        value = float(value)
+        self._buffer.append([value, weight])
+        self.count += weight
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._buffer) >= self.compression * 5:
+            self.compress()
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def compress(self):
+        if not self._buffer:
+            return
+        items = sorted(self.centroids + self._buffer, key=lambda c: c[0])
+        self._buffer = []
+        total = float(sum(w for _, w in items))
+
+        merged = []
+        q0 = 0.0
+        q_limit = self._k_inverse(self._k(q0) + 1)
+        mean, weight = items[0]
+        for next_mean, next_weight in items[1:]:
+            if q0 + (weight + next_weight) / total <= q_limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                merged.append([mean, weight])
+                q0 += weight / total
+                q_limit = self._k_inverse(self._k(min(q0, 1.0)) + 1)
+                mean, weight = next_mean, next_weight
+        merged.append([mean, weight])
+        self.centroids = merged
+
+    def _points(self):
+        # (value, cumulative weight) knots of the piecewise-linear CDF
+        self.compress()
+        points = [(self.min, 0.0)]
+        cumulative = 0.0
+        for mean, weight in self.centroids:
+            points.append((mean, cumulative + weight / 2))
+            cumulative += weight
+        points.append((self.max, cumulative))
+        return points
+
+    def cdf(self, value):
+        """Fraction of samples <= value (0..1)."""
+        if not self.count:
+            return None
+        if value < self.min:
+            return 0.0
+        if value >= self.max:
+            return 1.0
+        points = self._points()
+        for (x0, c0), (x1, c1) in zip(points, points[1:]):
+            if value < x1:
+                if x1 == x0:
+                    return c1 / self.count
+                return (c0 + (c1 - c0) * (value - x0) / (x1 - x0)) / self.count
+        return 1.0
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        target = q * self.count
+        points = self._points()
+        for (x0, c0), (x1, c1) in zip(points, points[1:]):
+            if target <= c1:
+                if c1 == c0:
+                    return x1
+                return x0 + (x1 - x0) * (target - c0) / (c1 - c0)
+        return self.max
+
+    def to_dict(self):
+        self.compress()
+        return {
+            "compression": self.compression,
+            "centroids": [[round(m, 6), w] for m, w in self.centroids],
+            "count": self.count,
+            "min": self.min,
+            "max": self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("compression", 100), data.get("centroids"), data.get("count", 0),
+                   data.get("min"), data.get("max"))
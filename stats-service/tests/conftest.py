@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the app reads its configuration at import: read models from events only,
+# no background sketch scans
+_tmp = tempfile.mkdtemp()
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_tmp}/stats.db",
+    STATS_INGEST="events", SKETCH_INTERVAL="0", FLASK_DEBUG="0")
+
+
+@pytest.fixture(scope="session")
+def stats():
+    import app as stats
+    with stats.app.app_context():
+        stats.db.create_all()
+    return stats
+
+
+@pytest.fixture
+def client(stats):
+    return stats.app.test_client()
@@ -0,0 +1,50 @@
+def workout(event_id, day, reps, weights, user_id=7, exercise_id=1):
+    return {"id": event_id, "type": "workout.created", "user_id": user_id, "source": "test",
+            "payload": {"workout_id": event_id, "date": day, "exercise_id": exercise_id,
+                        "exercise_name": "Bench Press", "sets": len(reps), "reps": reps,
+                        "extra_weight": weights}}
+
+
+def deliver(client, *events):
+    r = client.post("/stats/events", json={"events": list(events)})
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def totals(client, user_id, **params):
+    body = client.get("/stats/summary", query_string=dict(params, user_id=user_id)).get_json()
+    return [body[k] for k in ("total_workouts", "total_sets", "total_reps", "total_tonnage")]
+
+
+def test_summary_and_records_come_from_events(client, stats):
+    # no workout rows at all: everything is served from the read models
+    deliver(client, workout(1, "2026-03-02", [5, 5], [100, 100]),
+            workout(2, "2026-03-01", [3], [50]),
+            workout(3, "2026-03-02", [5], [100]))
+    # back-dated, joins the 150 already logged that day
+    assert deliver(client, workout(4, "2026-03-01", [10], [140]),
+                   workout(1, "2026-03-02", [5, 5], [100, 100]))["duplicates"] == 1
+
+    assert totals(client, 7) == [4, 5, 28, 3050.0]
+    assert totals(client, 7, **{"from": "2026-03-01", "to": "2026-03-01"}) == [2, 2, 13, 1550.0]
+    assert totals(client, 7, to="2026-02-28") == [0, 0, 0, 0.0]
+    assert totals(client, 8) == [0, 0, 0, 0.0]
+    with stats.app.app_context():
+        assert stats.Workout.query.count() == 0
+
+    record, = client.get("/stats/records", query_string={"user_id": 7}).get_json()
+    assert (record["best_tonnage"], record["best_tonnage_date"]) == (1550.0, "2026-03-01")
+
+
+def test_summary_rejects_bad_dates(client):
+    r = client.get("/stats/summary", query_string={"user_id": 7, "from": "March"})
+    assert r.status_code == 400
+
+
+def test_events_are_deduplicated_per_source(client):
+    # each core shard numbers its outbox from 1
+    a, b = dict(workout(1, "2026-04-01", [1], [10], user_id=9), source="a"), \
+        dict(workout(1, "2026-04-02", [1], [20], user_id=9), source="b")
+    assert deliver(client, a, b) == {"applied": 2, "duplicates": 0, "rejected": 0}
+    assert deliver(client, b, a) == {"applied": 0, "duplicates": 2, "rejected": 0}
+    assert totals(client, 9) == [2, 2, 2, 30.0]
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobRunner, SQLJobStore, dedup_key
+
+# stats_job as migrations a47e0c93b1d6 and 6d8a3f1c9e24 leave it
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS stats_job (id VARCHAR(32) PRIMARY KEY, dedup_key VARCHAR(40) NOT NULL, "
+    "type VARCHAR(50) NOT NULL, user_id INTEGER NOT NULL, params TEXT, status VARCHAR(16) NOT NULL, "
+    "result TEXT, error TEXT, created_at FLOAT NOT NULL, started_at FLOAT, finished_at FLOAT, "
+    "expires_at FLOAT NOT NULL, heartbeat_at FLOAT)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uix_stats_job_active_dedup_key ON stats_job (dedup_key) "
+    "WHERE status IN ('queued', 'running')",
+]
+
+
+def store(tmp_path, lease=60):
+    engine = create_engine(f"sqlite:///{tmp_path}/jobs.db",
+                           connect_args={"check_same_thread": False, "timeout": 30})
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+    return SQLJobStore(lambda: engine, lease=lease)
+
+
+def runner(store, release):
+    runner = JobRunner(store)
+    runner.register("slow")(lambda user_id, params: release.wait(10) and {"ok": True})
+    return runner
+
+
+def test_replicas_enqueue_a_job_once(tmp_path):
+    # two replicas with their own runner and lock race on one table
+    release, start = threading.Event(), threading.Barrier(8)
+    replicas = [runner(store(tmp_path), release) for _ in range(2)]
+    results = []
+
+    def submit(replica):
+        start.wait()
+        results.append(replica.submit("slow", 1, {"year": 2026}))
+
+    threads = [threading.Thread(target=submit, args=(replicas[n % 2],)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+
+    assert sum(created for job, created in results) == 1
+    assert len({job["id"] for job, created in results}) == 1
+    job_id = results[0][0]["id"]
+    assert replicas[1].wait(job_id, 10, poll_interval=0.05)["status"] == SUCCEEDED
+
+
+def test_job_of_a_gone_replica_is_abandoned(tmp_path):
+    jobs = store(tmp_path, lease=1)
+    # left running by a replica that stopped heartbeating 5 seconds ago
+    now = time.time()
+    old = {"id": "gone", "dedup_key": dedup_key("slow", 1, {}), "type": "slow", "user_id": 1,
+           "params": {}, "status": RUNNING, "result": None, "error": None,
+           "created_at": now - 10, "started_at": now - 10, "finished_at": None,
+           "expires_at": now + 3600, "heartbeat_at": now - 5}
+    jobs.add(old)
+    assert jobs.find(old["dedup_key"]) is None
+
+    release = threading.Event()
+    other = runner(jobs, release)
+    abandoned = jobs.get(old["id"])
+    assert abandoned["status"] == FAILED and "abandoned" in abandoned["error"]
+    job, created = other.submit("slow", 1)
+    assert created and job["id"] != old["id"] and job["status"] == QUEUED
+    release.set()
+
+
+def test_heartbeats_keep_a_long_job(tmp_path):
+    jobs = store(tmp_path, lease=0.3)
+    release = threading.Event()
+    replica = runner(jobs, release)
+    job, _ = replica.submit("slow", 1)
+    time.sleep(1)
+    assert jobs.find(job["dedup_key"])["id"] == job["id"]
+    release.set()
+    assert replica.wait(job["id"], 10)["status"] == SUCCEEDED